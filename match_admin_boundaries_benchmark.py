@@ -0,0 +1,371 @@
+"""
+Benchmark for loading spreadsheet files into the geocoder.
+
+Writes synthetic CSV spreadsheets with a mix of valid and invalid coordinates and times the legacy load
+(geopandas.read_file, then parsing coordinates cell by cell and building a point for every row) against the
+SpreadsheetData load (pandas C/pyarrow CSV parser, then building points only for the rows with valid coordinates).
+
+With --admin_polygons it also writes synthetic admin boundaries layers as shapefile, GeoParquet and Feather files and
+times loading them with AdminBoundaries, with all columns and with only the admin name column, and writing the
+matches map file as a shapefile and as GeoParquet, then a map of ten matches per polygon twice, the second one
+reusing the centroids of the first.
+
+With --excel_rows it writes synthetic Excel workbooks, split over --excel_sheets sheets, and times the legacy Excel
+load (pandas.read_excel of one sheet, then a full POINT (-1 -1) array and parsing coordinates twice) against the
+SpreadsheetData load with each installed Excel engine, with all columns and with --usecols style column selection,
+and reading all sheets in parallel.
+
+With --check_fuzzy it fuzzy matches misspelled accented names, e.g. 'Sta. Bárbara', against an admin layer of accented
+names with every installed fuzzy scorer and reports the names that did not match their admin polygon. When rapidfuzz is
+installed it also checks that the thefuzz and rapidfuzz scorers return the same choices and scores for accented names,
+with and without accent removal and n-gram blocking.
+
+With --check_coordinates it parses the COORDINATE_CHECK_VALUES decimal and degrees minutes seconds coordinate texts and
+reports the ones not parsed to their expected value.
+
+Usage:
+python match_admin_boundaries_benchmark.py --rows 100000 1000000 5000000 --work_dir /tmp/geocoder_benchmark
+python match_admin_boundaries_benchmark.py --admin_polygons 10000 50000 --work_dir /tmp/geocoder_benchmark
+python match_admin_boundaries_benchmark.py --excel_rows 100000 300000 --excel_sheets 4 --work_dir /tmp/geocoder_benchmark
+python match_admin_boundaries_benchmark.py --check_fuzzy --work_dir /tmp/geocoder_benchmark
+python match_admin_boundaries_benchmark.py --check_coordinates
+"""
+import geopandas
+import io
+import numpy
+import openpyxl
+import pandas
+import shapely
+import sys
+import time
+from contextlib import redirect_stdout
+from glob import glob
+from os import path, makedirs, remove, cpu_count
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from match_admin_boundaries_core import SpreadsheetData, AdminBoundaries, DataUtility, MAP_FILE_FORMATS, \
+    CalamineWorkbook, MatchedData, NgramBlockingIndex, TheFuzzScorer, RapidFuzzScorer, get_fuzzy_scorer, \
+    rapidfuzz_process
+
+DEFAULT_ROWS = (100000, 1000000, 5000000)
+
+# Attribute columns of the synthetic admin layers besides the admin name column, national layers often have dozens
+ADMIN_ATTRIBUTE_COLUMNS = 20
+
+# Misspelled spreadsheet names and the accented admin name each one must fuzzy match at FUZZY_CHECK_CUTOFF
+FUZZY_CHECK_NAMES = [('Santa Bárbara Nort', 'Santa Bárbara Norte'), ('Sta. Bárbara', 'Santa Bárbara Norte'),
+                     ('San Jose de Colinas', 'San José de Colinas'), ('Guinope', 'Güinope'),
+                     ('Concepción del Nort', 'Concepción del Norte'), ('PESPIRE', 'Pespire'),
+                     ('San Antonio d Oriente', 'San Antonio de Oriente')]
+FUZZY_CHECK_CUTOFF = 85
+
+# Spreadsheet coordinate texts and the value DataUtility.parse_coordinates must read, NaN for invalid coordinates
+COORDINATE_CHECK_VALUES = [('14.0833', 14.0833), ('14,0833', 14.0833), ('-87.2', -87.2), ('\u221287.2', -87.2),
+                           ('1230', 1230.0), ('12 30', 12.5), ('abc', numpy.nan), ('14°5\'30"N', 14.091667),
+                           ('N 14 5 30.2', 14.091722), ('-87:12:45', -87.2125), ('87d12m45sW', -87.2125),
+                           ('14 5 30 s', -14.091667), ('12.5N', 12.5), ('87W', -87.0), ('S 14.5', -14.5),
+                           ('N14.5', 14.5), ('W 87.25', -87.25), ('E 87', 87.0), ('14 75', numpy.nan)]
+
+
+def write_csv_spreadsheet(file_path, rows, seed=0):
+    """
+    Write a synthetic CSV spreadsheet of address records.
+    :param file_path: string for the CSV file path to write.
+    :param rows: int for the number of records.
+    :param seed: int for the random number generator seed.
+    :return: None
+    """
+    rng = numpy.random.default_rng(seed)
+    towns = numpy.array(['San José', 'Santa María', 'Tegucigalpa', 'La Ceiba', 'Choluteca', 'Comayagua'])
+    x_coords = rng.uniform(-89.0, -83.0, rows).round(6).astype(str)
+    y_coords = rng.uniform(13.0, 16.0, rows).round(6).astype(str)
+    # About 5% of the records have missing or text coordinates
+    x_coords[rng.random(rows) < 0.03] = ''
+    y_coords[rng.random(rows) < 0.02] = 'n/a'
+    pandas.DataFrame({'Name': numpy.char.add('record ', numpy.arange(rows).astype(str)),
+                      'Town': towns[rng.integers(0, len(towns), rows)],
+                      'x': x_coords,
+                      'y': y_coords}).to_csv(file_path, index=False, encoding='utf-8')
+
+
+def write_excel_spreadsheet(file_path, rows, sheets=1, seed=0):
+    """
+    Write a synthetic Excel workbook of address records with a few extra columns, in openpyxl write-only mode.
+    :param file_path: string for the .xlsx file path to write.
+    :param rows: int for the number of records, split evenly over the sheets.
+    :param sheets: int for the number of sheets, named Region1, Region2 and so on.
+    :param seed: int for the random number generator seed.
+    :return: None
+    """
+    rng = numpy.random.default_rng(seed)
+    towns = numpy.array(['San José', 'Santa María', 'Tegucigalpa', 'La Ceiba', 'Choluteca', 'Comayagua'])
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_num in range(sheets):
+        sheet_rows = rows // sheets + (1 if sheet_num < rows % sheets else 0)
+        worksheet = workbook.create_sheet('Region{0}'.format(sheet_num + 1))
+        worksheet.append(['Name', 'Town', 'x', 'y'] + ['Extra{0}'.format(col) for col in range(6)])
+        x_coords = rng.uniform(-89.0, -83.0, sheet_rows).round(6).tolist()
+        y_coords = rng.uniform(13.0, 16.0, sheet_rows).round(6).tolist()
+        town_names = towns[rng.integers(0, len(towns), sheet_rows)].tolist()
+        extras = rng.integers(0, 1000000, (sheet_rows, 6)).tolist()
+        for row in range(sheet_rows):
+            # About 5% of the records have text coordinates
+            worksheet.append(['record {0}'.format(row), town_names[row], x_coords[row] if row % 20 else 'n/a',
+                              y_coords[row]] + extras[row])
+    workbook.save(file_path)
+
+
+def legacy_excel_load(file_path):
+    """Load an Excel spreadsheet the way the geocoder did before SpreadsheetData read Excel files with
+    DataUtility.read_excel."""
+    data_frame = pandas.read_excel(file_path)
+    temp_array = numpy.full(len(data_frame), fill_value=-1.0)
+    data_frame = geopandas.GeoDataFrame(data_frame, geometry=geopandas.points_from_xy(x=temp_array, y=temp_array))
+    for _ in range(2):
+        # Coordinates were parsed by to_geodataframe and again by prepare_columns
+        x_coords = DataUtility.parse_coordinates(data_frame['x'])
+        y_coords = DataUtility.parse_coordinates(data_frame['y'])
+        data_frame['geometry'] = DataUtility.points_from_valid_xy(x_coords, y_coords)
+    return data_frame
+
+
+def benchmark_excel(work_dir, rows, sheets=1, keep_files=False, skip_legacy=False):
+    """Print the load times of an Excel workbook with the legacy load and each installed Excel engine."""
+    file_path = path.join(work_dir, 'benchmark_{0}_{1}sheets.xlsx'.format(rows, sheets))
+    write_excel_spreadsheet(file_path, rows, sheets)
+    engines = ['openpyxl'] + (['calamine'] if CalamineWorkbook is not None else [])
+    runs = [] if skip_legacy else [('legacy', 'first sheet', legacy_excel_load)]
+    for engine in engines:
+        runs.append((engine, 'first sheet', lambda file_path, engine=engine: SpreadsheetData(
+            file_path, excel_engine=engine)))
+        runs.append((engine, 'usecols', lambda file_path, engine=engine: SpreadsheetData(
+            file_path, usecols=['name', 'town', 'x', 'y'], excel_engine=engine)))
+        if sheets > 1:
+            runs.append((engine, 'all sheets', lambda file_path, engine=engine: SpreadsheetData(
+                file_path, sheets='all', excel_engine=engine)))
+            runs.append((engine, 'all, parallel', lambda file_path, engine=engine: SpreadsheetData(
+                file_path, sheets='all', excel_engine=engine, workers=cpu_count())))
+    for engine, step, load_function in runs:
+        with redirect_stdout(io.StringIO()):
+            seconds, loaded_rows = time_load(load_function, file_path)
+        print('{0:>10} {1:>10} {2:>14} {3:>10} {4:>12.2f}'.format(rows, engine, step, loaded_rows, seconds))
+    if not keep_files:
+        remove(file_path)
+
+
+def legacy_load(file_path):
+    """Load a CSV spreadsheet the way the geocoder did before SpreadsheetData read CSV files with Pandas."""
+    try:
+        data_frame = geopandas.read_file(file_path, engine='python', encoding='utf-8')
+    except ValueError:
+        # The python engine is no longer available in current GeoPandas versions
+        data_frame = geopandas.read_file(file_path, encoding='utf-8')
+    temp_x_coords = data_frame['x'].astype(str)
+    temp_y_coords = data_frame['y'].astype(str)
+    temp_x_coords = temp_x_coords.apply(lambda x: float(x) if DataUtility.is_float_(x) else -1.0)
+    temp_y_coords = temp_y_coords.apply(lambda y: float(y) if DataUtility.is_float_(y) else -1.0)
+    data_frame['geometry'] = geopandas.points_from_xy(x=temp_x_coords, y=temp_y_coords)
+    return data_frame
+
+
+def write_admin_layers(base_path, polygons, seed=0):
+    """
+    Write a synthetic admin boundaries layer as a shapefile, a GeoParquet file and a Feather file.
+    :param base_path: string for the file path without extension.
+    :param polygons: int for the number of admin polygons, each with a few hundred vertices.
+    :param seed: int for the random number generator seed.
+    :return: dictionary of the file format names and file paths.
+    """
+    rng = numpy.random.default_rng(seed)
+    side = int(numpy.ceil(numpy.sqrt(polygons)))
+    cells = numpy.arange(polygons)
+    centers = shapely.points(-89.0 + 6.0 * (cells % side + 0.5) / side, 13.0 + 3.0 * (cells // side + 0.5) / side)
+    data = {'ADM3_ES': numpy.char.add('Municipio ', cells.astype(str))}
+    for col in range(ADMIN_ATTRIBUTE_COLUMNS):
+        data['ATTR_{0}'.format(col)] = rng.integers(0, 1000000, polygons).astype(str)
+    layer = geopandas.GeoDataFrame(data, geometry=shapely.buffer(centers, 2.0 / side, quad_segs=64), crs='EPSG:4326')
+    file_paths = {'shapefile': base_path + '.shp', 'geoparquet': base_path + '.parquet',
+                  'feather': base_path + '.feather'}
+    layer.to_file(file_paths['shapefile'])
+    layer.to_parquet(file_paths['geoparquet'])
+    layer.to_feather(file_paths['feather'])
+    return file_paths
+
+
+def benchmark_admin_layers(work_dir, polygons, keep_files=False):
+    """Print the load times of the admin layer formats and the write times of the matches map file formats."""
+    base_path = path.join(work_dir, 'benchmark_admin_{0}'.format(polygons))
+    file_paths = write_admin_layers(base_path, polygons)
+    for file_format, file_path in file_paths.items():
+        for columns in (None, ['ADM3_ES']):
+            start = time.perf_counter()
+            adm_boundaries = AdminBoundaries(file_path, columns)
+            elapsed = time.perf_counter() - start
+            print('{0:>10} {1:>12} {2:>14} {3:>12.3f}'.format(polygons, file_format,
+                                                             'all columns' if columns is None else 'name only',
+                                                             elapsed))
+
+    DataUtility.set_output_path(work_dir)
+    matched_records_gdf = AdminBoundaries(file_paths['geoparquet']).dataframe
+    for map_format in ('shapefile', 'geoparquet'):
+        start = time.perf_counter()
+        DataUtility.create_admin_matches_shapefile(matched_records_gdf.copy(), '32616', 'ADM3_ES',
+                                                   'benchmark_matches_{0}{1}'.format(polygons,
+                                                                                     MAP_FILE_FORMATS[map_format]),
+                                                   map_format)
+        print('{0:>10} {1:>12} {2:>14} {3:>12.3f}'.format(polygons, map_format, 'write matches',
+                                                         time.perf_counter() - start))
+    # Ten matches per admin polygon, the centroids are computed by the first map and reused by the second
+    adm_boundaries = AdminBoundaries(file_paths['geoparquet'])
+    admin_positions = numpy.repeat(numpy.arange(polygons), 10)
+    for label in ('map x10 cold', 'map x10 cached'):
+        start = time.perf_counter()
+        DataUtility.create_matches_map(adm_boundaries, admin_positions, '32616', 'ADM3_ES',
+                                       'benchmark_matches_{0}.parquet'.format(polygons), 'geoparquet')
+        print('{0:>10} {1:>12} {2:>14} {3:>12.3f}'.format(polygons, 'geoparquet', label, time.perf_counter() - start))
+    if not keep_files:
+        for file_path in glob(base_path + '.*') + glob(path.join(work_dir, 'benchmark_matches_{0}.*'.format(polygons))):
+            remove(file_path)
+
+
+def check_fuzzy_accents(work_dir, keep_files=False):
+    """
+    Fuzzy match the FUZZY_CHECK_NAMES spreadsheet against an admin layer of their accented admin names with every
+    installed fuzzy scorer.
+    :return: boolean, True when every name matched its admin name with every scorer.
+    """
+    admin_names = sorted(set(admin_name for _, admin_name in FUZZY_CHECK_NAMES))
+    admin_path = path.join(work_dir, 'fuzzy_check_admin.shp')
+    sheet_path = path.join(work_dir, 'fuzzy_check.csv')
+    geopandas.GeoDataFrame({'ADM3_ES': admin_names}, crs='EPSG:4326',
+                           geometry=[shapely.box(i, 0, i + 1, 1) for i in range(len(admin_names))]
+                           ).to_file(admin_path, encoding='utf-8')
+    pandas.DataFrame({'name': [name for name, _ in FUZZY_CHECK_NAMES]}).to_csv(sheet_path, index=False,
+                                                                                encoding='utf-8')
+    scorer_names = ['thefuzz'] + (['rapidfuzz'] if rapidfuzz_process is not None else [])
+    passed = True
+    for scorer_name in scorer_names:
+        with redirect_stdout(io.StringIO()):
+            matched_data = MatchedData(SpreadsheetData(sheet_path), AdminBoundaries(admin_path),
+                                       fuzzy_scorer=get_fuzzy_scorer(scorer_name))
+            matched_data.admin_choice = 'ADM3_ES'
+            matched_data.run_strict_match()
+            matched_data.run_fuzzy_match(FUZZY_CHECK_CUTOFF)
+        results = matched_data.match_results
+        matches = dict(zip(results.row_positions.tolist(), results.admin_positions.tolist()))
+        missed = [name for i, (name, admin_name) in enumerate(FUZZY_CHECK_NAMES)
+                  if matches.get(i, -1) < 0 or admin_names[matches[i]] != admin_name]
+        passed = passed and len(missed) == 0
+        print('{0:>10} {1:>8} {2}'.format(scorer_name, 'ok' if len(missed) == 0 else 'FAILED', ', '.join(missed)))
+    if not keep_files:
+        for file_path in glob(path.join(work_dir, 'fuzzy_check*')):
+            remove(file_path)
+    if rapidfuzz_process is not None:
+        passed = check_fuzzy_scorer_parity() and passed
+    return passed
+
+
+def check_fuzzy_scorer_parity():
+    """
+    Score the FUZZY_CHECK_NAMES against their accented admin names with TheFuzzScorer and RapidFuzzScorer, the admin
+    names normalized with and without accent removal, every choice scored and with n-gram blocking.
+    :return: boolean, True when both scorers returned the same choices and scores in every case.
+    """
+    admin_names = sorted(set(admin_name for _, admin_name in FUZZY_CHECK_NAMES))
+    passed = True
+    for remove_accents in (True, False):
+        blocking_index = NgramBlockingIndex([DataUtility.normalize_text(name, remove_accents) for name in admin_names])
+        queries = [DataUtility.fuzzy_process(DataUtility.normalize_text(name, remove_accents))
+                   for name, _ in FUZZY_CHECK_NAMES]
+        for top_k in (None, 2):
+            thefuzz_ids, thefuzz_scores = TheFuzzScorer().best_matches(queries, blocking_index, 0, top_k)
+            rapidfuzz_ids, rapidfuzz_scores = RapidFuzzScorer().best_matches(queries, blocking_index, 0, top_k)
+            same = numpy.array_equal(thefuzz_ids, rapidfuzz_ids) and numpy.array_equal(thefuzz_scores, rapidfuzz_scores)
+            passed = passed and same
+            print('{0:>10} {1:>8} remove_accents={2} top_k={3}'.format('parity', 'ok' if same else 'FAILED',
+                                                                      remove_accents, top_k))
+    return passed
+
+
+def check_coordinates():
+    """
+    Parse the COORDINATE_CHECK_VALUES texts with DataUtility.parse_coordinates.
+    :return: boolean, True when every text was parsed to its expected value.
+    """
+    texts, expected = zip(*COORDINATE_CHECK_VALUES)
+    coords = DataUtility.parse_coordinates(pandas.Series(texts, dtype=object))
+    wrong = ~numpy.isclose(coords, numpy.array(expected), atol=1e-6, equal_nan=True)
+    for text, value, coord in zip(numpy.array(texts)[wrong], numpy.array(expected)[wrong], coords[wrong]):
+        print('{0:>14} expected {1}, parsed {2}'.format(text, value, coord))
+    print('{0} of {1} coordinate texts parsed to their expected value.'.format(len(texts) - wrong.sum(), len(texts)))
+    return not wrong.any()
+
+
+def time_load(load_function, file_path):
+    """Return the seconds taken by load_function(file_path) and the number of records it loaded."""
+    start = time.perf_counter()
+    data = load_function(file_path)
+    elapsed = time.perf_counter() - start
+    data_frame = data.data_frame if isinstance(data, SpreadsheetData) else data
+    return elapsed, len(data_frame)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__, formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+',
+                        help='Number of spreadsheet records for each benchmark run, default {0} when no '
+                             '--admin_polygons are given.'.format(' '.join(str(rows) for rows in DEFAULT_ROWS)))
+    parser.add_argument('--admin_polygons', type=int, nargs='+',
+                        help='Number of admin polygons for each admin layer file format benchmark run.')
+    parser.add_argument('--excel_rows', type=int, nargs='+',
+                        help='Number of spreadsheet records for each Excel engine benchmark run.')
+    parser.add_argument('--excel_sheets', type=int, default=1,
+                        help='Number of sheets the Excel records are split over, default 1.')
+    parser.add_argument('--check_fuzzy', action='store_true',
+                        help='Check that misspelled accented names fuzzy match their accented admin names.')
+    parser.add_argument('--check_coordinates', action='store_true',
+                        help='Check that decimal and degrees minutes seconds coordinate texts parse to their values.')
+    parser.add_argument('--work_dir', default='geocoder_benchmark',
+                        help='Directory for the synthetic spreadsheet files.')
+    parser.add_argument('--skip_legacy', action='store_true',
+                        help='Only time the SpreadsheetData load, the legacy load is slow on millions of rows.')
+    parser.add_argument('--keep_files', action='store_true', help='Keep the synthetic spreadsheet files.')
+    args = parser.parse_args()
+
+    makedirs(args.work_dir, exist_ok=True)
+    if args.rows is None and args.admin_polygons is None and args.excel_rows is None and not args.check_fuzzy \
+            and not args.check_coordinates:
+        args.rows = list(DEFAULT_ROWS)
+    if args.check_coordinates and not check_coordinates():
+        sys.exit(1)
+    if args.check_fuzzy:
+        print('{0:>10} {1:>8} {2}'.format('scorer', 'result', 'unmatched names'))
+        if not check_fuzzy_accents(args.work_dir, args.keep_files):
+            sys.exit(1)
+    if args.admin_polygons:
+        print('{0:>10} {1:>12} {2:>14} {3:>12}'.format('polygons', 'format', 'step', 'seconds'))
+        for polygons in args.admin_polygons:
+            benchmark_admin_layers(args.work_dir, polygons, args.keep_files)
+    if args.excel_rows:
+        print('{0:>10} {1:>10} {2:>14} {3:>10} {4:>12}'.format('rows', 'engine', 'sheets', 'loaded', 'seconds'))
+        for rows in args.excel_rows:
+            benchmark_excel(args.work_dir, rows, args.excel_sheets, args.keep_files, args.skip_legacy)
+    if not args.rows:
+        return
+
+    print('{0:>10} {1:>12} {2:>12} {3:>9}'.format('rows', 'legacy (s)', 'current (s)', 'speedup'))
+    for rows in args.rows:
+        file_path = path.join(args.work_dir, 'benchmark_{0}.csv'.format(rows))
+        write_csv_spreadsheet(file_path, rows)
+        current_seconds, current_rows = time_load(SpreadsheetData, file_path)
+        if args.skip_legacy:
+            print('{0:>10} {1:>12} {2:>12.2f} {3:>9}'.format(current_rows, '-', current_seconds, '-'))
+        else:
+            legacy_seconds, _ = time_load(legacy_load, file_path)
+            print('{0:>10} {1:>12.2f} {2:>12.2f} {3:>8.1f}x'.format(current_rows, legacy_seconds, current_seconds,
+                                                                   legacy_seconds / current_seconds))
+        if not args.keep_files:
+            remove(file_path)
+
+
+if __name__ == "__main__":
+    main()
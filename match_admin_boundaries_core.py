@@ -2,20 +2,119 @@ import geopandas
 import pandas
 import numpy
 import platform
-from os import path, mkdir
+from os import path, makedirs, cpu_count, replace, getpid
 from unidecode import unidecode
 import datetime
+import hashlib
+import json
 import re
+import struct
+import sqlite3
+import time
+import glob
+import multiprocessing
 from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from pandas.io.parsers import TextParser
 from pathvalidate import sanitize_filepath
-from thefuzz import fuzz, process
+from thefuzz import fuzz, process, utils
 from bs4 import UnicodeDammit
+import shapely
+from shapely.geometry import Point
+
+try:
+    # Optional, fast multi-threaded CSV parsing, see DataUtility.read_csv, compiled admin layers, see CompiledLayer,
+    # and GeoParquet/Feather admin layers and matches files
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    # Optional, reads the schema and single columns of GDAL admin layers without the geometry, see LazyLayer
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
+try:
+    # Optional, Rust Excel reader, many times faster than openpyxl on large workbooks, see DataUtility.read_excel
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+try:
+    # Optional, read-only streaming of .xlsx sheets when python-calamine is not installed, see DataUtility.read_excel
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+try:
+    # Optional, streams the Excel report in constant memory, see Report.write_excel
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+try:
+    # Optional, batch fuzzy scoring on all CPU cores, see RapidFuzzScorer
+    from rapidfuzz import process as rapidfuzz_process, fuzz as rapidfuzz_fuzz
+except ImportError:
+    rapidfuzz_process = None
+    rapidfuzz_fuzz = None
 
 '''This module provides the core logic, i.e. the Model, for the GUI & console versions of the match_admin_boundaries 
 geocoder application. '''
 
 
+# Geometry of spreadsheet records without valid coordinates, invalid coordinates are flagged as x = -1.0 and y = -1.0
+INVALID_POINT = Point(-1.0, -1.0)
+
+# Degrees minutes seconds coordinates, e.g. 14°5'30.2"N, N 14 5 30.2, -87:12:45, 87d12m45sW, 12.5N or S 14.5. A bare
+# s unit is only read as seconds before a hemisphere letter, so 14 5 30 s is in the south hemisphere
+DMS_COORDINATE_PATTERN = (r"^\s*(?P<leading_hemisphere>[NSEWnsew])?\s*"
+                          r"(?P<degrees>[+-]?\d+(?:\.\d+)?)\s*(?:°|º|deg|d|:|\s|(?=[NSEWnsew]\s*$)|(?=\s*$))\s*"
+                          r"(?:(?P<minutes>\d+(?:\.\d+)?)\s*(?:'|′|min|m|:|\s)?\s*)?"
+                          r"(?:(?P<seconds>\d+(?:\.\d+)?)\s*(?:\"|″|''|sec|s(?=\s*[NSEWnsew]))?\s*)?"
+                          r"(?P<trailing_hemisphere>[NSEWnsew])?\s*$")
+
+# Encodings accepted as Western European encodings, for unidecode to process
+WESTERN_EUROPE_ENCODINGS = ('ascii', 'latin-1', 'utf-8', 'iso-8859-15', 'iso-8859-1')
+
+# Streaming CSV mode, number of rows matched per chunk and number of bytes used to detect the file encoding
+DEFAULT_CSV_CHUNKSIZE = 100000
+ENCODING_SAMPLE_BYTES = 1 << 20
+
+# Excel spreadsheet readers, see DataUtility.read_excel. None picks calamine when installed, openpyxl otherwise
+EXCEL_ENGINES = ('calamine', 'openpyxl')
+
+# Compiled admin layer files, see CompiledLayer. Bump the format version whenever the sections change
+GEOIDX_EXTENSION = '.geoidx'
+GEOIDX_MAGIC = b'GEOIDX\x00\x00'
+GEOIDX_FORMAT_VERSION = 1
+
+# Admin boundaries layers read with pyarrow instead of GDAL, see AdminBoundaries.read_layer
+GEOPARQUET_EXTENSIONS = ('.parquet', '.geoparquet')
+FEATHER_EXTENSIONS = ('.feather', '.arrow')
+
+# Geometries decoded at a time to apply a --bbox to a GeoParquet or Feather layer without a bbox column, see LazyLayer
+LAZY_BBOX_BATCH_ROWS = 65536
+
+# File formats of the matches map file, see DataUtility.create_admin_matches_shapefile
+MAP_FILE_FORMATS = OrderedDict([('shapefile', '.shp'), ('geoparquet', '.parquet')])
+
+# File formats of the match report, see Report.save_report. CSV and Parquet write much faster than Excel on large runs
+REPORT_FORMATS = OrderedDict([('excel', '.xlsx'), ('csv', '.csv'), ('parquet', '.parquet')])
+
+# Rows of an Excel worksheet, header row included, larger Excel reports are split over several worksheets
+EXCEL_MAX_ROWS = 1048576
+
+# Rows converted to cell values at a time while streaming the Excel report, bounds the memory used
+EXCEL_WRITE_BLOCK_ROWS = 50000
+
+
 class PromptMessages(object):
     # This class stores prompt messages for reuse by console and GUI versions of the app
     # Class variable can be changed without creating instance
@@ -55,20 +154,17 @@ class DataUtility:
 
     @staticmethod
     def filter_row(dataframe, col_name, text_filter, spreadsheet_data):
-        # returns a numpy ndarray
+        """Return the first admin boundaries row, as a numpy ndarray, whose col_name value matches text_filter.
+        The dataframe is only read, never modified. Matching code uses AdminNameIndex instead of this full scan."""
         # Only apply unidecode on Western European/Latin type languages
-        if spreadsheet_data.encoding in spreadsheet_data.western_europe_encodings:
-            dataframe[col_name] = DataUtility.remove_accented_char(dataframe[col_name])
-            dataframe[col_name] = dataframe[col_name].apply(lambda x: x.lower().strip() if isinstance(x, str) else x)
-            filter = dataframe[col_name] == unidecode(text_filter).lower().strip()
-        else:
-            dataframe[col_name] = dataframe[col_name].apply(lambda x: x.lower().strip() if isinstance(x, str) else x)
-            filter = dataframe[col_name] == text_filter.lower().strip()
+        remove_accents = spreadsheet_data.encoding in spreadsheet_data.western_europe_encodings
+        normalized = dataframe[col_name].map(
+            lambda x: DataUtility.normalize_text(x, remove_accents) if isinstance(x, str) else x)
+        positions = numpy.flatnonzero((normalized == DataUtility.normalize_text(text_filter, remove_accents)).to_numpy())
 
-        # Yes Correct June 3 2021
-        if len(dataframe[filter]) > 0:
-            print('Filtered row with first column id of {0}'.format(dataframe[filter].values[0][0]))
-            return dataframe[filter].values[0]
+        if len(positions) > 0:
+            print('Filtered row with first column id of {0}'.format(dataframe.iloc[positions[0], 0]))
+            return dataframe.iloc[positions[0]].to_numpy()
 
     @staticmethod
     def is_string_match(cell_text, column_series, spreadsheet_data):
@@ -91,6 +187,53 @@ class DataUtility:
         else:
             return False
 
+    @staticmethod
+    def normalize_text(text, remove_accents=True):
+        """Normalize a single name the same way on both sides of a match: strip white space, remove accents on
+        Western European/Latin text and lower case.
+        :param text: string to normalize.
+        :param remove_accents: boolean, apply unidecode when True.
+        :return: normalized string.
+        """
+        text = str(text).strip()
+        if remove_accents:
+            text = unidecode(text)
+        return text.lower().strip()
+
+    @staticmethod
+    def fuzzy_process(text):
+        """Process text exactly like thefuzz's WRatio does before scoring: keep letters and numbers, lower case,
+        strip white space and drop Latin-1 accented characters."""
+        return utils.full_process(utils.full_process(str(text)), force_ascii=True)
+
+    @staticmethod
+    def first_valid_column(valid_matrix, from_right_col=False):
+        """Reduce a (rows x columns) boolean hit matrix to the first valid column of each row.
+        :param valid_matrix: 2D numpy boolean array.
+        :param from_right_col: boolean, search from the rightmost column when True.
+        :return: numpy array holding the column position of the first hit of each row, or -1 for rows without hits.
+        """
+        if valid_matrix.shape[1] == 0:
+            return numpy.full(valid_matrix.shape[0], -1, dtype=numpy.int64)
+        if from_right_col:
+            first = valid_matrix.shape[1] - 1 - valid_matrix[:, ::-1].argmax(axis=1)
+        else:
+            first = valid_matrix.argmax(axis=1)
+        return numpy.where(valid_matrix.any(axis=1), first, -1)
+
+    @staticmethod
+    def broadcast_codes(value_codes, results, fill_value=-1):
+        """Broadcast per distinct value results back to cells.
+        :param value_codes: numpy array of distinct value codes, -1 for empty cells.
+        :param results: numpy array holding one result per distinct value.
+        :param fill_value: result of the empty cells.
+        :return: numpy array shaped like value_codes.
+        """
+        results = numpy.asarray(results)
+        if len(results) == 0:
+            return numpy.full(value_codes.shape, fill_value, dtype=results.dtype)
+        return numpy.where(value_codes >= 0, results[numpy.maximum(value_codes, 0)], fill_value)
+
     @staticmethod
     def remove_accented_char(col_series):
         """Remove accented characters like the accented í in Santa María, for better string matches
@@ -125,40 +268,341 @@ class DataUtility:
         return datetime.datetime.now().strftime('%Y_%b_%d_%Hhr_%Mmin_%Ssec')
 
     @staticmethod
-    def create_admin_matches_shapefile(matched_records_gdf, projected_map_input, admin_choice):
+    def create_admin_matches_shapefile(matched_records_gdf, projected_map_input, admin_choice, shapefile_name=None,
+                                       file_format='shapefile'):
+        # shapefile_name defaults to a time stamped file name in the output folder
+        # file_format is one of MAP_FILE_FORMATS, GeoParquet keeps full column names and writes much faster
+        if projected_map_input is not None:
+            if file_format == 'geoparquet' and pyarrow is None:
+                return 'Writing GeoParquet files needs pyarrow, install it with: pip install pyarrow'
+            # Rows matched to the same admin polygon share its geometry object, each polygon is reprojected once
+            geometry = matched_records_gdf.geometry.array
+            geometry_ids = numpy.fromiter(map(id, numpy.asarray(geometry, dtype=object)), dtype=numpy.int64,
+                                          count=len(geometry))
+            first_rows, inverse = numpy.unique(geometry_ids, return_index=True, return_inverse=True)[1:]
+            centroid_points = geopandas.GeoSeries(geometry[first_rows]).to_crs(
+                epsg=projected_map_input).centroid.array  # works July 4 to avoid warning  Use 'GeoSeries.to_crs()'
+            matched_records_gdf.geometry = centroid_points[inverse.ravel()]
+            return DataUtility.write_matches_map(matched_records_gdf, admin_choice, shapefile_name, file_format)
+
+    @staticmethod
+    def create_matches_map(adm_boundaries, admin_positions, projected_map_input, admin_choice, shapefile_name=None,
+                           file_format='shapefile', aggregate=False, centroid_cache=None):
+        """
+        Create the matches map file from the admin boundaries row positions of the matches, reprojecting and computing
+        the centroid of each matched admin polygon once, see AdminBoundaries.centroids.
+        :param adm_boundaries: AdminBoundaries the matches were made against.
+        :param admin_positions: numpy array of the admin boundaries row position of each match.
+        :param projected_map_input: string EPSG code of the map, None creates no map.
+        :param admin_choice: string for the matched admin boundaries column, used in the default file name.
+        :param shapefile_name: string for the file name in the output folder, None uses a time stamped name.
+        :param file_format: string, one of MAP_FILE_FORMATS.
+        :param aggregate: boolean, one feature per matched admin polygon with a Matches count column.
+        :param centroid_cache: optional CentroidCache keeping the centroids across runs.
+        :return: message string.
+        """
         if projected_map_input is not None:
-            matched_records_gdf.geometry = matched_records_gdf.geometry.to_crs(
-                epsg=projected_map_input)  # works July 4 to avoid warning  Use 'GeoSeries.to_crs()'
-            matched_records_gdf.geometry = matched_records_gdf.centroid
-            shapefile_name = 'matches_{0}_{1}.shp'.format(
-                admin_choice, DataUtility.get_file_time_stamp())
-            shapefile_path = path.join(DataUtility.get_output_path(), shapefile_name)
-            matched_records_gdf.to_file(driver='ESRI Shapefile', filename=shapefile_path, index=False)
-            return 'Your generated admin shapefile is located at:\n{0}'.format(shapefile_path)
+            if file_format == 'geoparquet' and pyarrow is None:
+                return 'Writing GeoParquet files needs pyarrow, install it with: pip install pyarrow'
+            map_df = adm_boundaries.matches_map_dataframe(admin_positions, projected_map_input, aggregate,
+                                                          centroid_cache)
+            return DataUtility.write_matches_map(map_df, admin_choice, shapefile_name, file_format)
+
+    @staticmethod
+    def write_matches_map(matched_records_gdf, admin_choice, shapefile_name=None, file_format='shapefile'):
+        """Write the matches map GeoDataFrame to the output folder, returns the message string."""
+        if shapefile_name is None:
+            shapefile_name = 'matches_{0}_{1}{2}'.format(
+                admin_choice, DataUtility.get_file_time_stamp(), MAP_FILE_FORMATS[file_format])
+        shapefile_path = path.join(DataUtility.get_output_path(), shapefile_name)
+        if file_format == 'geoparquet':
+            matched_records_gdf.to_parquet(shapefile_path, index=False)
+            return 'Your generated admin GeoParquet file is located at:\n{0}'.format(shapefile_path)
+        matched_records_gdf.to_file(driver='ESRI Shapefile', filename=shapefile_path, index=False)
+        return 'Your generated admin shapefile is located at:\n{0}'.format(shapefile_path)
+
+    # Output folder set with set_output_path, e.g. from the --out-dir argument, None uses the default folder
+    output_path = None
+
+    @staticmethod
+    def set_output_path(dir_path):
+        """Write reports and shapefiles to dir_path instead of the default c:\\gis_output or /gis_output folder."""
+        DataUtility.output_path = dir_path
 
     @staticmethod
     def get_output_path():
-        if platform.system() == 'Windows':
+        if DataUtility.output_path is not None:
+            dir_path = DataUtility.output_path
+        elif platform.system() == 'Windows':
             dir_path = 'c:\\gis_output\\'
         elif platform.system() == 'Darwin' or platform.system() == 'Linux':
             dir_path = '/gis_output/'
         if path.isdir(dir_path):
             return dir_path
         else:
-            mkdir(dir_path)
+            makedirs(dir_path)
             return dir_path
 
     @staticmethod
-    def get_file_encoding(file_path):
+    def get_file_encoding(file_path, sample_size=None):
         """
         Detect the encoding of the given byte string from opened file, returns a string.
         :param file_path: file path to open
         :type file_path:  string
+        :param sample_size: Integer, only read this many bytes from the start of the file, None reads the whole file.
         """
         with open(file_path, 'rb') as f:
-            content = f.read()
+            content = f.read() if sample_size is None else f.read(sample_size)
+            if sample_size is not None and len(content) == sample_size:
+                # Cut the sample at the last line break so it does not end in the middle of a multi-byte character
+                content = content[:content.rfind(b'\n') + 1] or content
             return UnicodeDammit(content).original_encoding
 
+    @staticmethod
+    def read_csv(file_path, encoding=None, engine=None, **kwargs):
+        """
+        Read a CSV spreadsheet into a Pandas dataframe with a fast parser.
+        :param file_path: string for the CSV file path.
+        :param encoding: string for the detected encoding, None reads the file as ISO-8859-1.
+        :param engine: string for the Pandas CSV engine, None uses pyarrow when installed and the C engine otherwise.
+        :param kwargs: other Pandas read_csv arguments, e.g. chunksize, which only the C engine supports.
+        :return: Pandas dataframe, or an iterator of dataframes when chunksize is given.
+        """
+        # ASCII text is read as UTF-8 in case accented characters appear after the part used to detect the encoding
+        read_encoding = 'iso-8859-1' if encoding is None else 'utf-8' if encoding == 'ascii' else encoding
+        if engine is None:
+            engine = 'c' if 'chunksize' in kwargs or pyarrow is None else 'pyarrow'
+        try:
+            data_frame = pandas.read_csv(file_path, engine=engine, encoding=read_encoding,
+                                         encoding_errors='backslashreplace', **kwargs)
+        except (ValueError, UnicodeDecodeError) as e:
+            if engine == 'c':
+                raise
+            print('{0} while reading {1} with the {2} engine, reading it again with the C engine.'.format(
+                e, file_path, engine))
+            return pandas.read_csv(file_path, engine='c', encoding=read_encoding, encoding_errors='backslashreplace',
+                                   **kwargs)
+        if engine == 'pyarrow':
+            # pyarrow reads ISO dates and timestamps as dates while the C engine keeps their text, these columns are
+            # read again as text so a file gives the same dataframe whichever engine reads it
+            date_cols = [col for col in data_frame.columns
+                         if pandas.api.types.is_datetime64_any_dtype(data_frame[col].dtype) or
+                         (data_frame[col].dtype == object and
+                          pandas.api.types.infer_dtype(data_frame[col], skipna=True) == 'date')]
+            if date_cols:
+                text_df = pandas.read_csv(file_path, engine='c', encoding=read_encoding,
+                                          encoding_errors='backslashreplace', **dict(kwargs, usecols=date_cols))
+                data_frame[date_cols] = text_df[date_cols]
+        return data_frame
+
+    @staticmethod
+    def read_excel(file_path, engine=None, usecols=None, sheets=None, workers=None):
+        """
+        Read an Excel spreadsheet into a Pandas dataframe with a fast reader. Cell values are read straight into rows
+        by calamine or by openpyxl in read-only mode and parsed by the Pandas text parser, the way pandas.read_excel
+        parses them, without its per cell conversions.
+        :param file_path: string for the .xlsx or .xls file path.
+        :param engine: string, one of EXCEL_ENGINES, None uses calamine when installed and openpyxl otherwise.
+        :param usecols: optional list of column names to read, matched ignoring case and surrounding white space.
+        :param sheets: None reads the first sheet, 'all' or a list of sheet names reads those sheets one after the
+        other into one dataframe.
+        :param workers: Integer, read this many sheets at a time on worker processes when above 1.
+        :return: Pandas dataframe.
+        """
+        if engine is None:
+            engine = 'calamine' if CalamineWorkbook is not None else 'openpyxl'
+        if engine == 'calamine' and CalamineWorkbook is None:
+            raise ImportError('The calamine Excel reader needs python-calamine, install it with: '
+                              'pip install python-calamine')
+        if workers is not None and workers > 1 and sheets is not None:
+            sheets = DataUtility.select_excel_sheets(file_path, DataUtility.excel_sheet_names(file_path, engine),
+                                                     sheets)
+        if workers is not None and workers > 1 and sheets is not None and len(sheets) > 1:
+            # One sheet per task, each worker opens the workbook itself
+            context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() \
+                else None
+            with ProcessPoolExecutor(min(workers, len(sheets)), mp_context=context) as executor:
+                frames = [frame for sheet_frames in executor.map(
+                    DataUtility.read_excel_sheets, [file_path] * len(sheets), [[sheet] for sheet in sheets],
+                    [engine] * len(sheets), [usecols] * len(sheets)) for frame in sheet_frames]
+        else:
+            frames = DataUtility.read_excel_sheets(file_path, sheets, engine, usecols)
+        return frames[0] if len(frames) == 1 else pandas.concat(frames, ignore_index=True)
+
+    @staticmethod
+    def excel_sheet_names(file_path, engine):
+        """Return the list of sheet names of an Excel spreadsheet."""
+        if engine == 'calamine':
+            return CalamineWorkbook.from_path(file_path).sheet_names
+        if file_path.lower().endswith('.xls') or openpyxl is None:
+            return list(pandas.ExcelFile(file_path).sheet_names)
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            return workbook.sheetnames
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def select_excel_sheets(file_path, sheet_names, sheets):
+        """Return the list of sheet names to read, see read_excel, raises ValueError for sheets the file does not
+        have."""
+        if sheets is None:
+            return sheet_names[:1]
+        if sheets == 'all':
+            return sheet_names
+        missing = [sheet for sheet in sheets if sheet not in sheet_names]
+        if missing:
+            raise ValueError('Sheets {0} not found in {1}, its sheets are: {2}'.format(
+                ', '.join(missing), file_path, ', '.join(sheet_names)))
+        return list(sheets)
+
+    @staticmethod
+    def read_excel_sheets(file_path, sheets, engine, usecols=None):
+        """
+        Read sheets of an Excel spreadsheet, opening the workbook once, see read_excel.
+        :param file_path: string for the .xlsx or .xls file path.
+        :param sheets: None for the first sheet, 'all' or a list of sheet names.
+        :param engine: string, one of EXCEL_ENGINES.
+        :param usecols: optional list of column names to read.
+        :return: list of Pandas dataframes, one per sheet.
+        """
+        usecols = DataUtility.usecols_filter(usecols)
+        if engine == 'calamine':
+            workbook = CalamineWorkbook.from_path(file_path)
+            return [DataUtility.excel_rows_dataframe(
+                workbook.get_sheet_by_name(sheet).to_python(skip_empty_area=False), usecols)
+                for sheet in DataUtility.select_excel_sheets(file_path, workbook.sheet_names, sheets)]
+        if file_path.lower().endswith('.xls') or openpyxl is None:
+            # openpyxl only reads .xlsx files
+            with pandas.ExcelFile(file_path) as workbook:
+                return [workbook.parse(sheet, usecols=usecols)
+                        for sheet in DataUtility.select_excel_sheets(file_path, workbook.sheet_names, sheets)]
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+        try:
+            frames = []
+            for sheet in DataUtility.select_excel_sheets(file_path, workbook.sheetnames, sheets):
+                worksheet = workbook[sheet]
+                # Without this openpyxl reads the whole sheet once more to size it, rows can then differ in length
+                worksheet.reset_dimensions()
+                rows = [list(row) for row in worksheet.iter_rows(values_only=True)]
+                width = max((len(row) for row in rows), default=0)
+                rows = [row if len(row) == width else row + [None] * (width - len(row)) for row in rows]
+                frames.append(DataUtility.excel_rows_dataframe(rows, usecols))
+            return frames
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def excel_rows_dataframe(rows, usecols=None):
+        """Return the Pandas dataframe of the cell values of a sheet, a list of rows with the header row first."""
+        # Read-only sheets can report empty rows past the data
+        while rows and all(val is None or val == '' for val in rows[-1]):
+            rows.pop()
+        if len(rows) == 0:
+            return pandas.DataFrame()
+        # Empty header cells are named Unnamed: <column number> like pandas.read_excel does
+        rows[0] = ['' if val is None else val for val in rows[0]]
+        return DataUtility.excel_cell_types(TextParser(rows, header=0, usecols=usecols).read())
+
+    @staticmethod
+    def excel_cell_types(data_frame):
+        """
+        Give the columns the types pandas.read_excel gives them: Excel stores every number as a float, whole numbers
+        are read as integers, and date cells as timestamps.
+        :param data_frame: Pandas dataframe parsed from the cell values of a sheet.
+        :return: Pandas dataframe.
+        """
+        for col in data_frame.columns:
+            values = data_frame[col]
+            if values.dtype == numpy.float64:
+                if len(values) > 0 and not values.isna().any() and (numpy.mod(values.to_numpy(), 1) == 0).all():
+                    data_frame[col] = values.astype(numpy.int64)
+            elif values.dtype == object:
+                # openpyxl reads empty cells as None
+                values = values.where(values.notna(), numpy.nan)
+                data_frame[col] = values
+                non_null = values.dropna()
+                if len(non_null) > 0 and all(isinstance(val, datetime.date) for val in non_null):
+                    data_frame[col] = pandas.to_datetime(values)
+                elif any(isinstance(val, float) for val in non_null):
+                    data_frame[col] = values.map(lambda val: int(val) if isinstance(val, float) and val.is_integer()
+                                                 else val)
+        return data_frame
+
+    @staticmethod
+    def usecols_filter(usecols):
+        """Return a function keeping the columns named in the usecols list, ignoring case and surrounding white
+        space, or None to keep every column."""
+        if not usecols:
+            return None
+        wanted = set(str(col).strip().lower() for col in usecols)
+        return lambda col: str(col).strip().lower() in wanted
+
+    @staticmethod
+    def sentinel_points(size):
+        """Return a geometry array of size POINT (-1 -1) values, the flag for records without valid coordinates."""
+        return geopandas.array.from_shapely(numpy.full(size, INVALID_POINT, dtype=object))
+
+    @staticmethod
+    def points_from_valid_xy(x_coords, y_coords):
+        """
+        Build point geometry only for the rows that have two valid coordinates.
+        :param x_coords: array of x/longitude floats, NaN where the coordinate is invalid.
+        :param y_coords: array of y/latitude floats, NaN where the coordinate is invalid.
+        :return: geometry array, rows without valid coordinates hold the POINT (-1 -1) flag.
+        """
+        x_coords = numpy.asarray(x_coords, dtype=float)
+        y_coords = numpy.asarray(y_coords, dtype=float)
+        valid = numpy.isfinite(x_coords) & numpy.isfinite(y_coords)
+        points = numpy.full(len(x_coords), INVALID_POINT, dtype=object)
+        points[valid] = numpy.asarray(geopandas.points_from_xy(x=x_coords[valid], y=y_coords[valid]), dtype=object)
+        return geopandas.array.from_shapely(points)
+
+    @staticmethod
+    def parse_coordinates(values):
+        """
+        Convert a column of spreadsheet coordinates to floats in bulk. Decimal numbers, comma decimals (e.g. 14,0833)
+        and degrees minutes seconds (e.g. 14°5'30"N) are accepted, south and west hemispheres are negative. The unicode
+        minus sign (e.g. −87.2) is read as a minus sign.
+        :param values: Pandas series of coordinate values.
+        :return: numpy float array, NaN where the value isn't a valid coordinate.
+        """
+        coords = pandas.to_numeric(values, errors='coerce').to_numpy(dtype=float, na_value=numpy.nan, copy=True)
+        unparsed = numpy.flatnonzero(numpy.isnan(coords) & values.notna().to_numpy())
+        if len(unparsed) == 0:
+            return coords
+        texts = values.iloc[unparsed].astype(str).str.strip().str.replace(',', '.', regex=False) \
+            .str.replace('\u2212', '-', regex=False)
+        coords[unparsed] = pandas.to_numeric(texts, errors='coerce').to_numpy(dtype=float, na_value=numpy.nan)
+
+        dms_mask = numpy.isnan(coords[unparsed])
+        if dms_mask.any():
+            parts = texts[dms_mask].str.extract(DMS_COORDINATE_PATTERN)
+            degrees = pandas.to_numeric(parts['degrees']).to_numpy(dtype=float, na_value=numpy.nan)
+            minutes = pandas.to_numeric(parts['minutes']).to_numpy(dtype=float, na_value=numpy.nan)
+            seconds = pandas.to_numeric(parts['seconds']).to_numpy(dtype=float, na_value=numpy.nan)
+            hemisphere = parts['leading_hemisphere'].fillna(parts['trailing_hemisphere']).str.upper()
+            negative = (hemisphere.isin(['S', 'W']).to_numpy() |
+                        parts['degrees'].str.startswith('-').fillna(False).to_numpy(dtype=bool))
+            # Minutes and seconds must be below 60, a lone number needs a hemisphere or units to be read as DMS
+            has_units = parts['minutes'].notna() | hemisphere.notna() | \
+                texts[dms_mask].str.contains('[°ºd:]', regex=True)
+            valid = (numpy.nan_to_num(minutes) < 60) & (numpy.nan_to_num(seconds) < 60) & has_units.to_numpy()
+            dms_coords = numpy.abs(degrees) + numpy.nan_to_num(minutes) / 60 + numpy.nan_to_num(seconds) / 3600
+            dms_coords = numpy.where(negative, -dms_coords, dms_coords)
+            coords[unparsed[dms_mask]] = numpy.where(valid, dms_coords, numpy.nan)
+        return coords
+
+    @staticmethod
+    def valid_point_mask(geometry):
+        """Return a numpy boolean array, True for spreadsheet points with valid coordinates, i.e. not empty, missing or
+        the POINT (-1 -1) flag."""
+        geoms = numpy.asarray(geometry, dtype=object)
+        valid = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+        coords = shapely.get_coordinates(geoms[valid])
+        valid[valid] = numpy.isfinite(coords).all(axis=1) & ~((coords[:, 0] == -1.0) & (coords[:, 1] == -1.0))
+        return valid
+
     @staticmethod
     # Verify that a string can be cast to a float
     def is_float_(text):
@@ -169,52 +613,1343 @@ class DataUtility:
             return False
 
 
-class AdminBoundaries:
+class AdminNameIndex:
+    """
+    Lookup table from normalized admin names to the row positions of the admin boundaries dataframe that carry
+    that name. The admin column is normalized once when the index is built, so every spreadsheet cell afterwards
+    costs a single dictionary lookup instead of a scan over all admin polygons.
+    """
+
+    def __init__(self, column_series, remove_accents=True):
+        """Constructor.
+        :param column_series: Pandas series of the admin boundaries column to index.
+        :param remove_accents: boolean, apply unidecode to the admin names when True.
+        """
+        self._remove_accents = remove_accents
+
+        # Normalize each distinct admin name only once, non-string values (NaN, numbers) are never matched
+        raw_names = pandas.Series(column_series.to_numpy(dtype=object))
+        raw_codes, raw_uniques = pandas.factorize(raw_names)
+        normalized_uniques = numpy.array([DataUtility.normalize_text(val, remove_accents) if isinstance(val, str)
+                                          else None for val in raw_uniques], dtype=object)
+        normalized = numpy.where(raw_codes >= 0, normalized_uniques[raw_codes], None)
+        codes, names = pandas.factorize(pandas.Series(normalized, dtype=object))
+
+        # Row positions are grouped by name code, in the same order as the admin dataframe rows
+        order = numpy.argsort(codes, kind='stable')
+        order = order[codes[order] >= 0]
+        counts = numpy.bincount(codes[codes >= 0], minlength=len(names))
+        self._names = numpy.asarray(names, dtype=object)
+        self._lookup = dict(zip(self._names, range(len(self._names))))
+        self._positions = order.astype(numpy.int64)
+        self._offsets = numpy.concatenate(([0], numpy.cumsum(counts))).astype(numpy.int64)
+        self._row_codes = codes.astype(numpy.int64)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, normalized_name):
+        return normalized_name in self._lookup
+
+    @property
+    def remove_accents(self):
+        return self._remove_accents
+
+    @property
+    def names(self):
+        """Return a numpy array of the distinct normalized admin names."""
+        return self._names
+
+    @property
+    def first_positions(self):
+        """Return the first admin row position of each distinct name, ordered by name code."""
+        return self._positions[self._offsets[:-1]]
+
+    @property
+    def counts(self):
+        """Return the number of admin rows carrying each distinct name, ordered by name code."""
+        return numpy.diff(self._offsets)
+
+    @property
+    def row_codes(self):
+        """Return the name code of each admin row, in admin dataframe order, -1 for rows without a name."""
+        return self._row_codes
+
+    def normalize(self, text):
+        """Normalize spreadsheet text the same way the admin names were normalized."""
+        return DataUtility.normalize_text(text, self._remove_accents)
+
+    def code(self, normalized_name):
+        """Return the name code of an already normalized name, or -1 when there is no such admin name."""
+        return self._lookup.get(normalized_name, -1)
+
+    def positions(self, code):
+        """Return a numpy array of the admin row positions for a name code."""
+        return self._positions[self._offsets[code]:self._offsets[code + 1]]
+
+    def codes(self, normalized_values):
+        """Vectorized lookup of already normalized names.
+        :param normalized_values: Pandas series or array of normalized strings.
+        :return: numpy array of name codes, -1 where there is no such admin name.
+        """
+        if not hasattr(self, '_names_pd_index'):
+            self._names_pd_index = pandas.Index(self._names, dtype=object)
+        return self._names_pd_index.get_indexer(pandas.Index(normalized_values, dtype=object))
+
+    def arrays(self):
+        """Return the dictionary of the index arrays, the inverse of from_arrays."""
+        return OrderedDict([('names', self._names), ('positions', self._positions), ('offsets', self._offsets),
+                            ('row_codes', self._row_codes)])
+
+    @classmethod
+    def from_arrays(cls, names, positions, offsets, row_codes, remove_accents=True):
+        """Rebuild the index from its arrays, e.g. read from a compiled admin layer, without normalizing any name."""
+        name_index = cls.__new__(cls)
+        name_index._remove_accents = remove_accents
+        name_index._names = numpy.asarray(names, dtype=object)
+        name_index._lookup = dict(zip(name_index._names, range(len(name_index._names))))
+        name_index._positions = positions
+        name_index._offsets = offsets
+        name_index._row_codes = row_codes
+        return name_index
+
+    def get(self, text):
+        """Normalize text and return the numpy array of matching admin row positions, or None if not found."""
+        code = self.code(self.normalize(text))
+        if code >= 0:
+            return self.positions(code)
+
+
+class NgramBlockingIndex:
+    """
+    Character n-gram postings over the fuzzy match choices. Before a query is scored with WRatio the index keeps only
+    the top_k choices that share the most n-grams with it, so each fuzzy query is scored against a handful of
+    plausible admin names instead of the whole admin boundaries list.
+    """
+
+    def __init__(self, choices, ngram_size=3):
+        """Constructor.
+        :param choices: list of the fuzzy match choice strings.
+        :param ngram_size: integer, number of characters per n-gram.
+        """
+        self._choices = numpy.asarray(choices, dtype=object)
+        self._choice_ids = dict(zip(self._choices, range(len(self._choices))))
+        self._ngram_size = ngram_size
+
+        postings = {}
+        for choice_id, choice in enumerate(self._choices):
+            for gram in self.ngrams(choice):
+                postings.setdefault(gram, []).append(choice_id)
+
+        # Compressed postings, choice ids of the n-gram with id g are self._postings[offsets[g]:offsets[g + 1]]
+        self._gram_ids = dict(zip(postings.keys(), range(len(postings))))
+        counts = [len(ids) for ids in postings.values()]
+        self._offsets = numpy.concatenate(([0], numpy.cumsum(counts))).astype(numpy.int64)
+        self._postings = numpy.fromiter((choice_id for ids in postings.values() for choice_id in ids),
+                                        dtype=numpy.int64, count=int(self._offsets[-1]))
+
+    @property
+    def choices(self):
+        return self._choices
+
+    @property
+    def ngram_size(self):
+        return self._ngram_size
+
+    def arrays(self):
+        """Return the dictionary of the n-grams, in n-gram id order, and the compressed postings arrays."""
+        return OrderedDict([('grams', numpy.array(list(self._gram_ids), dtype=object)), ('offsets', self._offsets),
+                            ('postings', self._postings)])
+
+    @classmethod
+    def from_arrays(cls, choices, grams, offsets, postings, ngram_size=3):
+        """Rebuild the index from its arrays, e.g. read from a compiled admin layer, without scanning the choices."""
+        ngram_index = cls.__new__(cls)
+        ngram_index._choices = numpy.asarray(choices, dtype=object)
+        ngram_index._choice_ids = dict(zip(ngram_index._choices, range(len(ngram_index._choices))))
+        ngram_index._ngram_size = ngram_size
+        ngram_index._gram_ids = dict(zip(grams, range(len(grams))))
+        ngram_index._offsets = offsets
+        ngram_index._postings = postings
+        return ngram_index
+
+    @property
+    def processed_choices(self):
+        """Return the list of choices processed with DataUtility.fuzzy_process, computed on first use."""
+        if not hasattr(self, '_processed_choices'):
+            self._processed_choices = [DataUtility.fuzzy_process(choice) for choice in self._choices]
+        return self._processed_choices
+
+    def choice_id(self, choice):
+        """Return the position of a choice string in choices, or -1."""
+        return self._choice_ids.get(choice, -1)
+
+    def ngrams(self, text):
+        """Return the set of n-grams of text after the same processing WRatio applies to it."""
+        processed = DataUtility.fuzzy_process(text)
+        if not processed:
+            return set()
+        padded = ' {0} '.format(processed)
+        return {padded[i:i + self._ngram_size] for i in range(max(1, len(padded) - self._ngram_size + 1))}
+
+    def candidate_ids(self, text, top_k):
+        """
+        Return the ids of the top_k choices sharing the most n-grams with text, in choice order.
+        :param text: string of the fuzzy query.
+        :param top_k: integer, number of candidates to keep. Larger values trade speed for recall.
+        :return: numpy array of choice ids, or None when blocking does not apply and every choice must be scored.
+        """
+        if top_k is None or top_k <= 0 or top_k >= len(self._choices):
+            return None
+        if len(DataUtility.fuzzy_process(text)) < self._ngram_size:
+            # Text shorter than an n-gram can still reach a high partial WRatio score, let WRatio decide on all choices
+            return None
+        gram_ids = [self._gram_ids[gram] for gram in self.ngrams(text) if gram in self._gram_ids]
+        if len(gram_ids) == 0:
+            # Nothing in common with any choice, e.g. purely numeric text
+            return numpy.array([], dtype=numpy.int64)
+        hits = numpy.concatenate([self._postings[self._offsets[g]:self._offsets[g + 1]] for g in gram_ids])
+        shared = numpy.bincount(hits, minlength=len(self._choices))
+        candidates = numpy.flatnonzero(shared)
+        if len(candidates) > top_k:
+            # Highest n-gram overlap first, ties broken by choice order
+            candidates = candidates[numpy.argsort(-shared[candidates], kind='stable')[:top_k]]
+        # Keep choice order so ties in WRatio are resolved the same way as an exhaustive search
+        return numpy.sort(candidates)
+
+    def candidates(self, text, top_k):
+        """Return the list of the top_k candidate choice strings for text, or all choices if blocking does not apply."""
+        candidate_ids = self.candidate_ids(text, top_k)
+        if candidate_ids is None:
+            return self._choices.tolist()
+        return self._choices[candidate_ids].tolist()
+
+
+class AdminHierarchy:
+    """
+    Parent to children maps between admin boundaries columns of increasing detail, e.g. ADM1 -> ADM2 -> ADM3, built
+    from the attribute table. A node is a distinct path of names from the top level down to a level, so 'San José'
+    under two different provinces are two nodes. Matching a level only searches the children of the node matched at
+    the level above instead of the whole national list of names.
+    """
+
+    def __init__(self, adm_boundaries, levels, remove_accents=True):
+        """Constructor.
+        :param adm_boundaries: AdminBoundaries of the admin layer.
+        :param levels: list of admin boundaries column names, from the largest admin areas to the smallest.
+        :param remove_accents: boolean, selects the AdminNameIndex of each level.
+        """
+        self._levels = list(levels)
+        self._name_indexes = [adm_boundaries.name_index(level, remove_accents) for level in self._levels]
+        self._node_keys = []
+        self._node_parents = []
+        self._node_codes = []
+        self._child_offsets = []
+        self._child_nodes = []
+        self._blocking_indexes = {}
+
+        # Nodes of the level above, a single root node 0 above the top level
+        parents = numpy.zeros(len(adm_boundaries), dtype=numpy.int64)
+        parent_count = 1
+        for name_index in self._name_indexes:
+            # A node is keyed by its parent node and name code, admin rows missing a name at any level are left out
+            keys = numpy.where((parents >= 0) & (name_index.row_codes >= 0),
+                               parents * len(name_index) + name_index.row_codes, -1)
+            row_nodes, node_keys = pandas.factorize(keys[keys >= 0])
+            node_keys = numpy.asarray(node_keys, dtype=numpy.int64)
+            self._node_keys.append(pandas.Index(node_keys))
+            self._node_parents.append(node_keys // max(len(name_index), 1))
+            self._node_codes.append(node_keys % max(len(name_index), 1))
+            parents = numpy.full(len(keys), -1, dtype=numpy.int64)
+            parents[keys >= 0] = row_nodes
+            # Compressed children lists, children of node p are child_nodes[child_offsets[p]:child_offsets[p + 1]]
+            order = numpy.argsort(self._node_parents[-1], kind='stable')
+            counts = numpy.bincount(self._node_parents[-1], minlength=parent_count)
+            parent_count = len(node_keys)
+            self._child_offsets.append(numpy.concatenate(([0], numpy.cumsum(counts))).astype(numpy.int64))
+            self._child_nodes.append(order.astype(numpy.int64))
+
+        # First admin row of each node of the bottom level, the polygon a full match points to
+        bottom_rows = numpy.flatnonzero(parents >= 0)
+        bottom_nodes, first_rows = numpy.unique(parents[bottom_rows], return_index=True)
+        self._bottom_positions = numpy.full(len(self._node_codes[-1]), -1, dtype=numpy.int64)
+        self._bottom_positions[bottom_nodes] = bottom_rows[first_rows]
+
+    @property
+    def levels(self):
+        return self._levels
+
+    def name_index(self, level):
+        """Return the AdminNameIndex of the level number."""
+        return self._name_indexes[level]
+
+    def node_count(self, level):
+        return len(self._node_codes[level])
+
+    def child_nodes(self, level, parent_nodes, codes):
+        """
+        Vectorized lookup of child nodes.
+        :param level: integer, level number of the children.
+        :param parent_nodes: numpy array of node ids of the level above, 0 for the top level.
+        :param codes: numpy array of name codes of the level, same shape as parent_nodes.
+        :return: numpy array of node ids, -1 where the parent has no child with that name.
+        """
+        keys = numpy.where((parent_nodes >= 0) & (codes >= 0),
+                           parent_nodes * len(self._name_indexes[level]) + codes, -1)
+        nodes = self._node_keys[level].get_indexer(keys.ravel()).reshape(keys.shape)
+        return numpy.where(keys >= 0, nodes, -1)
+
+    def child_counts(self, level, parent_nodes):
+        """Return the numpy array of the number of children on the level of each parent node."""
+        return numpy.diff(self._child_offsets[level])[parent_nodes]
+
+    def children(self, level, parent_node):
+        """Return the numpy array of node ids of the level whose parent is parent_node."""
+        offsets = self._child_offsets[level]
+        if parent_node + 1 >= len(offsets):
+            return numpy.array([], dtype=numpy.int64)
+        return self._child_nodes[level][offsets[parent_node]:offsets[parent_node + 1]]
+
+    def blocking_index(self, level, parent_node):
+        """Return the NgramBlockingIndex over the names of the children of parent_node, building it on first use.
+        Choice ids are positions in children(level, parent_node)."""
+        key = (level, parent_node)
+        if key not in self._blocking_indexes:
+            names = self._name_indexes[level].names[self._node_codes[level][self.children(level, parent_node)]]
+            self._blocking_indexes[key] = NgramBlockingIndex(names)
+        return self._blocking_indexes[key]
+
+    def admin_positions(self, bottom_nodes):
+        """Return the admin boundaries row positions of nodes of the bottom level."""
+        return self._bottom_positions[bottom_nodes]
+
+
+class TheFuzzScorer:
+    """
+    Fuzzy scorer backend that scores one query at a time with thefuzz's process.extractOne and fuzz.WRatio.
+    Always available, used as the fallback when rapidfuzz is not installed.
+    """
+    name = 'thefuzz'
+
+    def best_matches(self, queries, blocking_index, min_score, top_k=None):
+        """
+        Find the best choice of each query.
+        :param queries: list of query strings, already processed with DataUtility.fuzzy_process.
+        :param blocking_index: NgramBlockingIndex holding the choices and their n-gram candidates.
+        :param min_score: Integer, fuzzy match cut-off score.
+        :param top_k: Integer, number of blocking candidates per query, None scores every choice.
+        :return: tuple of numpy arrays (choice ids, -1 where nothing reached min_score, integer scores).
+        """
+        choice_ids = numpy.full(len(queries), -1, dtype=numpy.int64)
+        scores = numpy.zeros(len(queries), dtype=numpy.int64)
+        for i, query in enumerate(queries):
+            # Empty text, e.g. cells with only punctuation, always scores 0
+            if not query:
+                continue
+            result = process.extractOne(query=query, choices=blocking_index.candidates(query, top_k),
+                                        scorer=fuzz.WRatio, score_cutoff=min_score)
+            if result is not None:
+                choice_ids[i] = blocking_index.choice_id(result[0])
+                scores[i] = result[1]
+        return choice_ids, scores
+
+
+class RapidFuzzScorer:
+    """
+    Fuzzy scorer backend using rapidfuzz. Without blocking every query is scored against every choice in one
+    many-to-many process.cdist call that runs on all CPU cores. With blocking each query is scored against its
+    candidates only. Scores are the same WRatio scores the thefuzz backend returns.
+    """
+    name = 'rapidfuzz'
+
+    # Upper bound of query x choice cells in a single cdist score matrix, limits memory to a few hundred MB
+    max_matrix_cells = 20000000
+
+    def __init__(self, workers=-1):
+        """Constructor.
+        :param workers: Integer, number of cdist worker threads, -1 uses all CPU cores.
+        """
+        if rapidfuzz_process is None:
+            raise ImportError('The rapidfuzz fuzzy scorer needs the rapidfuzz package: pip install rapidfuzz')
+        self._workers = workers
+
+    def best_matches(self, queries, blocking_index, min_score, top_k=None):
+        """See TheFuzzScorer.best_matches."""
+        choice_ids = numpy.full(len(queries), -1, dtype=numpy.int64)
+        scores = numpy.zeros(len(queries), dtype=numpy.int64)
+        processed_choices = blocking_index.processed_choices
+        if len(queries) == 0 or len(processed_choices) == 0:
+            return choice_ids, scores
+
+        blocked = top_k is not None and 0 < top_k < len(processed_choices)
+        batch_queries = []
+        for i, query in enumerate(queries):
+            candidate_ids = blocking_index.candidate_ids(query, top_k) if blocked else None
+            if candidate_ids is None:
+                batch_queries.append(i)
+                continue
+            if len(candidate_ids) == 0:
+                continue
+            result = rapidfuzz_process.extractOne(query, [processed_choices[c] for c in candidate_ids],
+                                                  scorer=rapidfuzz_fuzz.WRatio, processor=None,
+                                                  score_cutoff=min_score)
+            if result is not None:
+                choice_ids[i] = candidate_ids[result[2]]
+                scores[i] = int(round(result[1]))
+
+        # Queries without blocking candidates are scored against all choices, in chunks of bounded memory
+        chunk_size = max(1, self.max_matrix_cells // len(processed_choices))
+        for start in range(0, len(batch_queries), chunk_size):
+            chunk = batch_queries[start:start + chunk_size]
+            matrix = rapidfuzz_process.cdist([queries[i] for i in chunk], processed_choices,
+                                             scorer=rapidfuzz_fuzz.WRatio, processor=None,
+                                             score_cutoff=min_score, workers=self._workers)
+            # argmax keeps the first best choice, the same tie breaking as extractOne
+            best = matrix.argmax(axis=1)
+            best_scores = matrix[numpy.arange(len(chunk)), best]
+            found = best_scores >= min_score
+            choice_ids[numpy.asarray(chunk)[found]] = best[found]
+            scores[numpy.asarray(chunk)[found]] = numpy.round(best_scores[found]).astype(numpy.int64)
+        return choice_ids, scores
+
+
+def get_fuzzy_scorer(name=None):
+    """
+    Return a fuzzy scorer backend.
+    :param name: string 'rapidfuzz' or 'thefuzz', None picks rapidfuzz when it is installed and thefuzz otherwise.
+    :return: TheFuzzScorer or RapidFuzzScorer instance.
+    """
+    if name is None or name == 'auto':
+        return RapidFuzzScorer() if rapidfuzz_process is not None else TheFuzzScorer()
+    elif name == RapidFuzzScorer.name:
+        return RapidFuzzScorer()
+    elif name == TheFuzzScorer.name:
+        return TheFuzzScorer()
+    raise ValueError('Unknown fuzzy scorer {0}, choose rapidfuzz or thefuzz.'.format(name))
+
+
+class FuzzyMatchCache:
+    """
+    Persistent SQLite cache of fuzzy match results, so reruns against the same admin boundaries layer skip the fuzzy
+    scoring of text that was already scored. Results are keyed by the admin layer content fingerprint, admin column,
+    accent setting, cut-off score, blocking top_k and the processed query. Entries of a layer whose content changed
+    are dropped, and the least recently used entries are evicted once max_entries is reached.
+    """
+
+    # Keeps the number of SQL variables per statement below SQLite's default limit
+    _batch_size = 500
+
+    def __init__(self, db_path=None, max_entries=1000000):
+        """Constructor.
+        :param db_path: string for the SQLite cache file, defaults to fuzzy_match_cache.sqlite in the output folder.
+        :param max_entries: Integer, maximum number of cached results kept.
+        """
+        self._db_path = db_path if db_path is not None else path.join(DataUtility.get_output_path(),
+                                                                      'fuzzy_match_cache.sqlite')
+        self._max_entries = max_entries
+        self._connection = sqlite3.connect(self._db_path)
+        self._connection.executescript(
+            'CREATE TABLE IF NOT EXISTS layers (file_path TEXT PRIMARY KEY, layer_hash TEXT NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS fuzzy_matches (layer_hash TEXT NOT NULL, admin_column TEXT NOT NULL, '
+            'remove_accents INTEGER NOT NULL, min_score INTEGER NOT NULL, top_k INTEGER NOT NULL, query TEXT NOT NULL, '
+            'choice TEXT, score INTEGER NOT NULL, last_used REAL NOT NULL, '
+            'PRIMARY KEY (layer_hash, admin_column, remove_accents, min_score, top_k, query));'
+            'CREATE INDEX IF NOT EXISTS fuzzy_matches_last_used ON fuzzy_matches (last_used);')
+        self._connection.commit()
+
+    @property
+    def db_path(self):
+        return self._db_path
+
+    def register_layer(self, file_path, layer_hash):
+        """Remember the fingerprint of an admin layer file, dropping the cached results of its previous content unless
+        another registered file still has that content."""
+        row = self._connection.execute('SELECT layer_hash FROM layers WHERE file_path = ?', (file_path,)).fetchone()
+        self._connection.execute('INSERT OR REPLACE INTO layers (file_path, layer_hash) VALUES (?, ?)',
+                                 (file_path, layer_hash))
+        if row is not None and row[0] != layer_hash:
+            shared = self._connection.execute('SELECT 1 FROM layers WHERE layer_hash = ? LIMIT 1', (row[0],)).fetchone()
+            if shared is None:
+                deleted = self._connection.execute('DELETE FROM fuzzy_matches WHERE layer_hash = ?',
+                                                   (row[0],)).rowcount
+                print('Admin boundaries file {0} changed, removed {1} outdated fuzzy cache entries.'.format(
+                    file_path, deleted))
+        self._connection.commit()
+
+    def get_many(self, key, queries):
+        """
+        Look up cached results.
+        :param key: tuple of (layer_hash, admin_column, remove_accents, min_score, top_k).
+        :param queries: list of processed query strings.
+        :return: dictionary of query to (choice or None, score) for the cached queries.
+        """
+        found = {}
+        key = self._sql_key(key)
+        for start in range(0, len(queries), self._batch_size):
+            batch = list(queries[start:start + self._batch_size])
+            rows = self._connection.execute(
+                'SELECT query, choice, score FROM fuzzy_matches WHERE layer_hash = ? AND admin_column = ? AND '
+                'remove_accents = ? AND min_score = ? AND top_k = ? AND query IN ({0})'.format(
+                    ','.join('?' * len(batch))), key + tuple(batch)).fetchall()
+            found.update((query, (choice, score)) for query, choice, score in rows)
+        # Touch the hits so they become the most recently used entries
+        now = time.time()
+        self._connection.executemany(
+            'UPDATE fuzzy_matches SET last_used = ? WHERE layer_hash = ? AND admin_column = ? AND remove_accents = ? '
+            'AND min_score = ? AND top_k = ? AND query = ?', [(now,) + key + (query,) for query in found])
+        self._connection.commit()
+        return found
+
+    def put_many(self, key, results):
+        """
+        Store results and evict the least recently used entries above max_entries.
+        :param key: tuple of (layer_hash, admin_column, remove_accents, min_score, top_k).
+        :param results: iterable of (query, choice or None, score) tuples.
+        """
+        now = time.time()
+        key = self._sql_key(key)
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO fuzzy_matches (layer_hash, admin_column, remove_accents, min_score, top_k, query, '
+            'choice, score, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [key + (query, choice, int(score), now) for query, choice, score in results])
+        entries = self._connection.execute('SELECT COUNT(*) FROM fuzzy_matches').fetchone()[0]
+        if entries > self._max_entries:
+            self._connection.execute(
+                'DELETE FROM fuzzy_matches WHERE rowid IN '
+                '(SELECT rowid FROM fuzzy_matches ORDER BY last_used LIMIT ?)', (entries - self._max_entries,))
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    @staticmethod
+    def _sql_key(key):
+        layer_hash, admin_column, remove_accents, min_score, top_k = key
+        return layer_hash, str(admin_column), int(bool(remove_accents)), int(min_score), int(top_k or 0)
+
+
+class CentroidCache:
+    """
+    Persistent cache of the admin polygon centroids of the matches maps, see AdminBoundaries.centroids, so reruns
+    against the same admin boundaries layer skip reprojecting polygons. One .npy file per admin layer content, layer
+    filter and EPSG code, holding x, y and a computed flag per admin row. Files of a layer whose content changed are
+    not found again, its fingerprint is part of the file name.
+    """
+
+    def __init__(self, cache_dir=None):
+        """Constructor.
+        :param cache_dir: string for the cache folder, defaults to the centroid_cache folder in the output folder.
+        """
+        self._cache_dir = cache_dir if cache_dir else path.join(DataUtility.get_output_path(), 'centroid_cache')
+        makedirs(self._cache_dir, exist_ok=True)
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    def file_path(self, adm_boundaries, epsg):
+        """Return the cache file path of the admin layer, its bbox and row filter, and the EPSG code."""
+        read_options = adm_boundaries.read_options
+        key = json.dumps([adm_boundaries.fingerprint, read_options.get('bbox'), read_options.get('row_filter')],
+                         default=str)
+        return path.join(self._cache_dir, 'centroids_{0}_{1}.npy'.format(
+            hashlib.sha256(key.encode('utf-8')).hexdigest()[:24], epsg))
+
+    def load(self, adm_boundaries, epsg):
+        """Return the cached centroid array of the layer and EPSG code, None when there is none."""
+        file_path = self.file_path(adm_boundaries, epsg)
+        if not path.isfile(file_path):
+            return None
+        try:
+            coords = numpy.load(file_path)
+        except (OSError, ValueError) as e:
+            print('Exception {0} while reading the centroid cache {1}, it is rebuilt.'.format(e, file_path))
+            return None
+        return coords if coords.shape == (len(adm_boundaries), 3) else None
+
+    def save(self, adm_boundaries, epsg, coords):
+        """Save the centroid array of the layer and EPSG code, replacing the cache file in one step."""
+        file_path = self.file_path(adm_boundaries, epsg)
+        # Batch worker processes may save the same layer at once, each one writes its own temporary file
+        temp_path = '{0}.{1}.tmp'.format(file_path, getpid())
+        with open(temp_path, 'wb') as f:
+            numpy.save(f, coords)
+        replace(temp_path, file_path)
+
+
+class CompiledLayer:
+    """
+    Compiled admin boundaries layer, a versioned .geoidx file written once by AdminBoundaries.compile so later runs
+    skip reading the shapefile and building the match indexes. The file holds the attribute table with WKB
+    geometries, the bounding box of each polygon and, for each indexed admin column and accent setting, the
+    normalized names, their row position lookup tables and the n-gram blocking postings.
+
+    Layout: 8 byte magic, uint32 format version, uint64 header size, JSON header, then the sections, each an Arrow IPC
+    file aligned to 64 bytes. The file is memory mapped and sections are only read when used, so opening a large
+    national layer costs a header read.
+    """
+
+    _PREAMBLE = struct.Struct('<8sIQ')
+    _ALIGNMENT = 64
 
     def __init__(self, file_path):
-        self._file_path = sanitize_filepath(file_path, platform='auto')
+        """Constructor.
+        :param file_path: string for the .geoidx file path.
+        """
+        self._file_path = file_path
+        self._buffer = pyarrow.memory_map(file_path, 'r').read_buffer()
+        if self._buffer.size < self._PREAMBLE.size:
+            raise ValueError('The file {0} is not a compiled admin layer (.geoidx) file!'.format(file_path))
+        magic, version, header_size = self._PREAMBLE.unpack(self._buffer.slice(0, self._PREAMBLE.size).to_pybytes())
+        if magic != GEOIDX_MAGIC:
+            raise ValueError('The file {0} is not a compiled admin layer (.geoidx) file!'.format(file_path))
+        if version != GEOIDX_FORMAT_VERSION:
+            raise ValueError('The file {0} was compiled with format version {1}, this version of the geocoder reads '
+                             'version {2}. Compile the shapefile again.'.format(file_path, version,
+                                                                                GEOIDX_FORMAT_VERSION))
+        self._header = json.loads(self._buffer.slice(self._PREAMBLE.size, header_size).to_pybytes().decode('utf-8'))
+        self._data_start = self.aligned(self._PREAMBLE.size + header_size)
+
+    @classmethod
+    def aligned(cls, offset):
+        return -(-offset // cls._ALIGNMENT) * cls._ALIGNMENT
+
+    @property
+    def header(self):
+        return self._header
+
+    @property
+    def columns(self):
+        return self._header['columns']
+
+    @property
+    def row_count(self):
+        return self._header['rows']
+
+    @property
+    def fingerprint(self):
+        return self._header['fingerprint']
+
+    @property
+    def crs(self):
+        return self._header['crs']
+
+    @staticmethod
+    def name_index_key(col_name, remove_accents):
+        return 'name_index/{0}/{1}'.format(col_name, int(bool(remove_accents)))
+
+    def has_name_index(self, col_name, remove_accents=True):
+        return self.name_index_key(col_name, remove_accents) + '/names' in self._header['sections']
+
+    def table(self, section):
+        """Return the pyarrow Table of a section, backed by the memory map."""
+        offset, size = self._header['sections'][section]
+        return pyarrow.ipc.open_file(self._buffer.slice(self._data_start + offset, size)).read_all()
+
+    def array(self, section):
+        """Return the numpy array of a single column section, without copying numeric data."""
+        column = self.table(section).column(0)
+        if pyarrow.types.is_string(column.type) or pyarrow.types.is_large_string(column.type):
+            return numpy.asarray(column.to_pylist(), dtype=object)
+        return column.combine_chunks().to_numpy(zero_copy_only=False)
+
+    def name_index(self, col_name, remove_accents=True):
+        """Return the AdminNameIndex of the admin column stored in the file."""
+        key = self.name_index_key(col_name, remove_accents)
+        return AdminNameIndex.from_arrays(*[self.array('{0}/{1}'.format(key, name)) for name in
+                                            ('names', 'positions', 'offsets', 'row_codes')],
+                                          remove_accents=remove_accents)
+
+    def ngram_index(self, col_name, remove_accents=True):
+        """Return the NgramBlockingIndex over the normalized names of the admin column stored in the file."""
+        key = self.name_index_key(col_name, remove_accents)
+        return NgramBlockingIndex.from_arrays(*[self.array('{0}/{1}'.format(key, name)) for name in
+                                                ('names', 'grams', 'gram_offsets', 'postings')],
+                                              ngram_size=self._header['ngram_size'])
+
+    def bounds(self):
+        """Return a numpy array of the minx, miny, maxx, maxy bounding box of each admin polygon."""
+        return numpy.column_stack([column.to_numpy() for column in self.table('bounds').columns])
+
+    def dataframe(self):
+        """Return the GeoDataFrame of the admin boundaries layer, geometries are parsed from WKB."""
+        table = self.table('rows')
+        data_frame = table.drop_columns(['geometry']).to_pandas()
+        geometry = geopandas.GeoSeries.from_wkb(table.column('geometry').to_numpy(zero_copy_only=False),
+                                                crs=self.crs)
+        return geopandas.GeoDataFrame(data_frame, geometry=geometry)[self.columns]
+
+    @staticmethod
+    def section_bytes(table):
+        """Return the pyarrow Buffer of a table written as an Arrow IPC file."""
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue()
+
+    @classmethod
+    def write(cls, adm_boundaries, out_file, admin_columns):
+        """
+        Write the .geoidx file of an admin boundaries layer.
+        :param adm_boundaries: AdminBoundaries of the shapefile.
+        :param out_file: string for the .geoidx file path.
+        :param admin_columns: list of the admin columns whose name and n-gram indexes are stored, with and without
+        accents removed.
+        :return: dictionary of the file header.
+        """
+        data_frame = adm_boundaries.dataframe
+        geometry = data_frame.geometry.array
+        sections = OrderedDict()
+        rows = pyarrow.Table.from_pandas(pandas.DataFrame(data_frame.drop(columns='geometry')), preserve_index=False)
+        sections['rows'] = rows.append_column('geometry', pyarrow.array(shapely.to_wkb(geometry),
+                                                                        type=pyarrow.binary()))
+        sections['bounds'] = pyarrow.table(dict(zip(['minx', 'miny', 'maxx', 'maxy'],
+                                                    shapely.bounds(geometry).T)))
+        ngram_size = 3
+        for col_name in admin_columns:
+            for remove_accents in (True, False):
+                key = cls.name_index_key(col_name, remove_accents)
+                name_index = adm_boundaries.name_index(col_name, remove_accents)
+                ngram_index = adm_boundaries.ngram_index(col_name, remove_accents)
+                ngram_size = ngram_index.ngram_size
+                arrays = name_index.arrays()
+                arrays.update(('gram_' + name if name == 'offsets' else name, values)
+                              for name, values in ngram_index.arrays().items())
+                for name, values in arrays.items():
+                    values = pyarrow.array(values.tolist(), type=pyarrow.string()) if values.dtype == object \
+                        else pyarrow.array(values)
+                    sections['{0}/{1}'.format(key, name)] = pyarrow.table({'values': values})
+
+        header = OrderedDict([('format_version', GEOIDX_FORMAT_VERSION),
+                              ('source_file', adm_boundaries.file_path),
+                              ('fingerprint', adm_boundaries.fingerprint),
+                              ('compiled', datetime.datetime.now().isoformat(timespec='seconds')),
+                              ('crs', data_frame.crs.to_wkt() if data_frame.crs is not None else None),
+                              ('rows', len(data_frame)),
+                              ('columns', [str(col) for col in data_frame.columns]),
+                              ('admin_columns', list(admin_columns)),
+                              ('ngram_size', ngram_size),
+                              ('sections', OrderedDict())])
+        section_buffers = []
+        offset = 0
+        for name, table in sections.items():
+            buffer = cls.section_bytes(table)
+            header['sections'][name] = [offset, buffer.size]
+            section_buffers.append(buffer)
+            offset = cls.aligned(offset + buffer.size)
+
+        header_bytes = json.dumps(header).encode('utf-8')
+        with open(out_file, 'wb') as f:
+            f.write(cls._PREAMBLE.pack(GEOIDX_MAGIC, GEOIDX_FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            data_start = cls.aligned(f.tell())
+            f.write(b'\x00' * (data_start - f.tell()))
+            for buffer in section_buffers:
+                f.write(buffer)
+                f.write(b'\x00' * (cls.aligned(f.tell() - data_start) - (f.tell() - data_start)))
+        return header
+
+
+class LazyLayer:
+    """
+    Admin boundaries layer read piece by piece. Only the schema is read when the layer is opened, so the admin columns
+    can be listed for the admin choice; afterwards attribute columns are read one at a time when they are matched, and
+    geometries only when a spatial match needs them or for the matched rows when the matches are written out.
+
+    An optional bounding box and row filter, e.g. ADM0_EN = Honduras on a continental layer, select the admin rows
+    once; every later read returns the same rows in the same order, so row positions stay valid. GDAL formats are read
+    with pyogrio by feature id, GeoParquet and Feather files with pyarrow by row number.
+    """
+
+    def __init__(self, file_path, columns=None, bbox=None, row_filter=None):
+        """Constructor.
+        :param file_path: string for the admin boundaries shapefile, GeoParquet or Feather file.
+        :param columns: list of the attribute columns that can be read, None allows every column.
+        :param bbox: tuple of minx, miny, maxx, maxy in the layer coordinate reference system, only admin polygons
+        intersecting it are read.
+        :param row_filter: tuple of a column name and a value, only admin rows with that value are read.
+        """
+        self._file_path = file_path
+        self._bbox = bbox
+        self._row_filter = row_filter
+        self._row_ids = None
+        self._arrow = path.splitext(file_path)[1].lower() in GEOPARQUET_EXTENSIONS + FEATHER_EXTENSIONS
+        if self._arrow:
+            if pyarrow is None:
+                raise ImportError('Reading {0} needs pyarrow, install it with: pip install pyarrow'.format(file_path))
+            if path.splitext(file_path)[1].lower() in GEOPARQUET_EXTENSIONS:
+                schema = pyarrow.parquet.read_schema(file_path)
+            else:
+                schema = pyarrow.ipc.open_file(pyarrow.memory_map(file_path, 'r')).schema
+            geo_metadata = json.loads((schema.metadata or {}).get(b'geo', b'{}'))
+            if 'primary_column' not in geo_metadata:
+                raise ValueError('The file {0} has no GeoParquet geometry metadata!'.format(file_path))
+            self._geometry_col = geo_metadata['primary_column']
+            geometry_metadata = geo_metadata['columns'][self._geometry_col]
+            # GeoParquet layers without a crs are in OGC:CRS84, i.e. EPSG:4326 longitude/latitude
+            self._crs = geometry_metadata.get('crs', 'EPSG:4326')
+            # Only WKB geometries are decoded row by row, other encodings are read with geopandas
+            self._wkb = geometry_metadata.get('encoding', 'WKB').upper() == 'WKB'
+            # GeoParquet 1.1 bbox covering column, e.g. written with to_parquet(write_covering_bbox=True), read instead
+            # of the geometries to apply the bbox
+            self._covering = geometry_metadata.get('covering', {}).get('bbox')
+            if path.splitext(file_path)[1].lower() not in GEOPARQUET_EXTENSIONS:
+                self._covering = None
+            covering_columns = [field[0] for field in self._covering.values()] if self._covering else []
+            schema_columns = [name for name in schema.names
+                              if name != self._geometry_col and name not in covering_columns]
+            self._feature_count = None
+        else:
+            if pyogrio is None:
+                raise ImportError('Lazy loading of {0} needs pyogrio, install it with: pip install pyogrio'.format(
+                    file_path))
+            info = pyogrio.read_info(file_path)
+            self._geometry_col = None
+            self._crs = info['crs']
+            schema_columns = list(info['fields'])
+            self._feature_count = info['features']
+        self._columns = [col for col in schema_columns if columns is None or col in columns]
+
+    @property
+    def columns(self):
+        """Return the attribute column names, without geometry."""
+        return self._columns
+
+    @property
+    def crs(self):
+        return self._crs
 
-        if path.isfile(file_path):
-            self._dataframe = geopandas.read_file(file_path)
+    @property
+    def filtered(self):
+        return self._bbox is not None or self._row_filter is not None
+
+    def row_ids(self):
+        """Return the numpy array of the feature ids (GDAL) or row numbers (pyarrow) of the selected admin rows."""
+        if self._row_ids is not None:
+            return self._row_ids
+        if not self.filtered and self._feature_count is not None and self._feature_count >= 0:
+            self._row_ids = numpy.arange(self._feature_count, dtype=numpy.int64)
+        elif not self._arrow:
+            where = None
+            filter_columns = []
+            if self._row_filter is not None:
+                column, value = self._row_filter
+                where = '"{0}" = \'{1}\''.format(column, str(value).replace("'", "''"))
+                # GDAL evaluates the filter on read fields only
+                filter_columns = [column]
+            selected = pyogrio.read_dataframe(self._file_path, columns=filter_columns, read_geometry=False,
+                                              bbox=self._bbox, where=where, fid_as_index=True)
+            self._row_ids = selected.index.to_numpy(dtype=numpy.int64)
+        else:
+            mask = None
+            if self._row_filter is not None:
+                mask = self.row_filter_mask()
+            if self._bbox is not None:
+                bounds = self.arrow_bounds()
+                in_bbox = (bounds[:, 0] <= self._bbox[2]) & (bounds[:, 2] >= self._bbox[0]) & \
+                          (bounds[:, 1] <= self._bbox[3]) & (bounds[:, 3] >= self._bbox[1])
+                mask = in_bbox if mask is None else mask & in_bbox
+            if mask is None:
+                mask = numpy.ones(self.read_table([]).num_rows, dtype=bool)
+            self._row_ids = numpy.flatnonzero(mask).astype(numpy.int64)
+        return self._row_ids
+
+    def row_filter_mask(self):
+        """Return the boolean numpy array of the GeoParquet or Feather rows with the row_filter value. The value is cast
+        to the column type, so '3' selects 3 in a numeric column like the GDAL where clause does."""
+        column, value = self._row_filter
+        values = self.read_table([column]).column(0)
+        try:
+            value = pyarrow.compute.cast(pyarrow.scalar(value), values.type)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowNotImplementedError):
+            values = pyarrow.compute.cast(values, pyarrow.string())
+            value = str(value)
+        return pyarrow.compute.equal(values, value).fill_null(False).to_numpy()
+
+    def arrow_bounds(self):
+        """Return a numpy array of the minx, miny, maxx, maxy bounding box of each GeoParquet or Feather row. The bbox
+        covering column is read when there is one, otherwise the geometries are decoded one batch at a time."""
+        if self._covering is not None:
+            bbox_column = self.read_table([self._covering['xmin'][0]]).column(0).combine_chunks()
+            return numpy.column_stack([bbox_column.field(self._covering[key][1]).to_numpy(zero_copy_only=False)
+                                       for key in ('xmin', 'ymin', 'xmax', 'ymax')])
+        if not self._wkb:
+            return shapely.bounds(self.read_arrow_geometry().array)
+        batches = self.read_table([self._geometry_col]).to_batches(LAZY_BBOX_BATCH_ROWS)
+        if len(batches) == 0:
+            return numpy.empty((0, 4))
+        return numpy.concatenate([shapely.bounds(shapely.from_wkb(batch.column(0).to_numpy(zero_copy_only=False)))
+                                  for batch in batches])
+
+    def read_table(self, columns):
+        """Return the pyarrow Table of the columns of a GeoParquet or Feather file, all rows. Only these columns are
+        read and decompressed."""
+        if path.splitext(self._file_path)[1].lower() in GEOPARQUET_EXTENSIONS:
+            return pyarrow.parquet.read_table(self._file_path, columns=columns)
+        return pyarrow.feather.read_table(self._file_path, columns=columns, memory_map=True)
+
+    def arrow_geometry(self, row_ids):
+        """Return the geometry array of the GeoParquet or Feather rows, only the WKB of these rows is decoded."""
+        if not self._wkb:
+            return self.read_arrow_geometry().array[row_ids]
+        wkb = self.read_table([self._geometry_col]).column(0).take(pyarrow.array(row_ids))
+        return shapely.from_wkb(wkb.to_numpy())
+
+    def read_arrow_geometry(self):
+        """Return the GeoSeries of all rows of a GeoParquet or Feather file."""
+        if path.splitext(self._file_path)[1].lower() in GEOPARQUET_EXTENSIONS:
+            return geopandas.read_parquet(self._file_path, columns=[self._geometry_col]).geometry
+        return geopandas.read_feather(self._file_path, columns=[self._geometry_col]).geometry
+
+    def read_columns(self, columns):
+        """Return a Pandas dataframe of the attribute columns for the selected admin rows, without geometry."""
+        if self._arrow:
+            table = self.read_table(list(columns))
+            if self.filtered:
+                table = table.take(self.row_ids())
+            return table.to_pandas()
+        fids = self.row_ids() if self.filtered else None
+        data_frame = pyogrio.read_dataframe(self._file_path, columns=list(columns), read_geometry=False, fids=fids)
+        return pandas.DataFrame(data_frame).reset_index(drop=True)
+
+    def read_geometry(self, positions=None):
+        """
+        Read geometries of the selected admin rows.
+        :param positions: numpy array of row positions among the selected admin rows, None reads every selected row.
+        :return: GeoSeries of the geometries, indexed by row position.
+        """
+        if positions is None:
+            positions = numpy.arange(len(self.row_ids()), dtype=numpy.int64)
+        positions = numpy.asarray(positions, dtype=numpy.int64)
+        if self._arrow:
+            geometry = self.arrow_geometry(self.row_ids()[positions])
+        else:
+            all_rows = not self.filtered and numpy.array_equal(positions, numpy.arange(len(self.row_ids())))
+            geometry = pyogrio.read_dataframe(self._file_path, columns=[],
+                                              fids=None if all_rows else self.row_ids()[positions]).geometry.array
+        return geopandas.GeoSeries(geometry, index=positions, crs=self._crs)
+
+
+class AdminBoundaries:
+
+    def __init__(self, file_path, columns=None, lazy=False, bbox=None, row_filter=None):
+        """Constructor.
+        :param file_path: string for the admin boundaries shapefile, GeoParquet, Feather or compiled .geoidx file.
+        :param columns: list of the admin columns to read, None reads every column. The geometry is always read.
+        :param lazy: boolean, only read the schema now, then each column when it is matched and the geometries when a
+        spatial match or the matches output needs them, see LazyLayer. Compiled .geoidx files are always opened lazily.
+        :param bbox: optional tuple of minx, miny, maxx, maxy in the layer coordinate reference system, only the admin
+        polygons intersecting it are read. Not supported for compiled .geoidx files, compile the filtered layer instead.
+        :param row_filter: optional tuple of a column name and a value, e.g. ('ADM0_EN', 'Honduras'), only the admin
+        rows with that value are read. Not supported for compiled .geoidx files.
+        """
+        self._file_path = sanitize_filepath(file_path, platform='auto')
+        # Kept so worker processes can open the layer the same way, see _init_match_worker
+        self._read_options = {'columns': columns, 'lazy': lazy, 'bbox': bbox, 'row_filter': row_filter}
+        # Normalized name indexes and fuzzy blocking indexes are built once per admin column and accent setting
+        self._name_indexes = {}
+        self._candidate_trees = {}
+        self._hierarchies = {}
+        self._ngram_indexes = {}
+        # Centroids of the admin polygons in the matches map coordinates, per EPSG code, see centroids
+        self._centroids = {}
+        # Compiled .geoidx layers are opened lazily, the dataframe is only built when it is first used
+        self._dataframe = None
+        self._compiled = None
+        # Lazy layers read attribute columns one at a time into _attributes
+        self._lazy_layer = None
+        self._attributes = None
+
+        if path.isfile(file_path) and path.splitext(file_path)[1].lower() == GEOIDX_EXTENSION:
+            if bbox is not None or row_filter is not None:
+                print('The compiled admin layer {0} can not be filtered with --bbox or --admin-filter. Pass the source '
+                      'admin layer to -a, or compile it with the same --bbox and --admin-filter.'.format(file_path))
+                exit()
+            if pyarrow is None:
+                print('Opening the compiled admin layer {0} needs pyarrow, install it with: pip install pyarrow'.format(
+                    file_path))
+                exit()
+            try:
+                self._compiled = CompiledLayer(file_path)
+            except ValueError as e:
+                print(e)
+                exit()
+        elif path.isfile(file_path) and (lazy or bbox is not None or row_filter is not None):
+            try:
+                self._lazy_layer = LazyLayer(file_path, columns, bbox, row_filter)
+            except (ImportError, ValueError) as e:
+                print(e)
+                exit()
+            if self._lazy_layer.filtered and len(self._lazy_layer.row_ids()) == 0:
+                print('No admin boundaries rows were selected from {0}, nothing can be matched!'.format(
+                    self.layer_name))
+                exit()
+            if not lazy:
+                self._dataframe = self.lazy_dataframe()
+        elif path.isfile(file_path):
+            self._dataframe = self.read_layer(file_path, columns)
         else:
             print(
                 'The file {0} could not be located! Make sure you entered the correct file path for the admin boundaries shapefile!'.
                     format(file_path))
             exit()
 
+    @staticmethod
+    def read_layer(file_path, columns=None):
+        """
+        Read an admin boundaries layer. GeoParquet and Feather files are read with pyarrow, shapefiles and other GDAL
+        formats with pyogrio. The geometry column is always named geometry.
+        :param file_path: string for the admin boundaries file path.
+        :param columns: list of the attribute columns to read, None reads every column. Only these columns are
+        decoded, e.g. the admin name column of a layer with dozens of attribute columns.
+        :return: GeoDataFrame of the admin boundaries layer.
+        """
+        extension = path.splitext(file_path)[1].lower()
+        if extension not in GEOPARQUET_EXTENSIONS + FEATHER_EXTENSIONS:
+            if columns is None:
+                return geopandas.read_file(file_path)
+            return geopandas.read_file(file_path, columns=list(columns))
+
+        if pyarrow is None:
+            raise ImportError('Reading {0} files needs pyarrow, install it with: pip install pyarrow'.format(extension))
+        if extension in GEOPARQUET_EXTENSIONS:
+            schema = pyarrow.parquet.read_schema(file_path)
+            read_function = geopandas.read_parquet
+        else:
+            schema = pyarrow.ipc.open_file(pyarrow.memory_map(file_path, 'r')).schema
+            read_function = geopandas.read_feather
+        geo_metadata = (schema.metadata or {}).get(b'geo')
+        if geo_metadata is None:
+            raise ValueError('The file {0} has no GeoParquet geometry metadata!'.format(file_path))
+        geometry_col = json.loads(geo_metadata)['primary_column']
+        if columns is not None:
+            columns = [col for col in columns if col != geometry_col] + [geometry_col]
+        data_frame = read_function(file_path, columns=columns)
+        if data_frame.geometry.name != 'geometry':
+            data_frame = data_frame.rename_geometry('geometry')
+        return data_frame
+
+    def __len__(self):
+        if self._dataframe is not None:
+            return len(self._dataframe)
+        if self._compiled is not None:
+            return self._compiled.row_count
+        return len(self._lazy_layer.row_ids())
+
     @property
     def file_path(self):
         return self._file_path
 
+    @property
+    def read_options(self):
+        """Return the dictionary of the columns, lazy, bbox and row_filter constructor arguments."""
+        return self._read_options
+
     @property
     def dataframe(self):
+        if self._dataframe is None:
+            self._dataframe = self._compiled.dataframe() if self._compiled is not None else self.lazy_dataframe()
         return self._dataframe
 
+    @property
+    def columns(self):
+        """Return the admin boundaries column names, without loading a compiled or lazy layer's dataframe."""
+        if self._dataframe is not None:
+            return self._dataframe.columns
+        if self._compiled is not None:
+            return pandas.Index(self._compiled.columns)
+        return pandas.Index(self._lazy_layer.columns + ['geometry'])
+
+    def lazy_dataframe(self):
+        """Return the GeoDataFrame of a lazy layer, every attribute column and the geometries are read."""
+        geometry = self._lazy_layer.read_geometry()
+        return geopandas.GeoDataFrame(self.attribute_columns(self._lazy_layer.columns), geometry=geometry.array,
+                                      crs=geometry.crs)
+
+    def attribute_columns(self, col_names):
+        """Return a Pandas dataframe of the attribute columns, lazy layers read the columns not read yet."""
+        if self._dataframe is not None or self._lazy_layer is None:
+            return pandas.DataFrame(self.dataframe[list(col_names)])
+        if self._attributes is None:
+            self._attributes = pandas.DataFrame(index=pandas.RangeIndex(len(self)))
+        missing = [col for col in col_names if col not in self._attributes.columns]
+        if missing:
+            self._attributes = pandas.concat([self._attributes, self._lazy_layer.read_columns(missing)], axis=1)
+        return self._attributes[list(col_names)]
+
+    def column(self, col_name):
+        """Return the Pandas series of an admin boundaries column, lazy layers only read this column."""
+        return self.attribute_columns([col_name])[col_name]
+
+    def row_values(self, positions):
+        """Return a numpy array of the admin rows at the row positions. Lazy layers whose geometries are not read
+        yet only return the attribute columns read so far."""
+        if self._dataframe is None and self._lazy_layer is not None:
+            if self._attributes is None:
+                self._attributes = pandas.DataFrame(index=pandas.RangeIndex(len(self)))
+            return self._attributes.iloc[positions].to_numpy()
+        return self.dataframe.iloc[positions].to_numpy()
+
+    @property
+    def compiled(self):
+        """Return the CompiledLayer of a .geoidx admin layer, None for shapefiles."""
+        return self._compiled
+
+    @property
+    def bounds(self):
+        """Return a numpy array of the minx, miny, maxx, maxy bounding box of each admin polygon."""
+        if self._dataframe is None and self._compiled is not None:
+            return self._compiled.bounds()
+        return shapely.bounds(self.dataframe.geometry.array)
+
+    @property
+    def fingerprint(self):
+        """Return a SHA-256 hex digest of the admin boundaries file content, including the shapefile sidecar files.
+        Compiled layers return the digest of the shapefile they were compiled from."""
+        if self._compiled is not None:
+            return self._compiled.fingerprint
+        if not hasattr(self, '_fingerprint'):
+            sha = hashlib.sha256()
+            base_path, extension = path.splitext(self._file_path)
+            sidecars = ['.shp', '.shx', '.dbf', '.prj', '.cpg'] if extension.lower() == '.shp' else [extension]
+            for sidecar in sidecars:
+                for file_path in (base_path + sidecar, base_path + sidecar.upper()):
+                    if path.isfile(file_path):
+                        with open(file_path, 'rb') as f:
+                            for block in iter(lambda: f.read(1 << 20), b''):
+                                sha.update(block)
+                        break
+            self._fingerprint = sha.hexdigest()
+        return self._fingerprint
+
+    @property
+    def layer_name(self):
+        """Return the file path, followed by the bbox and row_filter of a layer reading only some admin rows."""
+        if self._read_options['bbox'] is None and self._read_options['row_filter'] is None:
+            return self._file_path
+        return '{0} bbox={1} row_filter={2}'.format(self._file_path, self._read_options['bbox'],
+                                                    self._read_options['row_filter'])
+
+    @property
+    def layer_key(self):
+        """Return the fingerprint of the admin rows read, the file fingerprint combined with the bbox and row_filter of
+        a layer reading only some admin rows, so results of a filtered layer are not reused for the whole file."""
+        if self._read_options['bbox'] is None and self._read_options['row_filter'] is None:
+            return self.fingerprint
+        key = json.dumps([self.fingerprint, self._read_options['bbox'], self._read_options['row_filter']], default=str)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
     def data_column(self, col_name):
         """Return a GeoSeries of the needed admin boundaries column"""
         try:
-            return self._dataframe[col_name].str.strip()
+            return self.column(col_name).str.strip()
         except AttributeError:
             # print('The column {0} does not contain string values!'.format(col_name))
-            return self._dataframe[col_name]
+            return self.column(col_name)
+
+    def name_index(self, col_name, remove_accents=True):
+        """Return the AdminNameIndex of the admin boundaries column, building it on first use."""
+        key = (col_name, remove_accents)
+        if key not in self._name_indexes:
+            if self._compiled is not None and self._compiled.has_name_index(col_name, remove_accents):
+                self._name_indexes[key] = self._compiled.name_index(col_name, remove_accents)
+            else:
+                self._name_indexes[key] = AdminNameIndex(self.column(col_name), remove_accents)
+        return self._name_indexes[key]
+
+    def ngram_index(self, col_name, remove_accents=True):
+        """Return the NgramBlockingIndex over the normalized names of the admin column, building it on first use."""
+        key = (col_name, remove_accents)
+        if key not in self._ngram_indexes:
+            if self._compiled is not None and self._compiled.has_name_index(col_name, remove_accents):
+                self._ngram_indexes[key] = self._compiled.ngram_index(col_name, remove_accents)
+            else:
+                self._ngram_indexes[key] = NgramBlockingIndex(self.name_index(col_name, remove_accents).names)
+        return self._ngram_indexes[key]
+
+    def hierarchy(self, levels, remove_accents=True):
+        """Return the AdminHierarchy of the admin columns, from the largest admin areas to the smallest, building it
+        on first use."""
+        key = (tuple(levels), remove_accents)
+        if key not in self._hierarchies:
+            self._hierarchies[key] = AdminHierarchy(self, levels, remove_accents)
+        return self._hierarchies[key]
+
+    def centroids(self, positions, epsg, centroid_cache=None):
+        """
+        Return the centroids of the admin polygons at the row positions, reprojected to the EPSG code. Each admin
+        polygon is reprojected and its centroid computed once per EPSG code, however many rows it matched, and kept
+        for later exports of this layer.
+        :param positions: numpy array of admin boundaries row positions, repeats are broadcast.
+        :param epsg: string or integer EPSG code.
+        :param centroid_cache: optional CentroidCache keeping the centroids across runs.
+        :return: geometry array of points, one per position.
+        """
+        epsg = str(epsg).strip()
+        positions = numpy.asarray(positions, dtype=numpy.int64)
+        if epsg not in self._centroids:
+            # Columns are x, y and 1 once computed, empty polygons have NaN coordinates
+            coords = centroid_cache.load(self, epsg) if centroid_cache is not None else None
+            self._centroids[epsg] = coords if coords is not None else numpy.zeros((len(self), 3))
+        coords = self._centroids[epsg]
+        unique_positions = numpy.unique(positions)
+        missing = unique_positions[coords[unique_positions, 2] == 0]
+        if len(missing) > 0:
+            centroid_points = numpy.asarray(self.data_rows(missing).geometry.to_crs(epsg=int(epsg)).centroid.array)
+            empty = shapely.is_empty(centroid_points) | shapely.is_missing(centroid_points)
+            coords[missing, :2] = numpy.nan
+            coords[missing[~empty], :2] = shapely.get_coordinates(centroid_points[~empty])
+            coords[missing, 2] = 1
+            if centroid_cache is not None:
+                centroid_cache.save(self, epsg, coords)
+        points = shapely.points(coords[positions, :2])
+        points[numpy.isnan(coords[positions, 0])] = shapely.Point()
+        return geopandas.array.from_shapely(points, crs='EPSG:{0}'.format(epsg))
+
+    def matches_map_dataframe(self, positions, epsg, aggregate=False, centroid_cache=None):
+        """
+        GeoDataFrame of the matches map, the admin boundaries attributes with the admin polygon centroid as geometry.
+        :param positions: numpy array of the admin boundaries row position of each match.
+        :param epsg: string or integer EPSG code of the map.
+        :param aggregate: boolean, one feature per matched admin polygon with its number of matches in a Matches
+        column, instead of one feature per match.
+        :param centroid_cache: optional CentroidCache keeping the centroids across runs.
+        :return: GeoDataFrame
+        """
+        positions = numpy.asarray(positions, dtype=numpy.int64)
+        counts = None
+        if aggregate:
+            positions, counts = numpy.unique(positions, return_counts=True)
+        attributes = self.attribute_columns([col for col in self.columns if col != 'geometry']).iloc[positions]
+        map_df = geopandas.GeoDataFrame(attributes.reset_index(drop=True),
+                                        geometry=self.centroids(positions, epsg, centroid_cache))
+        if counts is not None:
+            map_df.insert(len(map_df.columns) - 1, 'Matches', counts)
+        return map_df
+
+    def data_rows(self, positions):
+        """Return a GeoDataFrame of the admin boundaries rows at the row positions, gathered without copying the rest
+        of the dataframe. Rows keep their admin boundaries index and the layer's coordinate reference system, layers
+        without one are assumed to be in EPSG:4326. Lazy layers only read the geometries of these rows."""
+        positions = numpy.asarray(positions, dtype=numpy.int64)
+        if self._dataframe is None and self._lazy_layer is not None:
+            unique_positions, inverse = numpy.unique(positions, return_inverse=True)
+            geometry = self._lazy_layer.read_geometry(unique_positions)
+            rows = geopandas.GeoDataFrame(self.attribute_columns(self._lazy_layer.columns).iloc[positions],
+                                          geometry=geometry.array[inverse], crs=geometry.crs)
+        else:
+            rows = self.dataframe.iloc[positions]
+        if rows.crs is None:
+            rows = rows.set_crs('EPSG:4326')
+        return rows
+
+    def layer_points(self, points, crs='EPSG:4326'):
+        """Return the points as a geometry array in the coordinate reference system of the admin boundaries layer."""
+        points = geopandas.GeoSeries(numpy.asarray(points, dtype=object), crs=crs)
+        if self.dataframe.crs is not None and not self.dataframe.crs.equals(points.crs):
+            points = points.to_crs(self.dataframe.crs)
+        return points.array
+
+    def containing_positions(self, points, crs='EPSG:4326'):
+        """
+        Find the admin polygon each point falls in with one bulk query of the spatial index, points on a shared
+        boundary go to the first polygon in the layer.
+        :param points: array of shapely points.
+        :param crs: coordinate reference system of the points, spreadsheet x/y columns are taken as EPSG:4326.
+        :return: numpy array of admin boundaries row positions, -1 where no polygon contains the point.
+        """
+        points = self.layer_points(points, crs)
+        positions = numpy.full(len(points), -1, dtype=numpy.int64)
+        point_ids, admin_ids = self.dataframe.sindex.query(points, predicate='covered_by')
+        if len(point_ids) > 0:
+            # Results are sorted by point, keep the lowest admin position of each point
+            order = numpy.lexsort((admin_ids, point_ids))
+            point_ids, admin_ids = point_ids[order], admin_ids[order]
+            first = numpy.concatenate(([True], point_ids[1:] != point_ids[:-1]))
+            positions[point_ids[first]] = admin_ids[first]
+        return positions
+
+    def candidate_tree(self, col_name, code, remove_accents=True):
+        """Return the STRtree over the polygons sharing the admin name with the name code, building it on first use."""
+        key = (col_name, remove_accents, code)
+        if key not in self._candidate_trees:
+            positions = self.name_index(col_name, remove_accents).positions(code)
+            self._candidate_trees[key] = shapely.STRtree(self.dataframe.geometry.array[positions])
+        return self._candidate_trees[key]
+
+    def resolve_name_positions(self, col_name, codes, points, remove_accents=True, crs='EPSG:4326'):
+        """
+        Pick the admin polygon of each name match. When several polygons share the matched name, e.g. 'San José' in
+        dozens of municipalities, a record with valid coordinates gets the candidate containing its point, or else the
+        nearest candidate. Records without coordinates get the first polygon with the name.
+        :param col_name: string for the admin boundaries column matched.
+        :param codes: numpy array of matched name codes of the AdminNameIndex.
+        :param points: array of the spreadsheet points of the matched records, same length as codes.
+        :param remove_accents: boolean, selects the AdminNameIndex.
+        :param crs: coordinate reference system of the points.
+        :return: tuple of the numpy array of admin boundaries row positions and the number of records resolved by
+        their point.
+        """
+        name_index = self.name_index(col_name, remove_accents)
+        positions = name_index.first_positions[codes]
+        ambiguous = numpy.flatnonzero(name_index.counts[codes] > 1)
+        ambiguous = ambiguous[DataUtility.valid_point_mask(numpy.asarray(points, dtype=object)[ambiguous])]
+        if len(ambiguous) == 0:
+            return positions, 0
+
+        layer_points = self.layer_points(numpy.asarray(points, dtype=object)[ambiguous], crs)
+        # Containing polygon first, one bulk query for all records, kept when it carries the matched name
+        containing = self.containing_positions(layer_points, self.dataframe.crs)
+        contained = containing >= 0
+        contained[contained] = name_index.row_codes[containing[contained]] == codes[ambiguous[contained]]
+        positions[ambiguous[contained]] = containing[contained]
+
+        # Nearest candidate for the rest, one query per name on the STRtree of its candidates
+        outside = numpy.flatnonzero(~contained)
+        outside_codes = codes[ambiguous[outside]]
+        for code in numpy.unique(outside_codes):
+            members = outside[outside_codes == code]
+            point_ids, tree_ids = self.candidate_tree(col_name, code, remove_accents).query_nearest(
+                layer_points[members], all_matches=False)
+            positions[ambiguous[members[point_ids]]] = name_index.positions(code)[tree_ids]
+        return positions, len(ambiguous)
 
     def data_row(self, objectid):
         """Return a data row in the geodataframe based on objectid"""
         if objectid >= 0:
-            return self._dataframe[objectid:objectid + 1]
+            return self.dataframe[objectid:objectid + 1]
+
+    def compile(self, out_file=None, admin_columns=None):
+        """
+        Write the compiled .geoidx file of the admin boundaries layer, see CompiledLayer.
+        :param out_file: string for the .geoidx file path, None writes it next to the shapefile.
+        :param admin_columns: list of the admin columns to index, None indexes every text column.
+        :return: string for the .geoidx file path.
+        """
+        if out_file is None:
+            out_file = path.splitext(self._file_path)[0] + GEOIDX_EXTENSION
+        if admin_columns is None:
+            admin_columns = [col for col in self.columns if col != 'geometry'
+                             and pandas.api.types.is_string_dtype(self.dataframe[col])]
+        CompiledLayer.write(self, out_file, admin_columns)
+        return out_file
 
 
 class SpreadsheetData:
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, usecols=None, sheets=None, excel_engine=None, workers=None):
         """Constructor.
 
         :param file_path: string for teh file path of the spreadsheet.
+        :param usecols: optional list of spreadsheet column names to read, matched ignoring case.
+        :param sheets: None reads the first sheet of an Excel spreadsheet, 'all' or a list of sheet names reads those.
+        :param excel_engine: string, one of EXCEL_ENGINES, None picks the fastest installed.
+        :param workers: Integer, read Excel sheets on this many worker processes when above 1.
         """
         self._file_path = sanitize_filepath(file_path,
                                             platform='auto')
 
-        self._western_europe_encodings = ('ascii', 'latin-1', 'utf-8', 'iso-8859-15', 'iso-8859-1')
+        self._western_europe_encodings = WESTERN_EUROPE_ENCODINGS
 
         # Assign encoding value ONLY ONCE to spreadsheet instance variable
         # Currently only supports western european/Latin and some Eastern European languages, uses bs4-UnicodeDammit
@@ -227,44 +1962,21 @@ class SpreadsheetData:
             self._encoding = None
 
         if path.isfile(file_path) and file_path.lower().endswith('.csv'):
-            # If detected None encoding force geopandas to read w/ 8859-1 otherwise geopandas reads w/ detected encoding
+            # If detected None encoding read w/ 8859-1 otherwise read w/ detected encoding, undecodable bytes are
+            # backslash escaped. Point geometry is filled in from x/y columns by prepare_columns below.
             try:
-                self._dataframe = geopandas.read_file(file_path, engine='python',
-                                                      encoding='iso-8859-1' if self._encoding is None else self._encoding,
-                                                      errors='backslashreplace')
+                temp_df = DataUtility.read_csv(file_path, self._encoding,
+                                               **self.csv_usecols_kwargs(file_path, self._encoding, usecols))
             except UnicodeDecodeError as ue:
                 print('UnicodeDecodeError {0} at line {1}'.format(ue, ue.__traceback__.tb_lineno))
-                # Force geopandas to read with encoding ISO-8859-1 as this won't raise an error.
-                self._dataframe = geopandas.read_file(file_path, engine='python',
-                                                      encoding='iso-8859-1')
-            except Exception as e:
-                print('Exception {0} at line {1}'.format(e, e.__traceback__.tb_lineno))
-
-            # To prevent fillna error when running fuzzy matching to a GeoDataframe created from CSV file
-            self._dataframe['geometry'] = self._dataframe['geometry'].fillna(value=None)
-
-            # Only try to decode byte characters in CSV file because CSV was opened with detected encoding.
-            if self.encoding is not None:
-                for col in self._dataframe.columns:
-                    if col != 'geometry':
-                        for val in col:
-                            if isinstance(val, bytes):
-                                try:
-                                    val = val.decode(self.encoding)
-                                except UnicodeDecodeError as ue:
-                                    print('UnicodeDecodeError {0} at {1} line # {2}'.format(ue, val,
-                                                                                            ue.__traceback__.tb_lineno))
-                                    val = val.decode('iso-8859-1')
-                                    continue
-                                except Exception as e:
-                                    print('Exception {0} encountered at line {1}'.format(e, e.__traceback__.tb_lineno))
-                                    continue
+                # Force reading with encoding ISO-8859-1 as this won't raise an error.
+                temp_df = DataUtility.read_csv(file_path, None, **self.csv_usecols_kwargs(file_path, None, usecols))
+            self._dataframe = geopandas.GeoDataFrame(temp_df, geometry=DataUtility.sentinel_points(len(temp_df)))
 
         elif path.isfile(file_path) and (file_path.lower().endswith('.xls') or file_path.lower().endswith('.xlsx')):
-            # Must read Excel format with Pandas first and then convert to GeoDataFrame
-            self._dataframe = pandas.read_excel(file_path)
-            self.to_geodataframe()
-            print(type(self._dataframe))
+            # Excel sheets are read like CSV files, point geometry is filled in from x/y columns by prepare_columns
+            temp_df = DataUtility.read_excel(file_path, excel_engine, usecols, sheets, workers)
+            self._dataframe = geopandas.GeoDataFrame(temp_df, geometry=DataUtility.sentinel_points(len(temp_df)))
 
         else:
             print(
@@ -272,6 +1984,69 @@ class SpreadsheetData:
                     .format(file_path))
             exit()
 
+        self.prepare_columns()
+
+    @classmethod
+    def from_dataframe(cls, data_frame, file_path='', encoding=None, prepared=False):
+        """
+        Create a SpreadsheetData from an already loaded Pandas dataframe, e.g. one chunk of a large CSV file.
+        :param data_frame: Pandas dataframe of the spreadsheet rows.
+        :param file_path: string for the file path the rows were read from.
+        :param encoding: string for the detected encoding of the file.
+        :param prepared: boolean, data_frame is a GeoDataFrame taken from another SpreadsheetData, e.g. a shard of rows
+        matched in a worker process, and is used as is.
+        :return: SpreadsheetData
+        """
+        spreadsheet = cls.__new__(cls)
+        spreadsheet._file_path = file_path
+        spreadsheet._western_europe_encodings = WESTERN_EUROPE_ENCODINGS
+        spreadsheet._encoding = encoding
+        if prepared:
+            spreadsheet._dataframe = data_frame
+            spreadsheet.has_geom_col = 1
+            return spreadsheet
+        spreadsheet._dataframe = geopandas.GeoDataFrame(data_frame,
+                                                        geometry=DataUtility.sentinel_points(len(data_frame)))
+        spreadsheet.prepare_columns()
+        return spreadsheet
+
+    @staticmethod
+    def csv_usecols_kwargs(file_path, encoding, usecols):
+        """Return the read_csv usecols argument of the usecols column names, matched ignoring case against the CSV
+        header row, as a dictionary of keyword arguments. The pyarrow engine only takes a list of the header names."""
+        if not usecols:
+            return {}
+        keep = DataUtility.usecols_filter(usecols)
+        header = DataUtility.read_csv(file_path, encoding, engine='c', nrows=0).columns
+        return {'usecols': [col for col in header if keep(col)]}
+
+    @classmethod
+    def iter_csv_chunks(cls, file_path, chunksize=DEFAULT_CSV_CHUNKSIZE, sample_size=ENCODING_SAMPLE_BYTES,
+                        usecols=None):
+        """
+        Read a CSV spreadsheet chunk by chunk so that only one chunk is held in memory at a time.
+        The encoding is detected from the first sample_size bytes of the file only.
+        :param file_path: string for the file path of the CSV spreadsheet.
+        :param chunksize: Integer, number of spreadsheet rows per chunk.
+        :param sample_size: Integer, number of bytes used to detect the encoding.
+        :param usecols: optional list of spreadsheet column names to read, matched ignoring case.
+        :return: generator of SpreadsheetData, one per chunk. Row labels keep counting across chunks.
+        """
+        if not path.isfile(file_path):
+            print('The file {0} could not be located! Please ensure you entered the correct spreadsheet file path!'
+                  .format(file_path))
+            exit()
+        encoding = DataUtility.get_file_encoding(file_path, sample_size)
+        print('UnicodeDammit detected {0} encoding from the first {1} bytes of {2}'.format(encoding, sample_size,
+                                                                                          file_path))
+        for chunk in DataUtility.read_csv(file_path, encoding, chunksize=chunksize,
+                                          **cls.csv_usecols_kwargs(file_path, encoding, usecols)):
+            yield cls.from_dataframe(chunk, file_path, encoding)
+
+    def prepare_columns(self):
+        """
+        Clean up column headers and load coordinates into the geometry column. This is a void type function.
+        """
         # Convert all column headers to lower case for easy matching by get_xy_col_locations function
         if isinstance(self._dataframe, geopandas.geodataframe.GeoDataFrame) and 'geometry' in self._dataframe.columns:
             # Convert column names to lower case and strip white space
@@ -371,9 +2146,7 @@ class SpreadsheetData:
         """
         if isinstance(self._dataframe, pandas.core.frame.DataFrame):
 
-            temp_array = numpy.full(len(self._dataframe), fill_value=-1.0)
-            gdf = geopandas.GeoDataFrame(self._dataframe,
-                                         geometry=geopandas.points_from_xy(x=temp_array, y=temp_array))
+            gdf = geopandas.GeoDataFrame(self._dataframe, geometry=DataUtility.sentinel_points(len(self._dataframe)))
             self._dataframe = gdf
 
             # if has x y in columns etc.
@@ -390,15 +2163,11 @@ class SpreadsheetData:
                     or 'latitude' and 'longitude' in self._dataframe.columns:
                 xy_col_locs = self.get_xy_col_locations()
                 if xy_col_locs is not None and len(xy_col_locs) == 2:
-                    # Cast as string type first
-                    temp_x_coords = self._dataframe.iloc[:, xy_col_locs[0]].astype(str)
-                    temp_y_coords = self._dataframe.iloc[:, xy_col_locs[1]].astype(str)
-
                     # Make sure they're all float type before creating Point geometry values
                     # Invalid Coordinates are flagged as x = -1.0 and y = -1.0
-                    temp_x_coords = temp_x_coords.apply(lambda x: float(x) if DataUtility.is_float_(x) else -1.0)
-                    temp_y_coords = temp_y_coords.apply(lambda y: float(y) if DataUtility.is_float_(y) else -1.0)
-                    self._dataframe['geometry'] = geopandas.points_from_xy(x=temp_x_coords, y=temp_y_coords)
+                    temp_x_coords = DataUtility.parse_coordinates(self._dataframe.iloc[:, xy_col_locs[0]])
+                    temp_y_coords = DataUtility.parse_coordinates(self._dataframe.iloc[:, xy_col_locs[1]])
+                    self._dataframe['geometry'] = DataUtility.points_from_valid_xy(temp_x_coords, temp_y_coords)
                     print(
                         'X and Y or Lat and Long values were detected in the spreadsheet file and assigned to Geometry column!')
             else:
@@ -418,43 +2187,347 @@ class Report:
             self._spreadsheet_dataframe = spreadsheet_dataframe
             self._admin_dataframe = admin_dataframe
             self._joined_dataframe = None
+            self._write_stats = None
+
+    @property
+    def joined_dataframe(self):
+        return self._joined_dataframe
+
+    @property
+    def write_stats(self):
+        """Return a dictionary of the file, format, rows, worksheets, seconds and rows_per_second of the last saved
+        report, None before a report is saved."""
+        return self._write_stats
 
     def join_dataframes(self):
         # To prevent ValueError where columns overlap
         del self._spreadsheet_dataframe['geometry']
-        self._joined_dataframe = self._spreadsheet_dataframe.join(self._admin_dataframe.set_index('Index'), on='Index',
-                                                                  how='inner')
-
-    def save_report(self):
+        if self.rows_aligned():
+            # Row i of both dataframes is match i, the admin columns are put next to the spreadsheet columns as they
+            # are, no hash join and no change of dtypes
+            admin_dataframe = self._admin_dataframe.drop(columns='Index')
+            overlap = self._spreadsheet_dataframe.columns.intersection(admin_dataframe.columns)
+            if len(overlap) > 0:
+                raise ValueError('columns overlap but no suffix specified: {0}'.format(overlap))
+            admin_dataframe.index = self._spreadsheet_dataframe.index
+            self._joined_dataframe = pandas.concat([pandas.DataFrame(self._spreadsheet_dataframe),
+                                                    pandas.DataFrame(admin_dataframe)], axis=1)
+        else:
+            self._joined_dataframe = self._spreadsheet_dataframe.join(self._admin_dataframe.set_index('Index'),
+                                                                      on='Index', how='inner')
+
+    def rows_aligned(self):
+        """Return True when the spreadsheet and admin dataframes hold the same matches in the same order, as built by
+        MatchedData.get_spreadsheet_report_dataframe and MatchedData.get_matched_admin_dataframe."""
+        return len(self._spreadsheet_dataframe) == len(self._admin_dataframe) and \
+            'Index' in self._spreadsheet_dataframe.columns and 'Index' in self._admin_dataframe.columns and \
+            'geometry' in self._admin_dataframe.columns and \
+            numpy.array_equal(self._spreadsheet_dataframe['Index'].to_numpy(), self._admin_dataframe['Index'].to_numpy())
+
+    def save_report(self, out_file=None, report_format='excel'):
         # Message strings are returned so that it can be passed to GUI window, or to console print statement
+        # out_file defaults to a time stamped file name in the output folder
+        # report_format is one of REPORT_FORMATS, write_stats holds the rows written per second
         if self._joined_dataframe is not None:
-            out_file = path.join(DataUtility.get_output_path(),
-                                 'match_excel_report_{0}.xlsx'.format(DataUtility.get_file_time_stamp()))
-            self._joined_dataframe.to_excel(out_file)
-            return 'The report of spreadsheet records matched' \
-                   '\nto the admin boundaries shapefile data has been saved at: {0}'.format(out_file)
+            if report_format == 'parquet' and pyarrow is None:
+                return 'Writing Parquet reports needs pyarrow, install it with: pip install pyarrow'
+            if out_file is None:
+                out_file = path.join(DataUtility.get_output_path(), 'match_{0}_report_{1}{2}'.format(
+                    report_format, DataUtility.get_file_time_stamp(), REPORT_FORMATS[report_format]))
+            start = time.perf_counter()
+            worksheets = 1
+            if report_format == 'csv':
+                self.write_csv(out_file)
+            elif report_format == 'parquet':
+                self.write_parquet(out_file)
+            else:
+                worksheets = self.write_excel(out_file)
+            seconds = time.perf_counter() - start
+            rows = len(self._joined_dataframe)
+            self._write_stats = {'file': out_file, 'format': report_format, 'rows': rows, 'worksheets': worksheets,
+                                 'seconds': round(seconds, 3), 'rows_per_second': round(rows / max(seconds, 1e-6))}
+            msg = 'The report of spreadsheet records matched' \
+                  '\nto the admin boundaries shapefile data has been saved at: {0}'.format(out_file)
+            if worksheets > 1:
+                msg += '\nThe {0} matches are split over {1} worksheets of up to {2} rows.'.format(
+                    rows, worksheets, EXCEL_MAX_ROWS - 1)
+            return msg + '\n{0} rows written in {1:.2f}s ({2} rows/s).'.format(rows, seconds,
+                                                                             self._write_stats['rows_per_second'])
         else:
             return 'Unable to save the report of spreadsheet\nrecords matched to the admin boundaries shapefile data' \
                    '\nbecause the joined dataframe is None.'
 
+    def write_excel(self, out_file):
+        """
+        Write the joined dataframe to an Excel file, laid out like DataFrame.to_excel with the row number column
+        first. With xlsxwriter rows are streamed in constant memory mode, EXCEL_WRITE_BLOCK_ROWS rows converted to
+        cell values at a time, instead of building the whole workbook in memory with openpyxl. Reports past the
+        EXCEL_MAX_ROWS worksheet limit continue on Sheet2, Sheet3 and so on.
+        :param out_file: string for the Excel file path.
+        :return: integer, number of worksheets written.
+        """
+        data_frame = self._joined_dataframe
+        sheet_rows = EXCEL_MAX_ROWS - 1
+        sheet_starts = range(0, max(len(data_frame), 1), sheet_rows)
+        if xlsxwriter is None:
+            with pandas.ExcelWriter(out_file) as writer:
+                for sheet_num, sheet_start in enumerate(sheet_starts):
+                    Report.excel_ready_dataframe(data_frame.iloc[sheet_start:sheet_start + sheet_rows]).to_excel(
+                        writer, sheet_name='Sheet{0}'.format(sheet_num + 1))
+            return len(sheet_starts)
+
+        # Spreadsheet text is written as text, not turned into formulas, links or numbers. Every date and datetime
+        # cell, of datetime64 or object columns, gets the date number format
+        workbook = xlsxwriter.Workbook(out_file, {'constant_memory': True, 'strings_to_formulas': False,
+                                                  'strings_to_urls': False, 'strings_to_numbers': False,
+                                                  'default_date_format': 'yyyy-mm-dd hh:mm:ss'})
+        header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        for sheet_num, sheet_start in enumerate(sheet_starts):
+            worksheet = workbook.add_worksheet('Sheet{0}'.format(sheet_num + 1))
+            worksheet.write_row(0, 1, [str(col) for col in data_frame.columns], header_format)
+            sheet_end = min(sheet_start + sheet_rows, len(data_frame))
+            for block_start in range(sheet_start, sheet_end, EXCEL_WRITE_BLOCK_ROWS):
+                block = data_frame.iloc[block_start:min(block_start + EXCEL_WRITE_BLOCK_ROWS, sheet_end)]
+                columns = [Report.excel_cell_values(block.index.to_series())] + \
+                          [Report.excel_cell_values(block.iloc[:, col_num]) for col_num in range(block.shape[1])]
+                for row_num, row in enumerate(zip(*columns), block_start - sheet_start + 1):
+                    worksheet.write_row(row_num, 0, row)
+        workbook.close()
+        return len(sheet_starts)
+
+    @staticmethod
+    def excel_cell_values(series):
+        """Return the values of a column as a list of cell values xlsxwriter can write: geometries as WKT, dates
+        without time zone, missing values as None (empty cells) and other objects as text."""
+        if isinstance(series.dtype, geopandas.array.GeometryDtype):
+            return shapely.to_wkt(series.array, rounding_precision=-1).tolist()
+        if pandas.api.types.is_datetime64_any_dtype(series.dtype) and getattr(series.dt, 'tz', None) is not None:
+            series = series.dt.tz_localize(None)
+        values = series.astype(object).where(series.notna(), None).tolist()
+        if series.dtype == object:
+            values = [val if val is None or isinstance(val, (str, bool, int, float, datetime.date)) else str(val)
+                      for val in values]
+        return values
+
+    @staticmethod
+    def excel_ready_dataframe(data_frame):
+        """Return the dataframe with geometry columns as WKT text, which openpyxl can write."""
+        geometry_cols = [col for col in data_frame.columns
+                         if isinstance(data_frame[col].dtype, geopandas.array.GeometryDtype)]
+        if geometry_cols:
+            data_frame = pandas.DataFrame(data_frame).assign(**{col: shapely.to_wkt(data_frame[col].array,
+                                                                                    rounding_precision=-1)
+                                                                for col in geometry_cols})
+        return data_frame
+
+    def write_csv(self, out_file):
+        """Write the joined dataframe to a CSV file. Admin polygons are left out, the matches shapefile holds the
+        geometry."""
+        self._joined_dataframe.drop(columns='geometry', errors='ignore').to_csv(out_file, index=False)
+
+    def write_parquet(self, out_file):
+        """Write the joined dataframe to a GeoParquet file, with the admin polygons in the admin boundaries coordinate
+        reference system."""
+        data_frame = self._joined_dataframe
+        if 'geometry' in data_frame.columns:
+            data_frame = geopandas.GeoDataFrame(data_frame, geometry='geometry', crs=self._admin_dataframe.crs)
+        try:
+            data_frame.to_parquet(out_file, index=False)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            # Spreadsheet columns mixing text and numbers are written as text
+            object_cols = [col for col in data_frame.columns if data_frame[col].dtype == object]
+            data_frame = data_frame.assign(**{col: data_frame[col].where(data_frame[col].isna(),
+                                                                         data_frame[col].astype(str))
+                                              for col in object_cols})
+            data_frame.to_parquet(out_file, index=False)
+
+
+# Number of n-gram blocking candidates scored per fuzzy query, see NgramBlockingIndex
+DEFAULT_FUZZY_TOP_K = 200
+
+# How a spreadsheet row was matched, MatchRow.match_method and the <method>_matches entries of MatchedData.match_stats
+MATCH_METHODS = ('spatial', 'hierarchical', 'strict', 'fuzzy')
+
+# Matched record returned by MatchedData.matched_data_dict, created once at module level instead of once per match
+# admin_position is the row position of shp_data in the admin boundaries dataframe
+MatchRow = namedtuple('MatchRow', ['shp_data', 'sheet_data', 'admin_position', 'match_method'],
+                      defaults=['strict'])
+
+
+class MatchResultStore:
+    """
+    Columnar store of the matches of a spreadsheet, in match order. Each match is an int32 spreadsheet row position,
+    int32 admin boundaries row position, float32 score, int8 source column (position in MatchedData.match_columns, -1
+    when no single column decided the match, e.g. spatial and hierarchical matches) and int8 match method code
+    (position in MATCH_METHODS), plus an int32 slot per spreadsheet row. That is a few bytes per row where a dictionary
+    of namedtuples holding a numpy row and a Pandas series per match took kilobytes.
+    """
+
+    def __init__(self, row_count):
+        """Constructor.
+        :param row_count: integer, number of spreadsheet rows.
+        """
+        self._size = 0
+        self._row_positions = numpy.empty(0, dtype=numpy.int32)
+        self._admin_positions = numpy.empty(0, dtype=numpy.int32)
+        self._scores = numpy.empty(0, dtype=numpy.float32)
+        self._source_columns = numpy.empty(0, dtype=numpy.int8)
+        self._method_codes = numpy.empty(0, dtype=numpy.int8)
+        # Position of each spreadsheet row's match in the arrays above, -1 while the row is not matched
+        self._slots = numpy.full(row_count, -1, dtype=numpy.int32)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, row_positions, admin_positions, scores, source_columns=-1, match_method='strict'):
+        """
+        Add matches, a row matched again keeps its place in match order and takes the new match.
+        :param row_positions: numpy array of matched spreadsheet row positions.
+        :param admin_positions: numpy array of the matched admin boundaries row positions.
+        :param scores: numpy array or scalar of match scores.
+        :param source_columns: numpy array or scalar of the matched spreadsheet column positions, -1 for none. Columns
+        past the int8 range are stored as -1.
+        :param match_method: string, one of MATCH_METHODS.
+        """
+        row_positions = numpy.asarray(row_positions, dtype=numpy.int64)
+        slots = self._slots[row_positions].astype(numpy.int64)
+        new = slots < 0
+        new_count = int(numpy.count_nonzero(new))
+        self.reserve(self._size + new_count)
+        slots[new] = numpy.arange(self._size, self._size + new_count)
+        self._slots[row_positions[new]] = slots[new]
+        self._size += new_count
+
+        source_columns = numpy.asarray(source_columns, dtype=numpy.int64)
+        self._row_positions[slots] = row_positions
+        self._admin_positions[slots] = admin_positions
+        self._scores[slots] = scores
+        self._source_columns[slots] = numpy.where(source_columns <= numpy.iinfo(numpy.int8).max, source_columns, -1)
+        self._method_codes[slots] = MATCH_METHODS.index(match_method)
+
+    def reserve(self, capacity):
+        """Grow the arrays to hold at least capacity matches, doubling so adding matches stays amortized O(1)."""
+        if capacity <= len(self._row_positions):
+            return
+        capacity = max(capacity, 2 * len(self._row_positions), 1024)
+        for name in ('_row_positions', '_admin_positions', '_scores', '_source_columns', '_method_codes'):
+            values = numpy.empty(capacity, dtype=getattr(self, name).dtype)
+            values[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, values)
+
+    def _view(self, values):
+        view = values[:self._size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def row_positions(self):
+        return self._view(self._row_positions)
+
+    @property
+    def admin_positions(self):
+        return self._view(self._admin_positions)
+
+    @property
+    def scores(self):
+        return self._view(self._scores)
+
+    @property
+    def source_columns(self):
+        return self._view(self._source_columns)
+
+    @property
+    def method_codes(self):
+        return self._view(self._method_codes)
+
+    @property
+    def nbytes(self):
+        """Return the number of bytes used by the arrays."""
+        return sum(values.nbytes for values in (self._row_positions, self._admin_positions, self._scores,
+                                                self._source_columns, self._method_codes, self._slots))
+
+    def match_methods(self):
+        """Return a numpy array of the match method name of each match."""
+        return numpy.asarray(MATCH_METHODS, dtype=object)[self.method_codes]
+
+    def matched_mask(self):
+        """Return a boolean numpy array, True for the matched spreadsheet rows."""
+        return self._slots >= 0
+
+    def slot(self, row_position):
+        """Return the position of a spreadsheet row's match in match order, -1 when the row is not matched."""
+        return int(self._slots[row_position])
+
+
+class MatchedRowsView(Mapping):
+    """
+    Read-only mapping of spreadsheet row labels to MatchRow, in match order, for code written against the
+    matched_data_dict dictionary. Nothing is kept per row, each MatchRow is built from the MatchResultStore when it
+    is looked up, with the current spreadsheet row labels.
+    """
+
+    def __init__(self, matched_data):
+        """Constructor.
+        :param matched_data: MatchedData whose match_results are viewed.
+        """
+        self._matched_data = matched_data
+
+    def __len__(self):
+        return len(self._matched_data.match_results)
+
+    def __iter__(self):
+        data_frame = self._matched_data.spreadsheet_data.data_frame
+        return iter(data_frame.index[self._matched_data.match_results.row_positions].tolist())
+
+    def slot(self, row_label):
+        """Return the match order position of the row label, -1 when it is not matched."""
+        try:
+            row_position = self._matched_data.spreadsheet_data.data_frame.index.get_loc(row_label)
+        except (KeyError, TypeError):
+            return -1
+        return self._matched_data.match_results.slot(row_position) if isinstance(row_position, int) else -1
+
+    def __contains__(self, row_label):
+        return self.slot(row_label) >= 0
+
+    def __getitem__(self, row_label):
+        slot = self.slot(row_label)
+        if slot < 0:
+            raise KeyError(row_label)
+        results = self._matched_data.match_results
+        data_frame = self._matched_data.spreadsheet_data.data_frame
+        admin_position = int(results.admin_positions[slot])
+        # Scores are whole numbers, stored as float32
+        sheet_data = pandas.Series([row_label] + data_frame.iloc[int(results.row_positions[slot])].tolist()
+                                   + [int(round(float(results.scores[slot])))],
+                                   index=['Index'] + list(data_frame.columns) + ['Match_Score'])
+        return MatchRow(shp_data=self._matched_data.adm_boundaries.row_values([admin_position])[0],
+                        sheet_data=sheet_data, admin_position=admin_position,
+                        match_method=MATCH_METHODS[results.method_codes[slot]])
+
 
 class MatchedData:
     """
     This class represents any matches between the spreadsheet data and the admin boundaries data
     """
 
-    def __init__(self, spreadsheet_data, adm_boundaries):
+    def __init__(self, spreadsheet_data, adm_boundaries, fuzzy_scorer=None, fuzzy_cache=None):
         """Constructor.
         :param spreadsheet_data: string for spreadsheet data file
         :param adm_boundaries: string for the admin boundaries shapefile
+        :param fuzzy_scorer: string 'rapidfuzz' or 'thefuzz', or a scorer instance. None picks the fastest installed.
+        :param fuzzy_cache: optional FuzzyMatchCache reused across runs to skip already scored text.
         """
         self._admin_choice = None
         self._spreadsheet_data = spreadsheet_data
         self._adm_boundaries = adm_boundaries
+        self.fuzzy_scorer = fuzzy_scorer
+        self._fuzzy_cache = fuzzy_cache
 
-        # Stores matched data according to spreadsheet row, value is namedtuple('row_data', ['shp_data', 'sheet_data'])
-        self._matched_data_dict = OrderedDict()
+        # Stores the matches in a MatchResultStore, created on first use, matched_data_dict is a read-only view of it
+        self._match_results = None
         self._unmatched_data_dict = OrderedDict()
+        self._match_stats = OrderedDict()
 
     @property
     def spreadsheet_data(self):
@@ -472,14 +2545,39 @@ class MatchedData:
     def matched_admin_dict(self):
         return self._matched_admin_dict
 
+    @property
+    def match_results(self):
+        """Return the MatchResultStore of the matches."""
+        if self._match_results is None:
+            self._match_results = MatchResultStore(
+                len(self._spreadsheet_data.data_frame) if self._spreadsheet_data is not None else 0)
+        return self._match_results
+
     @property
     def matched_data_dict(self):
-        return self._matched_data_dict
+        """Return the read-only mapping of spreadsheet row labels to MatchRow, see MatchedRowsView."""
+        return MatchedRowsView(self)
 
     @property
     def unmatched_data_dict(self):
         return self._unmatched_data_dict
 
+    @property
+    def fuzzy_scorer(self):
+        return self._fuzzy_scorer
+
+    @fuzzy_scorer.setter
+    def fuzzy_scorer(self, value):
+        self._fuzzy_scorer = value if hasattr(value, 'best_matches') else get_fuzzy_scorer(value)
+
+    @property
+    def fuzzy_cache(self):
+        return self._fuzzy_cache
+
+    @fuzzy_cache.setter
+    def fuzzy_cache(self, value):
+        self._fuzzy_cache = value
+
     @property
     def admin_choice(self):
         return self._admin_choice
@@ -493,8 +2591,8 @@ class MatchedData:
         Get Admin choices
         :return: dictionary with keys storing column indices, and values storing admin boundary column names
         """
-        columns_dict = dict(zip([str(self._adm_boundaries.dataframe.columns.get_loc(c)) for c in
-                                 self._adm_boundaries.dataframe.columns], self._adm_boundaries.dataframe.columns))
+        columns_dict = dict(zip([str(self._adm_boundaries.columns.get_loc(c)) for c in
+                                 self._adm_boundaries.columns], self._adm_boundaries.columns))
         return columns_dict
 
     def selected_admin_choice(self):
@@ -511,19 +2609,37 @@ class MatchedData:
 
     def get_spreadsheet_report_dataframe(self):
         """
-        Dataframe used for generating Excel file match report, passed to the Report class
-        """
-        if len(self._matched_data_dict) > 0:
-            '''old version temp_list = [v[1] for k,v in self._matched_data_dict.items() ]
-            new ver w/ NamedTuple temp_list = [val.sheet_data for key, val in self._matched_data_dict.items()]
-            debug print('Temp_List for MatcheData.get_spreadsheet_report_dataframe {0}'.format(temp_list))'''
-            temp_list = [val.sheet_data for key, val in self._matched_data_dict.items()]
-            temp_df = pandas.concat(temp_list, axis=1).transpose()
-            temp_geom_array = numpy.full(len(temp_df), fill_value=-1.0)
-            temp_gdf = geopandas.GeoDataFrame(temp_df, geometry=geopandas.points_from_xy(
-                x=temp_geom_array, y=temp_geom_array))
+        Dataframe used for generating Excel file match report, passed to the Report class. The matched spreadsheet
+        rows in matched_data_dict order, gathered by row position so every column keeps its dtype, with the row
+        label in the Index column and the Match_Score column last.
+        """
+        '''old version built one Pandas series per match and
+        temp_df = pandas.concat(temp_list, axis=1).transpose(), all columns ended up with the object dtype'''
+        results = self.match_results
+        temp_gdf = self._spreadsheet_data.data_frame.iloc[results.row_positions]
+        temp_gdf = temp_gdf.reset_index(drop=True)
+        if temp_gdf.crs is None:
+            temp_gdf = temp_gdf.set_crs('EPSG:4326')
+        temp_gdf.insert(0, 'Index', self.matched_row_labels())
+        # Scores are whole numbers, stored as float32
+        temp_gdf['Match_Score'] = numpy.rint(results.scores).astype(numpy.int64)
         return temp_gdf
 
+    def matched_row_labels(self):
+        """Return the spreadsheet row labels of the matches as a numpy array, in matched_data_dict order."""
+        return self._spreadsheet_data.data_frame.index[self.match_results.row_positions].to_numpy()
+
+    def matched_admin_positions(self):
+        """Return a numpy array of the admin boundaries row position of each match, in matched_data_dict order."""
+        return self.match_results.admin_positions.astype(numpy.int64)
+
+    def get_matched_admin_dataframe(self):
+        """
+        GeoDataFrame of the admin boundaries row of each match, in matched_data_dict order, used for the Excel report
+        and the matches shapefile.
+        """
+        return self._adm_boundaries.data_rows(self.matched_admin_positions()).reset_index(drop=True)
+
     def array_to_series(self, row, score):
         """Convert filtered ndarray from dataframe to Pandas series, inserts match score in the returned Pandas series.
         :param row: ndarray of the matched row.
@@ -535,131 +2651,346 @@ class MatchedData:
         row_series['Match_Score'] = score
         return row_series
 
+    def remove_accents(self):
+        """Only remove accents on Western European/Latin type languages."""
+        return self._spreadsheet_data.encoding in self._spreadsheet_data.western_europe_encodings
+
+    @property
+    def match_stats(self):
+        """Return a dictionary of statistics of the match runs, e.g. cell and distinct value counts."""
+        return self._match_stats
+
+    def fuzzy_query(self, text):
+        """
+        Process a cell value into a fuzzy query. The cell is normalized like the admin names first, so an accented
+        letter is transliterated on both sides instead of being dropped from the query by DataUtility.fuzzy_process.
+        :param text: spreadsheet cell value.
+        :return: string of the fuzzy query.
+        """
+        return DataUtility.fuzzy_process(DataUtility.normalize_text(text, self.remove_accents()))
+
+    @staticmethod
+    def distinct_cell_values(data_frame, columns, transform):
+        """
+        Factorize the cells of the columns so every distinct cell value is transformed and matched only once.
+        :param data_frame: Pandas dataframe of the spreadsheet rows to match.
+        :param columns: list of column names to search.
+        :param transform: function applied to each distinct non-empty cell value, e.g. AdminNameIndex.normalize.
+        :return: tuple of a (rows x columns) numpy array of value codes, -1 for empty cells, and the numpy array of
+        distinct transformed values the codes point to.
+        """
+        value_codes = numpy.full((len(data_frame), len(columns)), -1, dtype=numpy.int64)
+        transformed = []
+        for j, col in enumerate(columns):
+            codes, uniques = pandas.factorize(data_frame[col])
+            value_codes[:, j] = numpy.where(codes >= 0, codes + len(transformed), -1)
+            transformed.extend(transform(val) for val in uniques)
+        # Different raw values can share a transformed value, e.g. 'San José' and 'san jose ', merge those too
+        merged_codes, distinct_values = pandas.factorize(pandas.Series(transformed, dtype=object))
+        value_codes = DataUtility.broadcast_codes(value_codes, merged_codes)
+        return value_codes, numpy.asarray(distinct_values, dtype=object)
+
+    def record_dedup_stats(self, match_type, value_codes, distinct_values):
+        """Store and print how many cells were matched through how many distinct values."""
+        cells = int(numpy.count_nonzero(value_codes >= 0))
+        dedup_ratio = cells / len(distinct_values) if len(distinct_values) > 0 else 0.0
+        self._match_stats['{0}_cells'.format(match_type)] = cells
+        self._match_stats['{0}_distinct_values'.format(match_type)] = len(distinct_values)
+        self._match_stats['{0}_dedup_ratio'.format(match_type)] = dedup_ratio
+        print('{0} match: {1} non-empty cells share {2} distinct values, dedup ratio {3:.1f}x'.format(
+            match_type.capitalize(), cells, len(distinct_values), dedup_ratio))
+
+    def match_columns(self):
+        """Return the spreadsheet column names searched for admin names, every column except geometry."""
+        return [col for col in self._spreadsheet_data.data_frame.columns if col != 'geometry']
+
+    def pending_row_positions(self):
+        """Return a numpy array of the positions of the spreadsheet rows not matched yet."""
+        return numpy.flatnonzero(~self.match_results.matched_mask())
+
+    def add_matches(self, row_positions, admin_positions, scores, match_method='strict', source_columns=-1):
+        """Add matched spreadsheet rows to the match_results.
+        :param row_positions: numpy array of matched spreadsheet row positions.
+        :param admin_positions: numpy array of the matched admin boundaries row positions.
+        :param scores: numpy array or scalar of match scores.
+        :param match_method: string, one of MATCH_METHODS.
+        :param source_columns: numpy array or scalar of the positions in match_columns of the matched spreadsheet
+        columns, -1 when no single column decided the match.
+        """
+        stats_key = '{0}_matches'.format(match_method)
+        self._match_stats[stats_key] = self._match_stats.get(stats_key, 0) + len(row_positions)
+        self.match_results.add(row_positions, admin_positions, scores, source_columns, match_method)
+        if len(self._unmatched_data_dict) > 0:
+            for row_label in self._spreadsheet_data.data_frame.index[row_positions]:
+                self._unmatched_data_dict.pop(row_label, None)
+
+    def refresh_unmatched_rows(self):
+        """Rebuild unmatched_data_dict from the spreadsheet rows not matched yet."""
+        self._unmatched_data_dict = OrderedDict()
+        for row in self._spreadsheet_data.data_frame.iloc[self.pending_row_positions()].itertuples():
+            self._unmatched_data_dict[row.Index] = row
+
+    def merge_match_stats(self, shard_stats):
+        """Add up the match_stats of shards of this spreadsheet, matched separately e.g. by a ParallelMatcher.
+        Counts are summed, dedup ratios are recomputed from the summed counts and means are averaged. The
+        <method>_matches counts are left out, add_matches counts them when the shard matches are added."""
+        for stats in shard_stats:
+            for key, val in stats.items():
+                if not key.endswith(('_dedup_ratio', '_mean_candidates', '_matches')):
+                    self._match_stats[key] = self._match_stats.get(key, 0) + val
+        for key in set(key for stats in shard_stats for key in stats):
+            if key.endswith('_mean_candidates'):
+                self._match_stats[key] = float(numpy.mean([stats[key] for stats in shard_stats if key in stats]))
+            elif key.endswith('_dedup_ratio'):
+                match_type = key[:-len('_dedup_ratio')]
+                distinct_values = self._match_stats.get('{0}_distinct_values'.format(match_type), 0)
+                self._match_stats[key] = self._match_stats.get('{0}_cells'.format(match_type), 0) / distinct_values \
+                    if distinct_values > 0 else 0.0
+
+    def name_match_positions(self, row_positions, codes):
+        """Return the admin boundaries row positions of name matches, duplicate admin names are resolved with the
+        coordinates of the spreadsheet rows when they have some.
+        :param row_positions: numpy array of matched spreadsheet row positions.
+        :param codes: numpy array of the matched AdminNameIndex name codes.
+        """
+        points = self._spreadsheet_data.data_frame.geometry.array[row_positions]
+        positions, resolved = self._adm_boundaries.resolve_name_positions(self._admin_choice, codes, points,
+                                                                          self.remove_accents())
+        self._match_stats['resolved_by_point'] = self._match_stats.get('resolved_by_point', 0) + resolved
+        if resolved > 0:
+            print('{0} matches to admin names shared by several polygons were resolved with the record '
+                  'coordinates.'.format(resolved))
+        return positions
+
+    def run_spatial_match(self):
+        """Point in polygon match, assigns each spreadsheet record with valid x/y or lat/long coordinates to the admin
+        polygon containing it. Records without coordinates, flagged as POINT (-1 -1), or outside every polygon are left
+        for run_strict_match and run_fuzzy_match to match by name."""
+        print('MatchData - checking which admin boundaries polygon contains each spreadsheet point...')
+        pending = self.pending_row_positions()
+        geometry = self._spreadsheet_data.data_frame.geometry.array[pending]
+        pending = pending[DataUtility.valid_point_mask(geometry)]
+        self._match_stats['spatial_points'] = len(pending)
+        admin_positions = self._adm_boundaries.containing_positions(
+            self._spreadsheet_data.data_frame.geometry.array[pending])
+        matched = admin_positions >= 0
+        self.add_matches(pending[matched], admin_positions[matched], 100, match_method='spatial')
+        print('Added {0} of {1} Spreadsheet rows with valid coordinates to matches!'.format(
+            int(numpy.count_nonzero(matched)), len(pending)))
+
+    def print_match_sources(self):
+        """Print how many spreadsheet records were matched spatially and how many by name."""
+        spatial = self._match_stats.get('spatial_matches', 0)
+        by_name = self._match_stats.get('strict_matches', 0) + self._match_stats.get('fuzzy_matches', 0)
+        print('{0} spreadsheet records were matched spatially and {1} by name.'.format(spatial, by_name))
+
     # This match is always run and does strict text matching
     def run_strict_match(self, **kwargs):
         """Always run the strict match first.
+        Each spreadsheet column is normalized as a whole and looked up in the admin name index, the leftmost (or
+        rightmost) column with a hit decides the match of each row.
         :param **kwargs: dictionary keyword argument. Only valid keyword argument is from_right_col: 1.
         """
-        # Loop through each column, Pandas' first col value starts at index 1
-        col_size = len(self._spreadsheet_data.data_frame.columns)
         print('kwargs passed to run_match function: {0}'.format(kwargs.keys()))
-        # Only start searching from most right sided column if user wants it.
-        if kwargs.get('from_right_col') == 1:
-            for row in self._spreadsheet_data.data_frame.itertuples():
-                # Ensure insertion of one record per row
-                insertions = 0
-                print('MatchData - checking for matches between spreadsheet and admin boundaries shapefile...')
-                for i in reversed(range(1, col_size)):
-                    if DataUtility.is_string_match(row[i], self._adm_boundaries.data_column(self._admin_choice),
-                                                   self.spreadsheet_data):
-                        data_row = DataUtility.filter_row(self._adm_boundaries.dataframe, self._admin_choice, row[i],
-                                                          self.spreadsheet_data)
-                        # Prevent inserting more than one match from multiple columns
-                        if insertions == 0:
-                            row_data = namedtuple('row_data', ['shp_data', 'sheet_data'])
-                            row_data.shp_data = data_row
-                            # self._matched_admin_dict[row.Index] = data_row
-                            # Track matches in spreadsheet file
-                            row_data.sheet_data = self.array_to_series(row, 100)
-                            # Add to the data dict
-                            self._matched_data_dict[row.Index] = row_data
-                            insertions += 1
-                            print('Added Spreadsheet row number {0} to matches!'.format(row.Index))
-                        continue
-                if row.Index not in self._matched_data_dict.keys():
-                    self._unmatched_data_dict[row.Index] = row
-
-        # Default is searching from left to right columns in spreadsheet
-        else:
-            for row in self._spreadsheet_data.data_frame.itertuples():
-                insertions = 0
-                print('MatchData - checking for matches between spreadsheet and admin boundaries shapefile...')
-                for i in range(1, col_size):
-                    if DataUtility.is_string_match(row[i], self._adm_boundaries.data_column(self._admin_choice),
-                                                   self.spreadsheet_data):
-                        data_row = DataUtility.filter_row(self._adm_boundaries.dataframe, self._admin_choice, row[i],
-                                                          self.spreadsheet_data)
-                        if insertions == 0:
-                            # Info for shapefile
-                            row_data = namedtuple('row_data', ['shp_data', 'sheet_data'])
-                            row_data.shp_data = data_row
-                            # Track matches in spreadsheet file
-                            # Save rows as Pandas series along with match score
-                            row_data.sheet_data = self.array_to_series(row, 100)
-                            # Add to the data dict
-                            self._matched_data_dict[row.Index] = row_data
-                            insertions += 1
-                            print('Added Spreadsheet row number {0} to matches!'.format(row.Index))
-                        continue
-
-                if row.Index not in self._matched_data_dict.keys():
-                    self._unmatched_data_dict[row.Index] = row
-
-    def run_fuzzy_match(self, min_score, **kwargs):
+        print('MatchData - checking for matches between spreadsheet and admin boundaries shapefile...')
+        # Rows already matched, e.g. by run_spatial_match, are not matched again
+        pending = self.pending_row_positions()
+        data_frame = self._spreadsheet_data.data_frame.iloc[pending]
+        name_index = self._adm_boundaries.name_index(self._admin_choice, self.remove_accents())
+        columns = self.match_columns()
+
+        # Each distinct cell value is normalized and looked up once, then broadcast back to its cells
+        value_codes, distinct_values = self.distinct_cell_values(data_frame, columns, name_index.normalize)
+        self.record_dedup_stats('strict', value_codes, distinct_values)
+        # Name code hit matrix, one column per spreadsheet column, -1 where the cell has no admin name match
+        hit_codes = DataUtility.broadcast_codes(value_codes, name_index.codes(distinct_values))
+
+        # Only start searching from most right sided column if user wants it, default is left to right.
+        first_col = DataUtility.first_valid_column(hit_codes >= 0, kwargs.get('from_right_col') == 1)
+        matched_rows = numpy.flatnonzero(first_col >= 0)
+        matched_codes = hit_codes[matched_rows, first_col[matched_rows]]
+        # First admin row with the matched name
+        self.add_matches(pending[matched_rows], self.name_match_positions(pending[matched_rows], matched_codes), 100,
+                         source_columns=first_col[matched_rows])
+        print('Added {0} Spreadsheet rows to matches!'.format(len(matched_rows)))
+
+        for row in data_frame.iloc[numpy.flatnonzero(first_col < 0)].itertuples():
+            self._unmatched_data_dict[row.Index] = row
+
+    def run_fuzzy_match(self, min_score, top_k=DEFAULT_FUZZY_TOP_K, check_recall=False, **kwargs):
         """Fuzzy match function, only executed when user selects fuzzy matching.
+        All distinct cell values of the rows left unmatched by run_strict_match are scored in one batch by the
+        fuzzy_scorer backend, then the leftmost (or rightmost) column with a match decides the match of each row.
+        :param min_score: Integer or string, fuzzy match cut-off score.
+        :param top_k: Integer, number of n-gram blocking candidates scored per query. None or 0 scores every admin name.
+        :param check_recall: boolean, also run the exhaustive search and report how often blocking found the same score.
         :param **kwargs: dictionary keyword argument. Only valid keyword argument is from_right_col: 1.
         """
-        # Loop through each column, Pandas' first col value starts at index 1, Aug. 21 I need index 0 for the count idx!
-        col_size = len(self._spreadsheet_data.data_frame.columns)
+        min_score = int(min_score)
+        # None and 0 both score every admin name, they share the fuzzy cache entries
+        top_k = top_k or None
         print('Fuzzy match running on file type: {0}. '.format(self.spreadsheet_data))
-        print('Unmatched data dict used for fuzzy matching: {0}'.format(self._unmatched_data_dict))
-        # Using Pandas iloc causes
-        # SettingWithCopyWarning: self._spreadsheet_data.data_frame.iloc[list(self._unmatched_data_dict.keys()), :]
+        print('{0} unmatched spreadsheet rows used for fuzzy matching.'.format(len(self._unmatched_data_dict)))
         # Better to do df.loc[[7,8,9]] than to do df.iloc[[7,8,9],:]
         fuzzy_spreadsheet_df = self._spreadsheet_data.data_frame.loc[list(self._unmatched_data_dict.keys())]
+        columns = self.match_columns()
+
+        # NaN cells are left out as they throw off the fuzzy matching, each distinct cell text is scored only once
+        value_codes, queries = self.distinct_cell_values(fuzzy_spreadsheet_df, columns, self.fuzzy_query)
+        self.record_dedup_stats('fuzzy', value_codes, queries)
+        print('Fuzzy scoring {0} distinct cell values with the {1} scorer...'.format(len(queries),
+                                                                                    self._fuzzy_scorer.name))
+
+        # Fuzzy choices are the distinct normalized admin names, candidates come from the n-gram blocking index
+        blocking_index = self._adm_boundaries.ngram_index(self._admin_choice, self.remove_accents())
+        choice_ids, scores = self.cached_best_matches(queries, blocking_index, min_score, top_k)
+
+        if check_recall and len(queries) > 0:
+            exhaustive_ids, exhaustive_scores = self._fuzzy_scorer.best_matches(queries, blocking_index, min_score)
+            recall_hits = int(numpy.sum(scores == exhaustive_scores))
+            # A count rather than a ratio so the stats of ParallelMatcher shards add up, see merge_match_stats
+            self._match_stats['fuzzy_recall_hits'] = recall_hits
+            print('Fuzzy blocking recall with top_k={0}: {1} of {2} queries ({3:.2%}) found the exhaustive best score.'
+                  .format(top_k, recall_hits, len(queries), recall_hits / len(queries)))
+
+        # Map each cell back to the result of its distinct value
+        hit_ids = DataUtility.broadcast_codes(value_codes, choice_ids)
+        hit_scores = DataUtility.broadcast_codes(value_codes, scores, fill_value=0)
 
-        for col in fuzzy_spreadsheet_df.columns:
-            if col != 'geometry':
-                # Strip out NaN cell values as they throw off the fuzzy matching, cast as string for the fuzzy match
-                fuzzy_spreadsheet_df[col] = fuzzy_spreadsheet_df[col].fillna('###')
-                fuzzy_spreadsheet_df[col] = fuzzy_spreadsheet_df[col].astype(str)
-
-        temp_adm_boundaries_df = self._adm_boundaries.dataframe
-        temp_adm_boundaries_list = temp_adm_boundaries_df[self._admin_choice].astype(str).values.tolist()
-
+        if kwargs.get('from_right_col') == 1:
+            print('Fuzzy Match from the RIGHT - checking for matches between spreadsheet and admin boundaries shapefile...')
         # User did not provide priority right column option, so we do the default search order from left to right
-        if kwargs.get('from_right_col') is None:
-            for row in fuzzy_spreadsheet_df.itertuples():
-                insertions = 0
-                print(
-                    'Fuzzy Match from the Left - checking for matches between spreadsheet and admin boundaries shapefile...')
-                for i in range(1, col_size):
-                    best_match = self.fuzzy_match_text(row[i], temp_adm_boundaries_list, int(min_score))
-                    if best_match is not None:
-                        data_row = DataUtility.filter_row(self._adm_boundaries.dataframe, self._admin_choice,
-                                                          best_match[0], self.spreadsheet_data)  # row[i] in spreadsheet
-                        if insertions == 0:
-                            # shapefile info
-                            row_data = namedtuple('row_data', ['shp_data', 'sheet_data'])
-                            row_data.shp_data = data_row
-                            row_data.sheet_data = self.array_to_series(row, best_match[1])
-                            # Add to the data dict
-                            self._matched_data_dict[row.Index] = row_data
-                            insertions += 1
-                            print('Added FUZZY MATCHED Spreadsheet row number {0} to matches!'.format(row.Index))
-                        continue
-
-        # Only search from most right sided columns if user wants it.
-        elif kwargs.get('from_right_col') == 1:
-            for row in fuzzy_spreadsheet_df.itertuples():
-                insertions = 0
-                print(
-                    'Fuzzy Match from the RIGHT - checking for matches between spreadsheet and admin boundaries shapefile...')
-                for i in reversed(range(1, col_size)):
-                    best_match = self.fuzzy_match_text(row[i], temp_adm_boundaries_list, int(min_score))
-                    if best_match is not None:
-                        data_row = DataUtility.filter_row(self._adm_boundaries.dataframe, self._admin_choice,
-                                                          best_match[0], self.spreadsheet_data)  # row[i] in spreadsheet
-                        if insertions == 0:
-                            # Info for shpfile
-                            row_data = namedtuple('row_data', ['shp_data', 'sheet_data'])
-                            row_data.shp_data = data_row
-                            row_data.sheet_data = self.array_to_series(row, best_match[1])
-
-                            self._matched_data_dict[row.Index] = row_data
-                            insertions += 1
-                            print('Added FUZZY MATCHED Spreadsheet row number {0} to matches!'.format(row.Index))
-                        continue
+        else:
+            print('Fuzzy Match from the Left - checking for matches between spreadsheet and admin boundaries shapefile...')
+        first_col = DataUtility.first_valid_column(hit_ids >= 0, kwargs.get('from_right_col') == 1)
+        matched = numpy.flatnonzero(first_col >= 0)
+
+        # Choices are the name index names in the same order, so a choice id is also a name code
+        row_positions = self._spreadsheet_data.data_frame.index.get_indexer(fuzzy_spreadsheet_df.index[matched])
+        admin_positions = self.name_match_positions(row_positions, hit_ids[matched, first_col[matched]])
+        self.add_matches(row_positions, admin_positions, hit_scores[matched, first_col[matched]], match_method='fuzzy',
+                         source_columns=first_col[matched])
+        print('Added {0} FUZZY MATCHED Spreadsheet rows to matches!'.format(len(matched)))
+
+    def run_hierarchical_match(self, levels, min_score=None, **kwargs):
+        """Hierarchical match over admin columns of increasing detail, e.g. ADM1_ES, ADM2_ES, ADM3_ES.
+        The top level is matched against all its names, each level below only against the children of the area matched
+        at the level above. A row is matched when every level is matched, to the polygon of its bottom level area. Rows
+        left unmatched stay pending for run_strict_match and run_fuzzy_match on admin_choice.
+        :param levels: list of admin boundaries column names, from the largest admin areas to the smallest.
+        :param min_score: Integer or string, fuzzy match cut-off score for the cells without a strict match on a level.
+        None only runs strict matching on each level.
+        :param **kwargs: dictionary keyword argument. Valid keyword arguments are from_right_col: 1 and top_k, the
+        number of n-gram blocking candidates scored per fuzzy query (DEFAULT_FUZZY_TOP_K by default, None or 0 scores
+        every child name).
+        """
+        print('MatchData - hierarchical match over {0}...'.format(' -> '.join(levels)))
+        from_right_col = kwargs.get('from_right_col') == 1
+        top_k = kwargs.get('top_k', DEFAULT_FUZZY_TOP_K)
+        hierarchy = self._adm_boundaries.hierarchy(levels, self.remove_accents())
+        pending = self.pending_row_positions()
+        data_frame = self._spreadsheet_data.data_frame.iloc[pending]
+        columns = self.match_columns()
+
+        # Cells are normalized (and fuzzy processed) once for all levels
+        value_codes, distinct_values = self.distinct_cell_values(data_frame, columns, hierarchy.name_index(0).normalize)
+        if min_score is not None:
+            min_score = int(min_score)
+            fuzzy_codes, queries = self.distinct_cell_values(data_frame, columns, self.fuzzy_query)
+
+        nodes = numpy.zeros(len(data_frame), dtype=numpy.int64)
+        scores = numpy.full(len(data_frame), 100, dtype=numpy.int64)
+        for level, level_name in enumerate(levels):
+            alive = numpy.flatnonzero(nodes >= 0)
+            level_codes = hierarchy.name_index(level).codes(distinct_values)
+            name_codes = DataUtility.broadcast_codes(value_codes[alive], level_codes)
+            child = hierarchy.child_nodes(level, numpy.broadcast_to(nodes[alive, None], name_codes.shape), name_codes)
+            first_col = DataUtility.first_valid_column(child >= 0, from_right_col)
+            level_nodes = numpy.where(first_col >= 0, child[numpy.arange(len(alive)), numpy.maximum(first_col, 0)], -1)
+
+            if min_score is not None:
+                # Fuzzy match the rest only against the children names of each parent area, the rows are grouped by
+                # parent area once, keeping their order within each group
+                unmatched = numpy.flatnonzero(level_nodes < 0)
+                unmatched = unmatched[numpy.argsort(nodes[alive[unmatched]], kind='stable')]
+                parents, group_starts = numpy.unique(nodes[alive[unmatched]], return_index=True)
+                for parent, members in zip(parents, numpy.split(unmatched, group_starts[1:])):
+                    level_nodes[members], scores[alive[members]] = self.scoped_fuzzy_match(
+                        hierarchy, level, parent, fuzzy_codes[alive[members]], queries, min_score, from_right_col,
+                        scores[alive[members]], top_k)
+
+            # Average number of candidate names per row, against every distinct name of the level without a hierarchy
+            mean_candidates = float(hierarchy.child_counts(level, nodes[alive]).mean()) if len(alive) > 0 else 0.0
+            self._match_stats['hierarchical_{0}_mean_candidates'.format(level_name)] = mean_candidates
+            nodes[alive] = level_nodes
+            print('Level {0}: {1} of {2} rows matched, {3:.1f} candidate names per row instead of {4}.'.format(
+                level_name, int(numpy.count_nonzero(level_nodes >= 0)), len(alive), mean_candidates,
+                len(hierarchy.name_index(level))))
+
+        matched = numpy.flatnonzero(nodes >= 0)
+        self.add_matches(pending[matched], hierarchy.admin_positions(nodes[matched]), scores[matched],
+                         match_method='hierarchical')
+        print('Added {0} HIERARCHICAL MATCHED Spreadsheet rows to matches!'.format(len(matched)))
+
+    def scoped_fuzzy_match(self, hierarchy, level, parent, fuzzy_codes, queries, min_score, from_right_col,
+                           scores, top_k=DEFAULT_FUZZY_TOP_K):
+        """Fuzzy match rows of one parent area against the names of its children on the level.
+        :return: tuple of numpy arrays of the matched child node ids, -1 where nothing reached min_score, and the
+        lowest score of each row so far.
+        """
+        children = hierarchy.children(level, parent)
+        used = numpy.unique(fuzzy_codes[fuzzy_codes >= 0])
+        if len(children) == 0 or len(used) == 0:
+            return numpy.full(len(fuzzy_codes), -1, dtype=numpy.int64), scores
+        # Parents with up to top_k children have every child name scored, larger lists are blocked
+        blocking_index = hierarchy.blocking_index(level, parent)
+        choice_ids, choice_scores = self._fuzzy_scorer.best_matches(queries[used], blocking_index, min_score, top_k)
+        lookup = numpy.full(len(queries), -1, dtype=numpy.int64)
+        lookup[used] = choice_ids
+        score_lookup = numpy.zeros(len(queries), dtype=numpy.int64)
+        score_lookup[used] = choice_scores
+        hit_ids = DataUtility.broadcast_codes(fuzzy_codes, lookup)
+        first_col = DataUtility.first_valid_column(hit_ids >= 0, from_right_col)
+        rows = numpy.arange(len(fuzzy_codes))
+        cols = numpy.maximum(first_col, 0)
+        nodes = numpy.where(first_col >= 0, children[numpy.maximum(hit_ids[rows, cols], 0)], -1)
+        hit_scores = DataUtility.broadcast_codes(fuzzy_codes, score_lookup, fill_value=0)[rows, cols]
+        return nodes, numpy.where(first_col >= 0, numpy.minimum(scores, hit_scores), scores)
+
+    def cached_best_matches(self, queries, blocking_index, min_score, top_k):
+        """Run the fuzzy scorer on the queries, only scoring the queries missing from the fuzzy_cache if there is one.
+        :return: tuple of numpy arrays (choice ids, -1 where nothing reached min_score, integer scores).
+        """
+        if self._fuzzy_cache is None or len(queries) == 0:
+            return self._fuzzy_scorer.best_matches(queries, blocking_index, min_score, top_k)
+
+        self._fuzzy_cache.register_layer(self._adm_boundaries.layer_name, self._adm_boundaries.layer_key)
+        key = (self._adm_boundaries.layer_key, self._admin_choice, self.remove_accents(), min_score, top_k)
+        cached = self._fuzzy_cache.get_many(key, queries)
+        choice_ids = numpy.full(len(queries), -1, dtype=numpy.int64)
+        scores = numpy.zeros(len(queries), dtype=numpy.int64)
+        missing = []
+        for i, query in enumerate(queries):
+            if query in cached:
+                choice, score = cached[query]
+                if choice is not None:
+                    choice_ids[i] = blocking_index.choice_id(choice)
+                    scores[i] = score
+            else:
+                missing.append(i)
+        self._match_stats['fuzzy_cache_hits'] = len(queries) - len(missing)
+        print('Fuzzy match cache {0}: {1} of {2} distinct cell values already scored.'.format(
+            self._fuzzy_cache.db_path, len(queries) - len(missing), len(queries)))
+
+        if len(missing) > 0:
+            missing = numpy.asarray(missing)
+            missing_ids, missing_scores = self._fuzzy_scorer.best_matches(queries[missing], blocking_index,
+                                                                          min_score, top_k)
+            choice_ids[missing] = missing_ids
+            scores[missing] = missing_scores
+            self._fuzzy_cache.put_many(key, [(queries[i], blocking_index.choices[c] if c >= 0 else None, score)
+                                             for i, c, score in zip(missing, missing_ids, missing_scores)])
+        return choice_ids, scores
 
     def fuzzy_match_text(self, text_to_match, options, min_score):
         """
@@ -680,6 +3011,155 @@ class MatchedData:
             return None
 
 
+# AdminBoundaries shared by the ParallelMatcher worker processes. Forked workers inherit the parent's copy with its
+# name indexes already built, copy-on-write, spawned workers (Windows, macOS) load the layer once in _init_match_worker.
+_worker_adm_boundaries = None
+
+
+def _init_match_worker(admin_boundaries_file, read_options=None):
+    """ProcessPoolExecutor initializer, loads the admin boundaries layer once per worker unless it was inherited."""
+    global _worker_adm_boundaries
+    if admin_boundaries_file is not None:
+        _worker_adm_boundaries = AdminBoundaries(admin_boundaries_file, **(read_options or {}))
+
+
+def _match_shard(task):
+    """
+    Match one shard of spreadsheet rows in a worker process.
+    :param task: dictionary of the shard GeoDataFrame and the match options, see ParallelMatcher.match.
+    :return: dictionary of numpy arrays of the matched shard row positions, admin positions, scores, source columns
+    and match method codes (positions in MATCH_METHODS), and the shard match_stats.
+    """
+    spreadsheet = SpreadsheetData.from_dataframe(task['shard'], task['file_path'], task['encoding'], prepared=True)
+    md = MatchedData(spreadsheet, _worker_adm_boundaries, fuzzy_scorer=task['fuzzy_scorer'])
+    md.admin_choice = task['admin_choice']
+    match_kwargs = task['match_kwargs']
+    if task['spatial']:
+        md.run_spatial_match()
+    if task['hierarchy']:
+        md.run_hierarchical_match(task['hierarchy'], task['min_score'], **match_kwargs)
+    md.run_strict_match(**match_kwargs)
+    if task['min_score'] is not None:
+        md.run_fuzzy_match(task['min_score'], **match_kwargs)
+
+    results = md.match_results
+    return {'row_positions': results.row_positions.astype(numpy.int64),
+            'admin_positions': results.admin_positions.astype(numpy.int64),
+            'scores': numpy.array(results.scores),
+            'source_columns': results.source_columns.astype(numpy.int64),
+            'methods': results.method_codes.astype(numpy.int64),
+            'stats': dict(md.match_stats)}
+
+
+class ParallelMatcher:
+    """
+    Runs the spatial, hierarchical, strict and fuzzy matches of a MatchedData in worker processes, one shard of
+    spreadsheet rows per task. The admin boundaries layer and its indexes are shared with the workers once, not
+    pickled with every task, and the shard results are merged back in the order a single process run adds them.
+    """
+
+    def __init__(self, adm_boundaries, workers=None, shards_per_worker=4):
+        """Constructor.
+        :param adm_boundaries: AdminBoundaries of the admin layer matched.
+        :param workers: Integer, number of worker processes, None uses all CPU cores.
+        :param shards_per_worker: Integer, shards per worker so fast shards don't leave workers idle.
+        """
+        self._adm_boundaries = adm_boundaries
+        self._workers = workers or cpu_count() or 1
+        self._shards_per_worker = shards_per_worker
+        self._executor = None
+
+    @property
+    def workers(self):
+        return self._workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Shut the worker processes down."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def executor(self):
+        """Return the ProcessPoolExecutor, starting the workers on first use."""
+        global _worker_adm_boundaries
+        if self._executor is None:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                # Workers inherit the layer and the indexes built so far through fork, nothing is pickled
+                _worker_adm_boundaries = self._adm_boundaries
+                self._executor = ProcessPoolExecutor(self._workers, mp_context=multiprocessing.get_context('fork'),
+                                                     initializer=_init_match_worker, initargs=(None,))
+            else:
+                self._executor = ProcessPoolExecutor(self._workers, initializer=_init_match_worker,
+                                                     initargs=(self._adm_boundaries.file_path,
+                                                               self._adm_boundaries.read_options))
+        return self._executor
+
+    def build_indexes(self, admin_choice, remove_accents=True, fuzzy=False, spatial=False, hierarchy=None):
+        """Build the admin boundaries indexes a match needs before the workers start, so forked workers inherit them
+        instead of each building its own. Indexes are built lazily by the workers once they have started."""
+        if self._executor is not None:
+            return
+        self._adm_boundaries.name_index(admin_choice, remove_accents)
+        if fuzzy:
+            self._adm_boundaries.ngram_index(admin_choice, remove_accents)
+        if hierarchy:
+            self._adm_boundaries.hierarchy(hierarchy, remove_accents)
+        if spatial:
+            self._adm_boundaries.dataframe.sindex
+
+    def match(self, md, min_score=None, spatial=False, hierarchy=None, **kwargs):
+        """
+        Match the rows of md not matched yet and add the matches to its matched_data_dict.
+        :param md: MatchedData with its admin_choice set, its adm_boundaries must be this matcher's AdminBoundaries.
+        :param min_score: Integer or string, fuzzy match cut-off score. None only runs the strict match.
+        :param spatial: boolean, run the point in polygon match first.
+        :param hierarchy: optional list of admin boundaries columns for run_hierarchical_match.
+        :param **kwargs: dictionary keyword argument. Valid keyword arguments are from_right_col: 1, and the top_k and
+        check_recall arguments of run_fuzzy_match.
+        """
+        pending = md.pending_row_positions()
+        self.build_indexes(md.admin_choice, md.remove_accents(), min_score is not None, spatial, hierarchy)
+        if md.fuzzy_cache is not None:
+            print('The fuzzy match cache is not used by parallel matching.')
+
+        data_frame = md.spreadsheet_data.data_frame
+        shards = [shard for shard in numpy.array_split(pending, self._workers * self._shards_per_worker)
+                  if len(shard) > 0]
+        # A single rapidfuzz thread per worker, the workers already use every core
+        fuzzy_scorer = RapidFuzzScorer(workers=1) if md.fuzzy_scorer.name == RapidFuzzScorer.name else md.fuzzy_scorer
+        tasks = ({'shard': data_frame.iloc[shard], 'file_path': md.spreadsheet_data.file_path,
+                  'encoding': md.spreadsheet_data.encoding, 'admin_choice': md.admin_choice, 'min_score': min_score,
+                  'spatial': spatial, 'hierarchy': hierarchy, 'fuzzy_scorer': fuzzy_scorer, 'match_kwargs': kwargs}
+                 for shard in shards)
+        print('Matching {0} spreadsheet rows in {1} shards on {2} worker processes...'.format(
+            len(pending), len(shards), self._workers))
+        # map returns the results in shard order whatever order the workers finish in
+        results = list(self.executor().map(_match_shard, tasks))
+
+        row_positions = numpy.concatenate([shard[result['row_positions']] for shard, result in zip(shards, results)]
+                                          + [numpy.array([], dtype=numpy.int64)])
+        admin_positions = numpy.concatenate([result['admin_positions'] for result in results] + [row_positions[:0]])
+        scores = numpy.concatenate([result['scores'] for result in results] + [row_positions[:0]])
+        source_columns = numpy.concatenate([result['source_columns'] for result in results] + [row_positions[:0]])
+        methods = numpy.concatenate([result['methods'] for result in results] + [row_positions[:0]])
+        # Same order as a single process run, by match method then by spreadsheet row
+        for method_code, match_method in enumerate(MATCH_METHODS):
+            selected = numpy.flatnonzero(methods == method_code)
+            selected = selected[numpy.argsort(row_positions[selected], kind='stable')]
+            if len(selected) > 0:
+                md.add_matches(row_positions[selected], admin_positions[selected], scores[selected], match_method,
+                               source_columns[selected])
+        md.merge_match_stats([result['stats'] for result in results])
+        md.refresh_unmatched_rows()
+        print('Added {0} Spreadsheet rows to matches from {1} shards!'.format(len(row_positions), len(shards)))
+
+
 # The functions below are used by the console version of the application
 def prompt_for_admin_area_console(md):
     # dataframe is geopandas.GeoDataFrame
@@ -708,31 +3188,359 @@ def print_console_help():
         '-a "c:\\gisdata\\hnd_admbnda_adm3_sinit_20161005.shp" -m fuzzy')
 
 
-def run_console_match(arg_val, md):
-    if arg_val.lower().strip() == 'fuzzy':
+def prompt_fuzzy_cutoff_console():
+    p = PromptMessages()
+    p.argument = 'hit enter key'
+    print(p.fuzzy_caption)
+    fuzzy_input = str(input('Enter fuzzy match cutoff score between 1 and 99. --> '))
+    if DataUtility.is_valid_cutoff(fuzzy_input):
+        print('Fuzzy cut-off score {0} entered, proceeding with fuzzy match.'.format(fuzzy_input))
+        return fuzzy_input
+    else:
+        print('{0} is an invalid cutoff score. Please rerun this program from the beginning!'.format(fuzzy_input))
+        # Exit code 1 Invalid cutoff score
+        exit(1)
+
+
+def prompt_column_priority_console():
+    print(
+        'If you want to choose the columns on the right side of spreadsheet, type \'priority_right\' & hit enter key.')
+    print('Otherwise type any key and hit Enter.')
+    return str(input('Enter column priority and hit Enter key. --> ')).lower().strip()
+
+
+def prompt_epsg_console():
+    # Keep asking until a valid EPSG code is entered, x exits the program
+    while True:
         p = PromptMessages()
         p.argument = 'hit enter key'
-        print(p.fuzzy_caption)
-        fuzzy_input = str(input('Enter fuzzy match cutoff score between 1 and 99. --> '))
-        if DataUtility.is_valid_cutoff(fuzzy_input):
-            print('Fuzzy cut-off score {0} entered, proceeding with fuzzy match.'.format(fuzzy_input))
-            process_column_priority(arg_val, md, fuzzy_input=fuzzy_input)
-        else:
-            print('{0} is an invalid cutoff score. Please rerun this program from the beginning!'.format(fuzzy_input))
-            # Exit code 1 Invalid cutoff score
-            exit(1)
+        print(p.epsg_caption)
+        epsg_input = str(
+            input('Enter the 4 or 5 digit EPSG code that you found from one of the above websites. --> ')).lower().strip()
+        if epsg_input == 'x' or epsg_input == 'exit':
+            exit(0)
+        elif DataUtility.is_valid_epsg(epsg_input):
+            return epsg_input
+        print('\nYou entered {0} which is an invalid epsg code. EPSG Codes must be 4 or 5 numerical digits '
+              'only! Please try again.'.format(epsg_input))
+        print('Enter x if you wish to exit this program.\r\n')
+
+
+def run_console_match(arg_val, md, hierarchy=None, workers=None, fuzzy_input=None, col_priority=None,
+                      fuzzy_options=None):
+    # fuzzy_input and col_priority come from the --cutoff and --priority arguments, they are prompted for when None
+    if arg_val.lower().strip() == 'fuzzy':
+        process_column_priority(arg_val, md, fuzzy_input=fuzzy_input or prompt_fuzzy_cutoff_console(),
+                                hierarchy=hierarchy, workers=workers, col_priority=col_priority,
+                                fuzzy_options=fuzzy_options)
     elif arg_val.lower().strip() == 'regular':
         print('Proceeding to do regular match')
-        process_column_priority(arg_val, md)
+        process_column_priority(arg_val, md, hierarchy=hierarchy, workers=workers, col_priority=col_priority)
+    elif arg_val.lower().strip() == 'spatial':
+        print('Proceeding to do spatial match, records without coordinates get a regular match')
+        process_column_priority(arg_val, md, hierarchy=hierarchy, workers=workers, col_priority=col_priority)
+
+
+def run_chunked_match(spreadsheet_file, adm_boundaries, admin_choice, chunksize=DEFAULT_CSV_CHUNKSIZE,
+                      min_score=None, from_right_col=False, fuzzy_cache=None, spatial=False, hierarchy=None,
+                      workers=None, usecols=None, top_k=DEFAULT_FUZZY_TOP_K, check_recall=False):
+    """
+    Match a large CSV spreadsheet chunk by chunk so memory use stays flat however large the file is. The matches of
+    each chunk are appended to a CSV report in the output folder as soon as the chunk has been matched.
+    :param spreadsheet_file: string for the CSV spreadsheet file path.
+    :param adm_boundaries: AdminBoundaries, its name indexes are built once and shared by all chunks.
+    :param admin_choice: string for the admin boundaries column to match.
+    :param chunksize: Integer, number of spreadsheet rows per chunk.
+    :param min_score: Integer or string, fuzzy match cut-off score. None only runs the strict match.
+    :param from_right_col: boolean, prioritize the rightmost spreadsheet columns.
+    :param fuzzy_cache: optional FuzzyMatchCache.
+    :param spatial: boolean, match records with valid coordinates to the polygon containing them before name matching.
+    :param hierarchy: optional list of admin boundaries columns, from the largest admin areas to admin_choice, matched
+    level by level before the other name matches.
+    :param workers: Integer, match each chunk with a ParallelMatcher of this many worker processes when above 1.
+    :param usecols: optional list of spreadsheet column names to read, matched ignoring case.
+    :param top_k: Integer, number of n-gram blocking candidates per fuzzy query, None or 0 scores every admin name.
+    :param check_recall: boolean, report how often fuzzy blocking found the exhaustive best score.
+    :return: tuple of a message string and the numpy array of the matched admin row positions.
+    """
+    match_kwargs = {'from_right_col': 1} if from_right_col else {}
+    match_kwargs.update(top_k=top_k, check_recall=check_recall)
+    out_file = path.join(DataUtility.get_output_path(),
+                         'match_csv_report_{0}.csv'.format(DataUtility.get_file_time_stamp()))
+    matched_positions = []
+    total_rows = 0
+    total_matches = 0
+    total_spatial_matches = 0
+    # One set of worker processes for all chunks
+    matcher = ParallelMatcher(adm_boundaries, workers) if workers is not None and workers > 1 else None
+
+    try:
+        for chunk_num, spreadsheet in enumerate(SpreadsheetData.iter_csv_chunks(spreadsheet_file, chunksize,
+                                                                                usecols=usecols)):
+            md = MatchedData(spreadsheet, adm_boundaries, fuzzy_cache=fuzzy_cache)
+            md.admin_choice = admin_choice
+            if matcher is not None:
+                matcher.match(md, min_score, spatial, hierarchy, **match_kwargs)
+            else:
+                if spatial:
+                    md.run_spatial_match()
+                if hierarchy:
+                    md.run_hierarchical_match(hierarchy, min_score, **match_kwargs)
+                md.run_strict_match(**match_kwargs)
+                if min_score is not None:
+                    md.run_fuzzy_match(min_score, **match_kwargs)
+
+            # Set the row number to match the csv row numbering, row labels keep counting across chunks
+            md.spreadsheet_data.data_frame.index = md.spreadsheet_data.data_frame.index + 2
+            if len(md.matched_data_dict) > 0:
+                admin_df = md.get_matched_admin_dataframe()
+                admin_df['Index'] = md.matched_row_labels()
+                report = Report(md.get_spreadsheet_report_dataframe(), admin_df)
+                report.join_dataframes()
+                # Admin polygons are left out of the CSV report, the matches shapefile holds the geometry
+                report.joined_dataframe.drop(columns='geometry').to_csv(out_file, mode='a', index=False,
+                                                                        header=total_matches == 0)
+                matched_positions.append(md.matched_admin_positions())
+            total_rows += len(spreadsheet.data_frame)
+            total_matches += len(md.matched_data_dict)
+            total_spatial_matches += md.match_stats.get('spatial_matches', 0)
+            print('Chunk {0}: {1} of {2} spreadsheet records matched so far.'.format(chunk_num + 1, total_matches,
+                                                                                     total_rows))
+    finally:
+        if matcher is not None:
+            matcher.close()
+    matched_positions = numpy.concatenate(matched_positions) if matched_positions else numpy.array([], dtype=int)
+    if total_matches > 0:
+        msg = '{0} spreadsheet records matched to the admin boundaries shapefile out of a total of {1} spreadsheet ' \
+              'records.\nThe CSV report of the matches has been saved at: {2}'.format(total_matches, total_rows,
+                                                                                       out_file)
+        if spatial:
+            msg += '\n{0} records were matched spatially and {1} by name.'.format(
+                total_spatial_matches, total_matches - total_spatial_matches)
+    else:
+        msg = 'No matches were found between the spreadsheet file and the admin boundaries shapefile!'
+    return msg, matched_positions
+
+
+def build_match_report(md):
+    """Join the matched spreadsheet rows to their admin boundaries rows.
+    :param md: MatchedData with matches.
+    :return: Report with the joined dataframe.
+    """
+    report_df = md.get_spreadsheet_report_dataframe()
+
+    # Both dataframes hold the matches in the same order, Report puts them side by side without a join
+    admin_shapefile_df = md.get_matched_admin_dataframe()
+    admin_shapefile_df['Index'] = md.matched_row_labels()
+    report = Report(report_df, admin_shapefile_df)
+    report.join_dataframes()
+    return report
+
+
+def create_match_report(md, out_file=None, report_format='excel'):
+    """Join the matched spreadsheet rows to their admin boundaries rows and save the report.
+    :param md: MatchedData with matches.
+    :param out_file: string for the report file path, None saves a time stamped report in the output folder.
+    :param report_format: string, one of REPORT_FORMATS.
+    :return: message string.
+    """
+    return build_match_report(md).save_report(out_file, report_format)
+
+
+def match_spreadsheet_file(spreadsheet_file, adm_boundaries, admin_choice, options):
+    """
+    Match one spreadsheet file of a batch and save its outputs, named after the spreadsheet file.
+    :param spreadsheet_file: string for the spreadsheet file path.
+    :param adm_boundaries: AdminBoundaries shared by all files of the batch.
+    :param admin_choice: string for the admin boundaries column to match.
+    :param options: dictionary of min_score, from_right_col, spatial, hierarchy, create_report, report_format, epsg,
+    spreadsheet_options, fuzzy_cache, top_k and check_recall, see run_batch_match.
+    :return: dictionary of the batch summary values of the file.
+    """
+    start = time.perf_counter()
+    summary = OrderedDict([('file', spreadsheet_file), ('records', 0), ('matched', 0)] +
+                          [('{0}_matches'.format(method), 0) for method in MATCH_METHODS] +
+                          [('seconds', 0.0), ('report', ''), ('report_rows_per_sec', 0), ('shapefile', ''),
+                           ('error', '')])
+    try:
+        md = MatchedData(SpreadsheetData(spreadsheet_file, **(options.get('spreadsheet_options') or {})),
+                         adm_boundaries, fuzzy_cache=options.get('fuzzy_cache'))
+        md.admin_choice = admin_choice
+        match_kwargs = {'from_right_col': 1} if options.get('from_right_col') else {}
+        match_kwargs.update(top_k=options.get('top_k', DEFAULT_FUZZY_TOP_K), check_recall=options.get('check_recall'))
+        if options.get('spatial'):
+            md.run_spatial_match()
+        if options.get('hierarchy'):
+            md.run_hierarchical_match(options.get('hierarchy'), options.get('min_score'), **match_kwargs)
+        md.run_strict_match(**match_kwargs)
+        if options.get('min_score') is not None:
+            md.run_fuzzy_match(options.get('min_score'), **match_kwargs)
+
+        # Set the row number to match the csv/Excel row numbering
+        md.spreadsheet_data.data_frame.index = md.spreadsheet_data.data_frame.index + 2
+        summary['records'] = len(md.spreadsheet_data.data_frame)
+        summary['matched'] = len(md.matched_data_dict)
+        for method in MATCH_METHODS:
+            summary['{0}_matches'.format(method)] = md.match_stats.get('{0}_matches'.format(method), 0)
+
+        # The extension is part of the output names, so s.csv and s.xlsx of one folder do not overwrite each other
+        file_stem, extension = path.splitext(path.basename(spreadsheet_file))
+        file_stem = '{0}_{1}'.format(file_stem, extension.lstrip('.').lower())
+        if len(md.matched_data_dict) > 0 and options.get('create_report'):
+            report_format = options.get('report_format') or 'excel'
+            summary['report'] = path.join(DataUtility.get_output_path(), 'match_{0}_report_{1}_{2}{3}'.format(
+                report_format, file_stem, DataUtility.get_file_time_stamp(), REPORT_FORMATS[report_format]))
+            report = build_match_report(md)
+            print(report.save_report(summary['report'], report_format))
+            if report.write_stats is not None:
+                summary['report_rows_per_sec'] = report.write_stats['rows_per_second']
+        if len(md.matched_data_dict) > 0 and options.get('epsg') is not None:
+            map_format = options.get('map_format') or 'shapefile'
+            summary['shapefile'] = 'matches_{0}_{1}_{2}{3}'.format(file_stem, admin_choice,
+                                                                   DataUtility.get_file_time_stamp(),
+                                                                   MAP_FILE_FORMATS[map_format])
+            print(DataUtility.create_matches_map(adm_boundaries, md.matched_admin_positions(), options.get('epsg'),
+                                                 admin_choice, summary['shapefile'], map_format,
+                                                 options.get('map_aggregate', False), options.get('centroid_cache')))
+            summary['shapefile'] = path.join(DataUtility.get_output_path(), summary['shapefile'])
+    except Exception as e:
+        # One unreadable spreadsheet does not stop the batch, the error is listed in the batch summary
+        print('Exception {0} while matching {1}'.format(e, spreadsheet_file))
+        summary['error'] = str(e)
+    summary['seconds'] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def _match_spreadsheet_file_worker(task):
+    """Worker process version of match_spreadsheet_file, matches against the worker's shared AdminBoundaries."""
+    if task['output_path'] is not None:
+        DataUtility.set_output_path(task['output_path'])
+    return match_spreadsheet_file(task['spreadsheet_file'], _worker_adm_boundaries, task['admin_choice'],
+                                  task['options'])
+
+
+def find_spreadsheet_files(spreadsheet_arg):
+    """Return the sorted list of spreadsheet files (.csv, .xls, .xlsx) in a folder or matching a glob pattern, e.g.
+    c:\\offices\\*.xlsx."""
+    if path.isdir(spreadsheet_arg):
+        spreadsheet_arg = path.join(spreadsheet_arg, '*')
+    return sorted(file_path for file_path in glob.glob(spreadsheet_arg)
+                  if path.isfile(file_path) and file_path.lower().endswith(('.csv', '.xls', '.xlsx')))
+
+
+def is_batch_spreadsheet_arg(spreadsheet_arg):
+    """Whether the spreadsheet argument is a folder or glob pattern of spreadsheets rather than a single file."""
+    return path.isdir(spreadsheet_arg) or any(char in spreadsheet_arg for char in '*?[')
+
+
+def run_batch_match(spreadsheet_files, adm_boundaries, admin_choice, min_score=None, from_right_col=False,
+                    spatial=False, hierarchy=None, create_report=True, epsg=None, workers=None, fuzzy_cache=None,
+                    map_format='shapefile', report_format='excel', spreadsheet_options=None, map_aggregate=False,
+                    centroid_cache=None, top_k=DEFAULT_FUZZY_TOP_K, check_recall=False):
+    """
+    Match many spreadsheet files against one loaded admin boundaries layer. The shapefile is read and its match
+    indexes are built once for the whole batch. Each file gets its own report and shapefile, named after the file,
+    and a CSV summary of all files is saved in the output folder.
+    :param spreadsheet_files: list of spreadsheet file paths.
+    :param adm_boundaries: AdminBoundaries.
+    :param admin_choice: string for the admin boundaries column to match.
+    :param min_score: Integer or string, fuzzy match cut-off score. None only runs the strict match.
+    :param from_right_col: boolean, prioritize the rightmost spreadsheet columns.
+    :param spatial: boolean, run the point in polygon match first.
+    :param hierarchy: optional list of admin boundaries columns for run_hierarchical_match.
+    :param create_report: boolean, save a report per file.
+    :param epsg: string EPSG code of the matches shapefile of each file, None creates no shapefiles.
+    :param workers: Integer, match this many files at a time on worker processes when above 1.
+    :param fuzzy_cache: optional FuzzyMatchCache, only used when files are matched one at a time.
+    :param map_format: string, one of MAP_FILE_FORMATS, file format of the matches map files.
+    :param report_format: string, one of REPORT_FORMATS, file format of the reports.
+    :param spreadsheet_options: optional dictionary of the SpreadsheetData usecols, sheets and excel_engine arguments.
+    :param map_aggregate: boolean, one matches map feature per matched admin polygon with its number of matches.
+    :param centroid_cache: optional CentroidCache of the matches map centroids, shared by every file.
+    :param top_k: Integer, number of n-gram blocking candidates per fuzzy query, None or 0 scores every admin name.
+    :param check_recall: boolean, report how often fuzzy blocking found the exhaustive best score.
+    :return: tuple of a message string and the summary Pandas dataframe, one row per file.
+    """
+    options = {'min_score': min_score, 'from_right_col': from_right_col, 'spatial': spatial, 'hierarchy': hierarchy,
+               'create_report': create_report, 'report_format': report_format, 'epsg': epsg, 'map_format': map_format,
+               'spreadsheet_options': spreadsheet_options, 'map_aggregate': map_aggregate,
+               'centroid_cache': centroid_cache, 'top_k': top_k, 'check_recall': check_recall}
+    print('Batch matching {0} spreadsheet files against {1}...'.format(len(spreadsheet_files),
+                                                                      adm_boundaries.file_path))
+    if workers is not None and workers > 1 and len(spreadsheet_files) > 1:
+        with ParallelMatcher(adm_boundaries, min(workers, len(spreadsheet_files))) as matcher:
+            matcher.build_indexes(admin_choice, True, min_score is not None, spatial, hierarchy)
+            tasks = ({'spreadsheet_file': file_path, 'admin_choice': admin_choice, 'options': options,
+                      'output_path': DataUtility.output_path} for file_path in spreadsheet_files)
+            summaries = list(matcher.executor().map(_match_spreadsheet_file_worker, tasks))
+    else:
+        options['fuzzy_cache'] = fuzzy_cache
+        summaries = [match_spreadsheet_file(file_path, adm_boundaries, admin_choice, options)
+                     for file_path in spreadsheet_files]
+
+    summary_df = pandas.DataFrame(summaries)
+    if len(summary_df) > 0:
+        summary_df['match_rate'] = (summary_df['matched'] / summary_df['records'].where(summary_df['records'] > 0)) \
+            .fillna(0.0).round(4)
+    summary_file = path.join(DataUtility.get_output_path(),
+                             'match_batch_summary_{0}.csv'.format(DataUtility.get_file_time_stamp()))
+    summary_df.to_csv(summary_file, index=False)
+    failed = int((summary_df['error'] != '').sum()) if len(summary_df) > 0 else 0
+    msg = '{0} of {1} spreadsheet records matched across {2} files ({3} failed).\nThe batch summary has been saved at: ' \
+          '{4}'.format(int(summary_df['matched'].sum()) if len(summary_df) > 0 else 0,
+                       int(summary_df['records'].sum()) if len(summary_df) > 0 else 0, len(summary_df), failed,
+                       summary_file)
+    return msg, summary_df
+
+
+def run_console_batch_match(args):
+    # Batch version of the console app, every spreadsheet in a folder or glob is matched against one loaded shapefile
+    spreadsheet_files = find_spreadsheet_files(args.spreadsheet_file)
+    if len(spreadsheet_files) == 0:
+        print('No .csv, .xls or .xlsx spreadsheet files were found at {0}'.format(args.spreadsheet_file))
+        exit(1)
+    adm_boundaries = console_admin_boundaries(args)
+    hierarchy = parse_hierarchy_levels(args.hierarchy, adm_boundaries)
+    admin_choice = hierarchy[-1] if hierarchy else console_admin_choice(args, MatchedData(None, adm_boundaries))
+    match_type = args.match_type.lower().strip()
+    min_score = console_fuzzy_cutoff(args) if match_type == 'fuzzy' else None
+    from_right_col = console_column_priority(args) == 'priority_right'
+    create_report = console_create_report(args)
+    epsg_input = console_epsg(args)
+    fuzzy_cache = FuzzyMatchCache(args.fuzzy_cache or None) if args.fuzzy_cache is not None else None
+
+    msg, summary_df = run_batch_match(spreadsheet_files, adm_boundaries, admin_choice, min_score, from_right_col,
+                                      match_type == 'spatial', hierarchy, create_report, epsg_input, args.workers,
+                                      fuzzy_cache, args.map_format, args.report_format,
+                                      console_spreadsheet_options(args), args.map_aggregate,
+                                      console_centroid_cache(args), **console_fuzzy_options(args))
+    print(summary_df[['file', 'records', 'matched', 'match_rate', 'seconds', 'report_rows_per_sec', 'error']]
+          .to_string(index=False))
+    print(msg)
 
 
 def process_column_priority(match_arg_val, md, **kwargs):
-    print(
-        'If you want to choose the columns on the right side of spreadsheet, type \'priority_right\' & hit enter key.')
-    print('Otherwise type any key and hit Enter.')
-    col_pri_input = str(input('Enter column priority and hit Enter key. --> ')).lower().strip()
+    col_pri_input = kwargs.get('col_priority') if kwargs.get('col_priority') is not None \
+        else prompt_column_priority_console()
+    # top_k and check_recall of run_fuzzy_match, only set for a fuzzy match
+    fuzzy_options = kwargs.get('fuzzy_options') or {}
 
     try:
+        if kwargs.get('workers') is not None and kwargs.get('workers') > 1:
+            with ParallelMatcher(md.adm_boundaries, kwargs.get('workers')) as matcher:
+                matcher.match(md, kwargs.get('fuzzy_input') if match_arg_val == 'fuzzy' else None,
+                              match_arg_val == 'spatial', kwargs.get('hierarchy'),
+                              **({'from_right_col': 1} if col_pri_input == 'priority_right' else {}), **fuzzy_options)
+            if match_arg_val == 'spatial':
+                md.print_match_sources()
+            return
+
+        if kwargs.get('hierarchy'):
+            md.run_hierarchical_match(kwargs.get('hierarchy'),
+                                      kwargs.get('fuzzy_input') if match_arg_val == 'fuzzy' else None,
+                                      **({'from_right_col': 1} if col_pri_input == 'priority_right' else {}),
+                                      **fuzzy_options)
+
         if match_arg_val == 'regular':
             if col_pri_input == 'priority_right':
                 md.run_strict_match(from_right_col=1)
@@ -741,14 +3549,22 @@ def process_column_priority(match_arg_val, md, **kwargs):
                 md.run_strict_match()
                 print('Length was {0}'.format(md.matched_data_dict))
 
+        elif match_arg_val == 'spatial':
+            md.run_spatial_match()
+            if col_pri_input == 'priority_right':
+                md.run_strict_match(from_right_col=1)
+            else:
+                md.run_strict_match()
+            md.print_match_sources()
+
         elif match_arg_val == 'fuzzy':
             if col_pri_input == 'priority_right':
                 md.run_strict_match(from_right_col=1)
-                md.run_fuzzy_match(kwargs.get('fuzzy_input'), from_right_col=1)
+                md.run_fuzzy_match(kwargs.get('fuzzy_input'), from_right_col=1, **fuzzy_options)
             # Any other key(s) were entered.
             else:
                 md.run_strict_match()
-                md.run_fuzzy_match(kwargs.get('fuzzy_input'))
+                md.run_fuzzy_match(kwargs.get('fuzzy_input'), **fuzzy_options)
 
     except KeyError as e:
         print('You need to enter a column priority. Enter the word regular or priority_right and hit Enter key!')
@@ -756,23 +3572,348 @@ def process_column_priority(match_arg_val, md, **kwargs):
         print('Exception {0} encountered at line {1}'.format(e, e.__traceback__.tb_lineno))
 
 
+def prompt_admin_choice_console(md):
+    # Keep asking until a valid admin boundaries column is chosen, x exits the program
+    while True:
+        admin_boundaries_dict = prompt_for_admin_area_console(md)
+        admin_input = str(input('Please enter your choice of administrative area. --> ')).strip()
+        if admin_input in admin_boundaries_dict.keys():
+            return admin_boundaries_dict[admin_input]
+        elif admin_input.lower().strip() == 'x':
+            exit()
+        print('\nYou entered an Invalid choice for administrative area. Please try again!\n')
+        print('\nIf you want to stop this program, type the x key and hit Enter to stop this program.')
+
+
+def parse_hierarchy_levels(hierarchy_arg, adm_boundaries):
+    """Return the list of admin boundaries columns of the --hierarchy argument, e.g. ADM1_ES,ADM2_ES,ADM3_ES, or None.
+    Exits when a column is not in the admin boundaries shapefile."""
+    if not hierarchy_arg:
+        return None
+    levels = [level.strip() for level in hierarchy_arg.split(',') if level.strip()]
+    missing = [level for level in levels if level not in adm_boundaries.columns]
+    if missing:
+        print('The admin boundaries shapefile has no column(s) {0}. Available columns: {1}'.format(
+            ', '.join(missing), ', '.join(adm_boundaries.columns)))
+        exit(1)
+    return levels
+
+
+def console_admin_choice(args, md):
+    """Admin boundaries column from --admin-field, or prompted for unless --non-interactive."""
+    if args.admin_field is not None:
+        if args.admin_field in md.get_admin_choices().values():
+            return args.admin_field
+        print('The admin boundaries shapefile has no column {0}. Available columns: {1}'.format(
+            args.admin_field, ', '.join(md.get_admin_choices().values())))
+        exit(1)
+    if args.non_interactive:
+        print('Choose the admin boundaries column with --admin-field when running with --non-interactive.')
+        exit(1)
+    return prompt_admin_choice_console(md)
+
+
+def console_fuzzy_cutoff(args):
+    """Fuzzy match cut-off score from --cutoff, or prompted for unless --non-interactive."""
+    if args.cutoff is not None:
+        if DataUtility.is_valid_cutoff(args.cutoff.strip()):
+            return args.cutoff.strip()
+        print('{0} is an invalid cutoff score. The --cutoff score must be between 1 and 100.'.format(args.cutoff))
+        # Exit code 1 Invalid cutoff score
+        exit(1)
+    if args.non_interactive:
+        print('Fuzzy match needs a --cutoff score between 1 and 100 when running with --non-interactive.')
+        exit(1)
+    return prompt_fuzzy_cutoff_console()
+
+
+def console_fuzzy_options(args):
+    """run_fuzzy_match top_k and check_recall arguments from --fuzzy_top_k and --check_recall."""
+    if args.fuzzy_top_k < 0:
+        print('{0} is an invalid --fuzzy_top_k. Enter a number of candidates, or 0 to score every admin name.'.format(
+            args.fuzzy_top_k))
+        exit(1)
+    return {'top_k': args.fuzzy_top_k or None, 'check_recall': args.check_recall}
+
+
+def console_column_priority(args):
+    """Column priority from --priority, 'priority_right' or 'regular', or prompted for unless --non-interactive."""
+    if args.priority is not None:
+        return 'priority_right' if args.priority == 'right' else 'regular'
+    if args.non_interactive:
+        return 'regular'
+    return prompt_column_priority_console()
+
+
+def console_create_report(args):
+    """Whether to create the Excel report, from --report, or prompted for unless --non-interactive."""
+    if args.report:
+        return True
+    if args.non_interactive:
+        return False
+    print('Would you like to create a Excel report file to show the matches?')
+    print('\nEnter Y to create Excel report file, or press any other key skip this step.')
+    excel_report_input = str(input('Create Excel file report of matches. --> ')).lower().strip()
+    return excel_report_input == 'y' or excel_report_input == 'yes'
+
+
+def console_epsg(args):
+    """EPSG code of the matches shapefile from --epsg, or prompted for unless --non-interactive. None means no
+    shapefile is created."""
+    if args.epsg is not None:
+        if DataUtility.is_valid_epsg(args.epsg.strip()):
+            return args.epsg.strip()
+        print('{0} is an invalid epsg code. EPSG Codes must be 4 or 5 numerical digits only!'.format(args.epsg))
+        exit(1)
+    if args.non_interactive:
+        return None
+    print('\nWould you like to create a shapefile to show the matches on a map?')
+    print('\nEnter Y to create the shapefile, or press any other key finish this program.')
+    shpfile_prompt_input = str(input('Create shapefile to show the matches. --> ')).lower().strip()
+    if shpfile_prompt_input == 'y' or shpfile_prompt_input == 'yes':
+        return prompt_epsg_console()
+
+
+def console_admin_columns(args):
+    """Admin boundaries columns to read with --admin-columns: the listed columns plus the --admin-field and
+    --hierarchy columns. None reads every column."""
+    if args.admin_columns is None:
+        return None
+    columns = [col.strip() for col in args.admin_columns.split(',') if col.strip()]
+    if args.hierarchy:
+        columns += [level.strip() for level in args.hierarchy.split(',') if level.strip()]
+    if args.admin_field is not None:
+        columns.append(args.admin_field)
+    return list(OrderedDict.fromkeys(columns)) or None
+
+
+def console_spreadsheet_options(args):
+    """SpreadsheetData usecols, sheets and excel_engine arguments from --usecols, --sheets and --excel-engine."""
+    usecols = [col.strip() for col in args.usecols.split(',') if col.strip()] if args.usecols else None
+    sheets = None
+    if args.sheets is not None:
+        sheets = 'all' if args.sheets.strip().lower() == 'all' else \
+            [sheet.strip() for sheet in args.sheets.split(',') if sheet.strip()] or None
+    return {'usecols': usecols, 'sheets': sheets, 'excel_engine': args.excel_engine}
+
+
+def console_centroid_cache(args):
+    """CentroidCache of the --centroid-cache folder, None without the argument."""
+    return CentroidCache(args.centroid_cache or None) if args.centroid_cache is not None else None
+
+
+def console_admin_boundaries(args):
+    """AdminBoundaries of the -a file, read as set by --admin-columns, --lazy, --bbox and --admin-filter."""
+    bbox = None
+    if args.bbox is not None:
+        try:
+            bbox = tuple(float(val) for val in args.bbox.split(','))
+        except ValueError:
+            bbox = ()
+        if len(bbox) != 4:
+            print('{0} is an invalid --bbox. Enter minx,miny,maxx,maxy in the admin boundaries coordinates, e.g. '
+                  '-89.4,12.9,-83.1,16.5'.format(args.bbox))
+            exit(1)
+    row_filter = None
+    if args.admin_filter is not None:
+        column, sep, value = args.admin_filter.partition('=')
+        if not sep or not column.strip():
+            print('{0} is an invalid --admin-filter. Enter COLUMN=VALUE, e.g. ADM0_EN=Honduras'.format(
+                args.admin_filter))
+            exit(1)
+        row_filter = (column.strip(), value.strip())
+    return AdminBoundaries(args.admin_boundaries_file, console_admin_columns(args), args.lazy, bbox, row_filter)
+
+
+def run_console_chunked_match(args):
+    # Streaming CSV version of the console app, the spreadsheet is never loaded into memory as a whole
+    adm_boundaries = console_admin_boundaries(args)
+    hierarchy = parse_hierarchy_levels(args.hierarchy, adm_boundaries)
+    admin_choice = hierarchy[-1] if hierarchy else console_admin_choice(args, MatchedData(None, adm_boundaries))
+    match_type = args.match_type.lower().strip()
+    min_score = console_fuzzy_cutoff(args) if match_type == 'fuzzy' else None
+    from_right_col = console_column_priority(args) == 'priority_right'
+    fuzzy_cache = FuzzyMatchCache(args.fuzzy_cache or None) if args.fuzzy_cache is not None else None
+
+    msg, matched_positions = run_chunked_match(args.spreadsheet_file, adm_boundaries, admin_choice, args.chunksize,
+                                               min_score, from_right_col, fuzzy_cache, match_type == 'spatial',
+                                               hierarchy, args.workers,
+                                               console_spreadsheet_options(args).get('usecols'),
+                                               **console_fuzzy_options(args))
+    print(msg)
+    if len(matched_positions) > 0:
+        epsg_input = console_epsg(args)
+        if epsg_input is not None:
+            print(DataUtility.create_matches_map(adm_boundaries, matched_positions, epsg_input, admin_choice,
+                                                 file_format=args.map_format, aggregate=args.map_aggregate,
+                                                 centroid_cache=console_centroid_cache(args)))
+
+
+def run_console_compile(args):
+    # Compile the admin boundaries shapefile to a .geoidx file, opened instantly by later runs with -a file.geoidx
+    if path.splitext(args.admin_boundaries_file)[1].lower() == GEOIDX_EXTENSION:
+        print('{0} is already a compiled admin layer, compile the shapefile instead.'.format(args.admin_boundaries_file))
+        exit(1)
+    if pyarrow is None:
+        print('Compiling admin layers needs pyarrow, install it with: pip install pyarrow')
+        exit(1)
+    start = time.perf_counter()
+    adm_boundaries = console_admin_boundaries(args)
+    admin_columns = parse_hierarchy_levels(args.hierarchy, adm_boundaries) or []
+    if args.admin_field is not None:
+        if args.admin_field not in adm_boundaries.columns:
+            print('The admin boundaries shapefile has no column {0}. Available columns: {1}'.format(
+                args.admin_field, ', '.join(adm_boundaries.columns)))
+            exit(1)
+        admin_columns.append(args.admin_field)
+    out_file = adm_boundaries.compile(args.compile or None, list(OrderedDict.fromkeys(admin_columns)) or None)
+    print('Compiled {0} admin boundaries to {1} in {2:.2f}s'.format(len(adm_boundaries), out_file,
+                                                                 time.perf_counter() - start))
+
+
 def main():
     try:
         parser = ArgumentParser(description=__doc__, formatter_class=RawDescriptionHelpFormatter)
         parser.add_argument('-s',
                             '--spreadsheet_file',
                             type=str,
-                            help='File location of spreadsheet file. It can be CSV (.csv), or Excel (.xlsx or .xls) format')
+                            help='File location of spreadsheet file. It can be CSV (.csv), or Excel (.xlsx or .xls) format. '
+                                 'A folder or a pattern like "c:\\offices\\*.xlsx" matches every spreadsheet in it.')
         parser.add_argument('-a',
                             '--admin_boundaries_file',
                             type=str,
-                            help='File location of your admin boundaries shapefile. It should be a shapefile-ends in .shp.')
+                            help='File location of your admin boundaries shapefile (.shp), or a GeoParquet (.parquet), '
+                                 'Feather (.feather) or compiled (.geoidx) admin layer.')
         parser.add_argument('-m',
                             '--match_type',
                             type=str,
-                            help='Choose regular match or fuzzy match.')
+                            help='Choose regular match or fuzzy match, or spatial match to match records with x/y or '
+                                 'lat/long coordinates to the polygon containing them and the rest by name.')
+        parser.add_argument('-c',
+                            '--fuzzy_cache',
+                            type=str,
+                            nargs='?',
+                            const='',
+                            help='Reuse fuzzy match results across runs from an SQLite cache file. Without a file '
+                                 'location the cache is kept in the output folder.')
+        parser.add_argument('--chunksize',
+                            type=int,
+                            help='Stream a large CSV spreadsheet in chunks of this many rows with flat memory use. '
+                                 'Matches are written to a CSV report chunk by chunk.')
+        parser.add_argument('--hierarchy',
+                            type=str,
+                            help='Comma separated admin boundaries columns from the largest admin areas to the '
+                                 'smallest, e.g. ADM1_ES,ADM2_ES,ADM3_ES. Each level is only matched against the areas '
+                                 'inside the area matched on the level above; records are matched to the last level.')
+        parser.add_argument('-w',
+                            '--workers',
+                            type=int,
+                            help='Number of worker processes to match the spreadsheet rows on, e.g. the number of CPU '
+                                 'cores. Default is a single process.')
+        parser.add_argument('--admin-field',
+                            type=str,
+                            help='Admin boundaries shapefile column with the region names to match, instead of '
+                                 'choosing it at the prompt.')
+        parser.add_argument('--cutoff',
+                            type=str,
+                            help='Fuzzy match cutoff score between 1 and 100, instead of entering it at the prompt.')
+        parser.add_argument('--fuzzy_top_k',
+                            type=int,
+                            default=DEFAULT_FUZZY_TOP_K,
+                            help='Number of admin names sharing the most 3 letter groups with a spreadsheet value that '
+                                 'are fuzzy scored, default {0}. Faster than scoring every admin name, but a value '
+                                 'whose best match is not among them scores lower. 0 scores every admin name.'
+                                 .format(DEFAULT_FUZZY_TOP_K))
+        parser.add_argument('--check_recall',
+                            action='store_true',
+                            help='Also fuzzy score every admin name and report how often the --fuzzy_top_k '
+                                 'candidates found the same best score.')
+        parser.add_argument('--priority',
+                            choices=['left', 'right'],
+                            help='Search the spreadsheet columns from the left (default) or from the right.')
+        parser.add_argument('--report',
+                            action='store_true',
+                            help='Create the report of the matches without asking, an Excel file unless '
+                                 '--report-format says otherwise.')
+        parser.add_argument('--report-format',
+                            choices=list(REPORT_FORMATS),
+                            default='excel',
+                            help='File format of the report, excel (default), csv or parquet. Excel reports past '
+                                 '1,048,575 matches are split over several worksheets, csv and parquet write much '
+                                 'faster on large runs.')
+        parser.add_argument('--epsg',
+                            type=str,
+                            help='Create the matches shapefile in this 4 or 5 digit EPSG code without asking.')
+        parser.add_argument('--out-dir',
+                            type=str,
+                            help='Folder for the reports and shapefiles, instead of c:\\gis_output or /gis_output.')
+        parser.add_argument('--usecols',
+                            type=str,
+                            help='Only read these comma separated spreadsheet columns, e.g. name,town,x,y. Keep the '
+                                 'x/y or lat/long columns for a spatial match.')
+        parser.add_argument('--sheets',
+                            type=str,
+                            help='Excel sheets to read, comma separated sheet names or all, instead of the first '
+                                 'sheet. With --workers the sheets are read in parallel.')
+        parser.add_argument('--excel-engine',
+                            choices=list(EXCEL_ENGINES),
+                            help='Excel reader, calamine (pip install python-calamine, many times faster) or '
+                                 'openpyxl. Default is calamine when it is installed.')
+        parser.add_argument('--admin-columns',
+                            type=str,
+                            nargs='?',
+                            const='',
+                            help='Only read these comma separated admin boundaries columns, plus the --admin-field '
+                                 'and --hierarchy columns and the geometry. Without a list only the matched columns '
+                                 'are read, the fastest load of layers with many columns.')
+        parser.add_argument('--lazy',
+                            action='store_true',
+                            help='Only read the admin boundaries columns when they are matched, and geometries when a '
+                                 'spatial match needs them or for the matched rows of the shapefile and report. '
+                                 'Cuts load time and memory on continental layers.')
+        parser.add_argument('--bbox',
+                            type=str,
+                            help='Only read the admin polygons intersecting minx,miny,maxx,maxy, in the admin '
+                                 'boundaries coordinates, e.g. -89.4,12.9,-83.1,16.5')
+        parser.add_argument('--admin-filter',
+                            type=str,
+                            help='Only read the admin boundaries rows where COLUMN=VALUE, e.g. ADM0_EN=Honduras to '
+                                 'match against one country of a continental layer.')
+        parser.add_argument('--map-format',
+                            choices=list(MAP_FILE_FORMATS),
+                            default='shapefile',
+                            help='File format of the matches map created with --epsg, shapefile (default) or '
+                                 'geoparquet, faster to write and without the 10 character column name limit.')
+        parser.add_argument('--map-aggregate',
+                            action='store_true',
+                            help='Write one matches map feature per matched admin polygon with its number of matches '
+                                 'in a Matches column, instead of one feature per matched record.')
+        parser.add_argument('--centroid-cache',
+                            type=str,
+                            nargs='?',
+                            const='',
+                            help='Keep the reprojected admin polygon centroids of the matches map in a cache folder, '
+                                 'reused by later runs against the same admin boundaries. Without a folder location '
+                                 'the cache is kept in the output folder.')
+        parser.add_argument('--compile',
+                            type=str,
+                            nargs='?',
+                            const='',
+                            help='Compile the admin boundaries shapefile to a .geoidx file with its name indexes '
+                                 'built, then pass the .geoidx file to -a for instant start up. Indexes the '
+                                 '--admin-field and --hierarchy columns, or every text column. Without a file '
+                                 'location the .geoidx file is written next to the shapefile.')
+        parser.add_argument('--non-interactive',
+                            action='store_true',
+                            help='Never prompt, e.g. for scheduled runs. Options not given on the command line are '
+                                 'skipped: no Excel report without --report and no shapefile without --epsg. '
+                                 '--admin-field (or --hierarchy) is required, and --cutoff for fuzzy match.')
         args = parser.parse_args()
 
+        if args.compile is not None and args.admin_boundaries_file:
+            run_console_compile(args)
+            return
+
         if not (args.spreadsheet_file and args.admin_boundaries_file and args.match_type):
             print(
                 '\nYou need to provide 3 arguments: a file location for the spreadsheet file, a file location for the '
@@ -780,32 +3921,38 @@ def main():
             print_console_help()
             return
 
-        else:
-            md = MatchedData(SpreadsheetData(args.spreadsheet_file), AdminBoundaries(args.admin_boundaries_file))
-            continue_admin_prompt = True
-            while continue_admin_prompt:
-                admin_boundaries_dict = prompt_for_admin_area_console(md)
-                admin_input = str(input('Please enter your choice of administrative area. --> ')).strip()
-                if admin_input in admin_boundaries_dict.keys():
-                    admin_choice = admin_boundaries_dict[admin_input]
-                    continue_admin_prompt = False
-                    md.admin_choice = admin_choice
-                    md.user_proceed_match()
-                    if hasattr(md, 'user_proceed_match') and md.admin_choice is not None:
-                        if md.user_proceed_match == 1:
-                            run_console_match(args.match_type, md)
-                elif admin_input not in admin_boundaries_dict.keys():
-                    print('\nYou entered an Invalid choice for administrative area. Please try again!\n')
-                    print('\nIf you want to stop this program, type the x key and hit Enter to stop this program.')
-                elif admin_input.lower().strip() == 'x':
-                    exit()
+        if args.match_type.lower().strip() not in ('regular', 'fuzzy', 'spatial'):
+            print('\n{0} is not a match type. Choose regular, fuzzy or spatial.'.format(args.match_type))
+            print_console_help()
+            exit(1)
+
+        if args.out_dir:
+            DataUtility.set_output_path(args.out_dir)
+
+        if is_batch_spreadsheet_arg(args.spreadsheet_file):
+            run_console_batch_match(args)
+            return
+
+        if args.chunksize and args.spreadsheet_file.lower().endswith('.csv'):
+            run_console_chunked_match(args)
+            return
+
+        fuzzy_cache = FuzzyMatchCache(args.fuzzy_cache or None) if args.fuzzy_cache is not None else None
+        # The admin boundaries shapefile is read once, md.adm_boundaries is used from here on
+        md = MatchedData(SpreadsheetData(args.spreadsheet_file, workers=args.workers,
+                                         **console_spreadsheet_options(args)),
+                         console_admin_boundaries(args),
+                         fuzzy_cache=fuzzy_cache)
+        hierarchy = parse_hierarchy_levels(args.hierarchy, md.adm_boundaries)
+        # With a hierarchy records are matched to the smallest admin areas, no need to ask for the admin column
+        md.admin_choice = hierarchy[-1] if hierarchy else console_admin_choice(args, md)
+        fuzzy_input = console_fuzzy_cutoff(args) if args.match_type.lower().strip() == 'fuzzy' else None
+        run_console_match(args.match_type, md, hierarchy, args.workers, fuzzy_input, console_column_priority(args),
+                          console_fuzzy_options(args))
 
-        args = parser.parse_args()
         print(md.spreadsheet_data)
         print(md.adm_boundaries)
 
-        shp_file = AdminBoundaries(args.admin_boundaries_file)
-
         # Set the row number to match the csv/Excel row numbering
         md.spreadsheet_data.data_frame.index = md.spreadsheet_data.data_frame.index + 2
 
@@ -820,71 +3967,22 @@ def main():
                   '{1} spreadsheet records'.format(len(md.matched_data_dict),
                                                    len(md.spreadsheet_data.data_frame.index)))
 
-            print('Would you like to create a Excel report file to show the matches?')
-            print('\nEnter Y to create Excel report file, or press any other key skip this step.')
-            excel_report_input = str(input('Create Excel file report of matches. --> ')).lower().strip()
-            if excel_report_input == 'y' or excel_report_input == 'yes':
-                temp_df = md.get_spreadsheet_report_dataframe()
-                report_df = geopandas.GeoDataFrame(
-                    data=temp_df, crs="EPSG:4326",
-                    geometry=temp_df['geometry'])  # data=[itesm for item in md.matched_data_dict.values()]
-                report_df.set_index('Index')
-
-                admin_shapefile_df = geopandas.GeoDataFrame(
-                    # Is no longer data=[val[0] for val in md.matched_data_dict.values()]
-                    data=[val.shp_data for val in md.matched_data_dict.values()], crs="EPSG:4326",
-                    columns=shp_file.dataframe.columns)
-
-                admin_shapefile_df['Index'] = md.matched_data_dict.keys()
-                admin_shapefile_df.set_index('Index')
-                report = Report(report_df, admin_shapefile_df)
-                report.join_dataframes()
-                print(report.save_report())
-
-            print('\nWould you like to create a shapefile to show the matches on a map?')
-            print('\nEnter Y to create the shapefile, or press any other key finish this program.')
-            shpfile_prompt_input = str(input('Create shapefile to show the matches. --> ')).lower().strip()
-            if shpfile_prompt_input == 'y' or shpfile_prompt_input == 'yes':
-                valid_epsg_input = False
-                while not valid_epsg_input:
-                    try:
-                        p = PromptMessages()
-                        p.argument = 'hit enter key'
-                        print(p.epsg_caption)
-                        epsg_input = str(
-                            input(
-                                'Enter the 4 or 5 digit EPSG code that you found from one of the above websites. --> ')).lower().strip()
-                        epsg_match = DataUtility.is_valid_epsg(epsg_input)
-
-                        if epsg_input == 'x' or epsg_input == 'exit':
-                            exit(0)
-                        elif not epsg_match:
-                            raise ValueError
-                        elif epsg_match:
-
-                            matched_admin_list = [val.shp_data for val in md.matched_data_dict.values()]
-
-                            if 'geometry' in shp_file.dataframe.columns:
-                                matched_geom_col_loc = shp_file.dataframe.columns.get_loc('geometry')
-
-                            # Create geodataframe and output to shapefile
-                            matched_records_gdf = geopandas.GeoDataFrame(data=matched_admin_list,
-                                                                         columns=shp_file.dataframe.columns,
-                                                                         crs="EPSG:4326",
-                                                                         geometry=numpy.asarray(list(
-                                                                             [row[matched_geom_col_loc] for row in
-                                                                              matched_admin_list])))
-                            print(DataUtility.create_admin_matches_shapefile(matched_records_gdf,
-                                                                             epsg_input,
-                                                                             md.admin_choice))
-                            valid_epsg_input = True
-                    except ValueError:
-                        print(
-                            '\nYou entered {0} which is an invalid epsg code. EPSG Codes must be 4 or 5 numerical digits '
-                            'only! Please try again.'.format(epsg_input))
-                        print('Enter x if you wish to exit this program.\r\n')
-                    except Exception as e:
-                        print('Exception {0} occurred.'.format(e))
+            if console_create_report(args):
+                print(create_match_report(md, report_format=args.report_format))
+
+            epsg_input = console_epsg(args)
+            if epsg_input is not None:
+                try:
+                    # Create geodataframe and output to shapefile
+                    print(DataUtility.create_matches_map(md.adm_boundaries,
+                                                         md.matched_admin_positions(),
+                                                         epsg_input,
+                                                         md.admin_choice,
+                                                         file_format=args.map_format,
+                                                         aggregate=args.map_aggregate,
+                                                         centroid_cache=console_centroid_cache(args)))
+                except Exception as e:
+                    print('Exception {0} occurred.'.format(e))
         elif len(md.matched_data_dict) == 0:
             print('No matches were found between the spreadsheet file and the admin boundaries shapefile!')
             print('Please try again!!')
@@ -1,5 +1,3 @@
-import geopandas
-import numpy
 from match_admin_boundaries_core import SpreadsheetData, AdminBoundaries, MatchedData, DataUtility, Report, \
     PromptMessages
 import wx
@@ -74,7 +72,7 @@ class Frame(wx.Frame):
                 wx.LogError("Cannot open file '%s'." % file)
 
     def on_open_shapefile(self, event):
-        with wx.FileDialog(self, "Open Admin Boundary file", wildcard = "Shapefiles (*.shp)|*.shp",
+        with wx.FileDialog(self, "Open Admin Boundary file", wildcard = "Shapefiles (*.shp)|*.shp|Compiled admin layers (*.geoidx)|*.geoidx",
                            style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST) as fileDialog:
 
             if fileDialog.ShowModal() == wx.ID_CANCEL:
@@ -183,18 +181,11 @@ class Frame(wx.Frame):
 
                         if report_response == wx.ID_YES:
                             try:
-                                temp_df = md.get_spreadsheet_report_dataframe()
-                                report_df = geopandas.GeoDataFrame(
-                                    data=temp_df, crs="EPSG:4326", geometry=temp_df['geometry'])
-                                report_df.set_index('Index')
-
-                                # Add the spatial info from data_dict
-                                admin_shapefile_df = geopandas.GeoDataFrame(
-                                    # Is no longer data=[val[0] for val in md.matched_data_dict.values()]
-                                    data=[val.shp_data for val in md.matched_data_dict.values()], crs="EPSG:4326",
-                                    columns=self.shapefile.dataframe.columns)
-                                admin_shapefile_df['Index'] = md.matched_data_dict.keys()
-                                admin_shapefile_df.set_index('Index')
+                                report_df = md.get_spreadsheet_report_dataframe()
+
+                                # Add the spatial info of the matched admin boundaries rows, in the same order
+                                admin_shapefile_df = md.get_matched_admin_dataframe()
+                                admin_shapefile_df['Index'] = md.matched_row_labels()
                                 report = Report(report_df, admin_shapefile_df)
                                 report.join_dataframes()
                                 excel_msg = report.save_report()
@@ -239,20 +230,9 @@ class Frame(wx.Frame):
 
             if DataUtility.is_valid_epsg(epsg_dlg.GetValue()):
                 try:
-                    matched_admin_list = [val.shp_data for val in md.matched_data_dict.values()]
-
-                    if 'geometry' in self.shapefile.dataframe.columns:
-                        matched_geom_col_loc = self.shapefile.dataframe.columns.get_loc('geometry')
-
                     # Create geodataframe and output to shapefile
-                    matched_records_gdf = geopandas.GeoDataFrame(data=matched_admin_list,
-                                                                 columns=self.shapefile.dataframe.columns,
-                                                                 crs="EPSG:4326",
-                                                                 geometry=numpy.asarray(list(
-                                                                     [row[matched_geom_col_loc] for row in
-                                                                      matched_admin_list])))
-                    shapefile_msg = DataUtility.create_admin_matches_shapefile(matched_records_gdf, epsg_dlg.GetValue(),
-                                                                               md.admin_choice)
+                    shapefile_msg = DataUtility.create_matches_map(md.adm_boundaries, md.matched_admin_positions(),
+                                                                   epsg_dlg.GetValue(), md.admin_choice)
                     shapefile_dlg = wx.MessageDialog(None,
                                                      shapefile_msg,
                                                      'Matched data Shapefile created', wx.OK)
@@ -0,0 +1,283 @@
+"""
+Local HTTP service for the geocoder.
+
+Loads one or more admin boundaries shapefiles once at startup and keeps their name, fuzzy and spatial indexes warm in
+memory, so other tools can match batches of records in milliseconds instead of paying the Python start up, shapefile
+load and index build on every call. Built on the asyncio standard library, no web framework is needed.
+
+Start the service:
+python match_admin_boundaries_service.py --layer adm3=c:\\gisdata\\hnd_admbnda_adm3_sinit_20161005.shp --admin_field ADM3_ES
+
+Endpoints, all responses are JSON:
+GET  /health           service status
+GET  /layers           loaded layers and their columns
+POST /match/strict     strict name match
+POST /match/fuzzy      strict name match, then fuzzy match of the rest
+POST /match/spatial    point in polygon match of records with x/y or lat/long, then strict name match of the rest
+
+Request body of the match endpoints:
+{"layer": "adm3", "admin_field": "ADM3_ES", "cutoff": 85, "priority": "right",
+ "records": [{"name": "Clinic 1", "town": "San Jose", "x": -87.2, "y": 14.1}, ...]}
+layer can be left out when a single layer is loaded, cutoff is only used by fuzzy match and priority is left or right.
+Fuzzy match requests can also set top_k, the number of admin name candidates scored per value (0 scores every admin
+name, the service --fuzzy_top_k by default), and check_recall: true to count in the response stats how many values
+found the exhaustive best score (fuzzy_recall_hits of fuzzy_distinct_values).
+"""
+import asyncio
+import json
+import time
+import pandas
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from match_admin_boundaries_core import AdminBoundaries, SpreadsheetData, MatchedData, DataUtility, \
+    DEFAULT_FUZZY_TOP_K
+
+MATCH_TYPES = ('strict', 'fuzzy', 'spatial')
+
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+class ServiceError(Exception):
+    """Error returned to the client as a JSON error message with an HTTP status code."""
+
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+class MatchService:
+    """
+    Admin boundaries layers loaded once and matched against the records of each request.
+    """
+
+    def __init__(self, layers, admin_fields=None, fuzzy_scorer=None, fuzzy_top_k=DEFAULT_FUZZY_TOP_K):
+        """Constructor.
+        :param layers: dictionary of layer names and admin boundaries shapefile paths.
+        :param admin_fields: list of admin boundaries columns whose indexes are built at startup.
+        :param fuzzy_scorer: string 'rapidfuzz' or 'thefuzz', None picks the fastest installed.
+        :param fuzzy_top_k: Integer, number of n-gram blocking candidates per fuzzy query of the requests without a
+        top_k, None or 0 scores every admin name.
+        """
+        self._layers = {}
+        self._fuzzy_scorer = fuzzy_scorer
+        self._fuzzy_top_k = fuzzy_top_k
+        # Matching is CPU bound, it runs on one thread next to the event loop so requests keep being accepted
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        for name, file_path in layers.items():
+            start = time.perf_counter()
+            adm_boundaries = AdminBoundaries(file_path)
+            self.warm_indexes(adm_boundaries, admin_fields or [])
+            self._layers[name] = adm_boundaries
+            print('Layer {0} loaded from {1} in {2:.2f}s'.format(name, file_path, time.perf_counter() - start))
+
+    @staticmethod
+    def warm_indexes(adm_boundaries, admin_fields):
+        """Build the spatial index and the name and fuzzy indexes of the admin fields the layer has."""
+        adm_boundaries.dataframe.sindex
+        for admin_field in admin_fields:
+            if admin_field in adm_boundaries.columns:
+                for remove_accents in (True, False):
+                    adm_boundaries.ngram_index(admin_field, remove_accents)
+
+    @property
+    def executor(self):
+        return self._executor
+
+    def layers_info(self):
+        """Return the JSON ready description of the loaded layers."""
+        return {'layers': [{'name': name, 'file': adm_boundaries.file_path, 'records': len(adm_boundaries),
+                            'columns': [col for col in adm_boundaries.columns if col != 'geometry']}
+                           for name, adm_boundaries in self._layers.items()]}
+
+    def layer(self, name):
+        """Return the AdminBoundaries of the layer name, None picks the only loaded layer."""
+        if name is None and len(self._layers) == 1:
+            return next(iter(self._layers.values()))
+        if name not in self._layers:
+            raise ServiceError('Unknown layer {0}, loaded layers: {1}'.format(name, ', '.join(self._layers)),
+                               HTTPStatus.NOT_FOUND)
+        return self._layers[name]
+
+    def match(self, match_type, payload):
+        """
+        Match the records of a request.
+        :param match_type: string, one of MATCH_TYPES.
+        :param payload: dictionary of the decoded JSON request body.
+        :return: JSON ready dictionary of one result per record, in request order, and the match statistics.
+        """
+        start = time.perf_counter()
+        adm_boundaries = self.layer(payload.get('layer'))
+        records = payload.get('records')
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise ServiceError('records must be a list of JSON objects, one per spreadsheet row.')
+        admin_field = payload.get('admin_field')
+        if admin_field is None and match_type != 'spatial':
+            raise ServiceError('admin_field is required for {0} match.'.format(match_type))
+        if admin_field is not None and admin_field not in adm_boundaries.dataframe.columns:
+            raise ServiceError('The layer has no column {0}.'.format(admin_field))
+        cutoff = str(payload.get('cutoff', '')).strip()
+        if match_type == 'fuzzy' and not DataUtility.is_valid_cutoff(cutoff):
+            raise ServiceError('Fuzzy match needs a cutoff score between 1 and 100.')
+        top_k = payload.get('top_k', self._fuzzy_top_k)
+        if top_k is not None and (isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 0):
+            raise ServiceError('top_k must be a number of candidates, or 0 to score every admin name.')
+        match_kwargs = {'from_right_col': 1} if payload.get('priority') == 'right' else {}
+
+        # Records are utf-8 JSON text, accents are removed the way they are for utf-8 spreadsheets
+        spreadsheet = SpreadsheetData.from_dataframe(pandas.DataFrame.from_records(records), 'request', 'utf-8')
+        md = MatchedData(spreadsheet, adm_boundaries, fuzzy_scorer=self._fuzzy_scorer)
+        md.admin_choice = admin_field
+        if len(records) > 0:
+            if match_type == 'spatial':
+                md.run_spatial_match()
+            if admin_field is not None:
+                md.run_strict_match(**match_kwargs)
+            if match_type == 'fuzzy':
+                md.run_fuzzy_match(cutoff, top_k, payload.get('check_recall') is True, **match_kwargs)
+
+        # Results are read straight from the match arrays, the records are the spreadsheet rows in request order
+        match_results = md.match_results
+        admin_attributes = adm_boundaries.dataframe.drop(columns='geometry')
+        matched_attributes = admin_attributes.iloc[match_results.admin_positions].to_dict(orient='records')
+        methods = match_results.match_methods()
+        results = [{'index': row_label, 'matched': False} for row_label in range(len(records))]
+        for i, (row_position, admin_position, score) in enumerate(zip(match_results.row_positions.tolist(),
+                                                                      match_results.admin_positions.tolist(),
+                                                                      match_results.scores.tolist())):
+            results[row_position] = {'index': row_position, 'matched': True, 'method': methods[i],
+                                     'score': int(round(score)), 'admin_position': admin_position,
+                                     'admin': matched_attributes[i]}
+        return {'results': results, 'matched': len(match_results), 'records': len(records), 'stats': md.match_stats,
+                'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)}
+
+    async def handle_request(self, method, target, body):
+        """Route a request, returns a tuple of the HTTP status and the JSON ready response."""
+        route = target.split('?', 1)[0].rstrip('/') or '/'
+        if route == '/health':
+            return HTTPStatus.OK, {'status': 'ok', 'layers': list(self._layers)}
+        if route == '/layers':
+            return HTTPStatus.OK, self.layers_info()
+        if route.startswith('/match/') and route[len('/match/'):] in MATCH_TYPES:
+            if method != 'POST':
+                raise ServiceError('Use POST with a JSON body.', HTTPStatus.METHOD_NOT_ALLOWED)
+            try:
+                payload = json.loads(body.decode('utf-8') or '{}')
+            except (UnicodeDecodeError, ValueError) as e:
+                raise ServiceError('Invalid JSON body: {0}'.format(e))
+            if not isinstance(payload, dict):
+                raise ServiceError('The JSON body must be an object.')
+            loop = asyncio.get_running_loop()
+            return HTTPStatus.OK, await loop.run_in_executor(self._executor, self.match, route[len('/match/'):],
+                                                             payload)
+        raise ServiceError('Unknown endpoint {0}'.format(route), HTTPStatus.NOT_FOUND)
+
+    async def handle_connection(self, reader, writer):
+        """Serve the HTTP/1.1 requests of one client connection, kept open between requests unless closed."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    break
+                headers = dict((key.strip().lower(), val.strip()) for key, sep, val in
+                               (line.partition(':') for line in lines[1:] if line))
+                keep_alive = version.upper() == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                try:
+                    length = headers.get('content-length', '0')
+                    if not (length.isascii() and length.isdigit()):
+                        # The body cannot be told apart from the next request, the connection is closed after the error
+                        keep_alive = False
+                        raise ServiceError('Invalid Content-Length header {0!r}.'.format(length))
+                    length = int(length)
+                    if length > MAX_BODY_SIZE:
+                        keep_alive = False
+                        raise ServiceError('Request body over {0} bytes.'.format(MAX_BODY_SIZE),
+                                           HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+                    body = await reader.readexactly(length) if length > 0 else b''
+                    status, response = await self.handle_request(method.upper(), target, body)
+                except ServiceError as e:
+                    status, response = e.status, {'error': str(e)}
+                except Exception as e:
+                    status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'Exception {0}'.format(e)}
+
+                data = json.dumps(response, default=self.json_default).encode('utf-8')
+                writer.write('HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\nContent-Length: {2}\r\n'
+                             'Connection: {3}\r\n\r\n'.format(status.value, status.phrase, len(data),
+                                                              'keep-alive' if keep_alive else 'close')
+                             .encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    @staticmethod
+    def json_default(value):
+        """JSON encoding of numpy and pandas values, e.g. numpy.int64 attributes or NaN scores."""
+        if hasattr(value, 'item'):
+            return value.item()
+        if pandas.isna(value):
+            return None
+        return str(value)
+
+    async def serve(self, host, port):
+        """Serve requests until the process is stopped."""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print('Geocoder service listening on http://{0}:{1}'.format(host, port))
+        async with server:
+            await server.serve_forever()
+
+
+def parse_layer_args(layer_args):
+    """Return the dictionary of layer names and file paths of the --layer arguments, NAME=PATH or only PATH."""
+    layers = {}
+    for layer_arg in layer_args:
+        name, sep, file_path = layer_arg.partition('=')
+        if not sep:
+            name, file_path = layer_arg.rsplit('/', 1)[-1].rsplit('\\', 1)[-1].rsplit('.', 1)[0], layer_arg
+        layers[name.strip()] = file_path.strip()
+    return layers
+
+
+def main():
+    parser = ArgumentParser(description=__doc__, formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('-l',
+                        '--layer',
+                        action='append',
+                        required=True,
+                        help='Admin boundaries shapefile or compiled .geoidx layer to load, as NAME=PATH or PATH. '
+                             'Repeat for several layers.')
+    parser.add_argument('-f',
+                        '--admin_field',
+                        action='append',
+                        help='Admin boundaries column whose match indexes are built at startup. Repeat for several '
+                             'columns, other columns are indexed on first use.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on, default 127.0.0.1.')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on, default 8765.')
+    parser.add_argument('--fuzzy_scorer', type=str, choices=['rapidfuzz', 'thefuzz'],
+                        help='Fuzzy scorer backend, default rapidfuzz when it is installed.')
+    parser.add_argument('--fuzzy_top_k', type=int, default=DEFAULT_FUZZY_TOP_K,
+                        help='Number of admin name candidates fuzzy scored per value when a request sets no top_k, '
+                             'default {0}. 0 scores every admin name.'.format(DEFAULT_FUZZY_TOP_K))
+    args = parser.parse_args()
+    if args.fuzzy_top_k < 0:
+        print('{0} is an invalid --fuzzy_top_k. Enter a number of candidates, or 0 to score every admin name.'.format(
+            args.fuzzy_top_k))
+        exit(1)
+
+    service = MatchService(parse_layer_args(args.layer), args.admin_field, args.fuzzy_scorer, args.fuzzy_top_k)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print('Geocoder service stopped.')
+
+
+if __name__ == "__main__":
+    main()